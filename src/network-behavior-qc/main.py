@@ -1,212 +1,354 @@
 import pandas as pd
-import glob
-from pathlib import Path
-import re
+import argparse
+import dataclasses
 import os
-import sys
+from pathlib import Path
 
 from utils.qc_utils import (
-    initialize_qc_csvs,
-    extract_task_name_out_of_scanner,
-    update_qc_csv,
-    get_task_metrics,
-    append_summary_rows_to_csv,
-    correct_columns,
-    normalize_flanker_conditions,
-    infer_task_name_from_filename,
+    QCTableBuilder,
+    append_summary_rows,
+    build_qc_schemas,
+    compute_summary_stats,
+    correct_column_names,
+)
+from utils.manifest_utils import (
+    build_input_manifest,
+    discover_tasks,
+    select_processing_rows,
+)
+from utils.pipeline_utils import QCUnit, run_qc_units
+from utils.cohort_utils import apply_cohort_metrics
+from utils.incremental_utils import run_incremental_qc_units, state_header
+from utils.shard_utils import parse_shard_spec, subject_shard, write_shard, load_shards
+from utils.cache_utils import MetricsCache, DEFAULT_CACHE_MAX_BYTES
+from utils.kernel_utils import SSRT_METHODS
+from utils.output_utils import OUTPUT_FORMATS, check_output_formats, write_table
+from utils.watch_utils import poll_input_changes
+from utils.violations_utils import (
+    aggregate_violations,
+    plot_violations,
+    create_violations_matrices,
 )
-from utils.trimmed_behavior_utils import preprocess_rt_tail_cutoff
-from utils.violations_utils import compute_violations, aggregate_violations, plot_violations, create_violations_matrices
 from utils.globals import SINGLE_TASKS, DUAL_TASKS, LAST_N_TEST_TRIALS
 from utils.exclusion_utils import check_exclusion_criteria, remove_some_flags_for_exclusion, create_combined_exclusions_csv
 from utils.config import load_config
 
-# Optional CLI override: --mode=fmri or --mode=out_of_scanner
-for arg in sys.argv[1:]:
-    if arg.startswith('--mode='):
-        os.environ['QC_DATA_MODE'] = arg.split('=', 1)[1]
-
-cfg = load_config()
-input_root = cfg.input_folder
-output_path = cfg.qc_output_folder
-flags_output_path = cfg.flags_output_folder
-exclusions_output_path = cfg.exclusions_output_folder
-violations_output_path = cfg.violations_output_folder
-trimmed_csv_output_path = cfg.trimmed_csv_output_path
-trimmed_records = []
-last_n_test_trials = LAST_N_TEST_TRIALS
-
-if cfg.is_fmri:
-    # Discover tasks from filenames first (exclude practice)
-    discovered_tasks = set()
-    for subj_dir in glob.glob(str(input_root / 's*')):
-        for ses_dir in glob.glob(str(Path(subj_dir) / 'ses-*')):
-            for file in glob.glob(str(Path(ses_dir) / '*.csv')):
-                if '/practice/' in file.lower():
-                    continue
-                tname = infer_task_name_from_filename(Path(file).name)
-                if tname:
-                    discovered_tasks.add(tname)
-    tasks = sorted(discovered_tasks)
-else:
-    tasks = (SINGLE_TASKS + DUAL_TASKS)
-
-# Initialize QC CSVs for all tasks (include session column for fmri mode)
-initialize_qc_csvs(tasks, output_path, include_session=cfg.is_fmri)
-
-violations_df = pd.DataFrame()
-trimmed_data = []
-if cfg.is_fmri:
-    # In-scanner (CSV per session) iterate and process, ignoring practice
-    for subj_dir in glob.glob(str(input_root / 's*')):
-        subject_id = Path(subj_dir).name
-        if not re.match(r"s\d{2,}", subject_id):
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run behavioral QC for network data.')
+    parser.add_argument('--mode', choices=['fmri', 'out_of_scanner'], default=None,
+                        help='Override QC_DATA_MODE (fmri or out_of_scanner)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes for per-file QC '
+                             '(default: 1, serial)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only recompute metrics for new or changed input files, '
+                             'reusing stored results')
+    parser.add_argument('--state-file', default=None,
+                        help='Path to the incremental state file '
+                             '(default: <qc output folder>/.qc_state.json)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory for a content-addressed cache of per-file '
+                             'results (disabled if not set)')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        default=DEFAULT_CACHE_MAX_BYTES,
+                        help='Byte budget for --cache-dir; least recently used '
+                             'entries are evicted '
+                             f'(default: {DEFAULT_CACHE_MAX_BYTES})')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and QC new or changed files as they land '
+                             '(implies --incremental)')
+    parser.add_argument('--poll-interval', type=float, default=10.0,
+                        help='Seconds between input scans in --watch mode '
+                             '(default: 10)')
+    parser.add_argument('--output-format', nargs='+', choices=OUTPUT_FORMATS,
+                        default=['csv'],
+                        help='Formats for QC, flag, exclusion and violation tables; '
+                             'e.g. "csv parquet" writes both (default: csv). '
+                             'Parquet/Feather need the columnar extra (pyarrow)')
+    shard_group = parser.add_mutually_exclusive_group()
+    shard_group.add_argument('--shard', type=_shard_spec, default=None,
+                             metavar='i/N',
+                             help='Only process subjects in hash partition i of N '
+                                  '(0-based) and write results to --shard-dir')
+    shard_group.add_argument('--merge', action='store_true',
+                             help='Combine all shard results in --shard-dir and '
+                                  'write the QC, flag and exclusion outputs')
+    parser.add_argument('--shard-dir', default=None,
+                        help='Directory for shard results '
+                             '(default: <qc output folder>/shards)')
+    parser.add_argument('--engine', choices=['file', 'cohort'], default='file',
+                        help='Metric engine: "file" computes each file on its own; '
+                             '"cohort" computes supported tasks for all subjects at '
+                             'once from per-file summaries (default: file)')
+    parser.add_argument('--ssrt-methods', nargs='+', choices=SSRT_METHODS,
+                        default=['integration'],
+                        help='SSRT estimators to report for stop signal tasks; the '
+                             'integration SSRT is always included and extra '
+                             'estimators get their own columns (default: integration)')
+    parser.add_argument('--compact-trials', action='store_true',
+                        help='Store condition columns as categoricals and '
+                             'flags/timings in narrow dtypes after reading each '
+                             'file, and report the memory saved (outputs are '
+                             'unchanged)')
+    args = parser.parse_args(argv)
+    stateful = (args.incremental or args.watch or args.shard or args.merge
+                or args.cache_dir)
+    if args.engine == 'cohort' and stateful:
+        parser.error('--engine cohort cannot be combined with --incremental, '
+                     '--watch, --shard, --merge or --cache-dir')
+    return args
+
+
+def _shard_spec(value):
+    try:
+        return parse_shard_spec(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_qc_pass(cfg, args, manifest, cache=None, tasks_to_write=None):
+    """
+    Run per-file QC for a manifest and write the QC, flag, exclusion, violation and trimmed outputs.
+
+    With --shard, only this shard's subjects are processed and their results are
+    written to the shard directory instead; outputs are produced by --merge.
+
+    Args:
+        cfg (PathConfig): Loaded configuration
+        args (argparse.Namespace): Parsed command line arguments
+        manifest (pd.DataFrame): Manifest from build_input_manifest
+        cache (MetricsCache | None): Optional per-file results cache
+        tasks_to_write (set | None): If given, only rewrite per-task outputs for these tasks
+    """
+    output_path = cfg.qc_output_folder
+    last_n_test_trials = LAST_N_TEST_TRIALS
+
+    if cfg.is_fmri:
+        # Discover tasks from filenames first (exclude practice)
+        tasks = discover_tasks(manifest)
+    else:
+        tasks = (SINGLE_TASKS + DUAL_TASKS)
+
+    units = []
+    last_subject = None
+    for row in select_processing_rows(manifest).itertuples(index=False):
+        if args.shard is not None and subject_shard(row.subject, args.shard[1]) != args.shard[0]:
             continue
-        print(f"Processing Subject: {subject_id}")
-        for ses_dir in glob.glob(str(Path(subj_dir) / 'ses-*')):
-            for file in glob.glob(str(Path(ses_dir) / '*.csv')):
-                if '/practice/' in file.lower():
-                    continue
-                filename = Path(file).name
-                task_name = infer_task_name_from_filename(filename)
-                if not task_name:
-                    continue
-                try:
-                    df = pd.read_csv(file)
-                    if 'flanker' in task_name and 'stop_signal' in task_name:
-                        df = normalize_flanker_conditions(df)
-                    # Generic RT tail cutoff
-                    df_trimmed, cut_pos, cut_before_halfway, proportion_blank = preprocess_rt_tail_cutoff(
-                        df,
-                        subject_id=subject_id,
-                        session=Path(ses_dir).name,
-                        task_name=task_name,
-                        last_n_test_trials=last_n_test_trials,
-                    )
-                    if cut_pos is not None:
-                        trimmed_records.append({
-                            'subject_id': subject_id,
-                            'session': Path(ses_dir).name,
-                            'task_name': task_name,
-                            'cutoff_index': int(cut_pos),
-                            'before_halfway': bool(cut_before_halfway),
-                            'proportion_blank_trials': float(proportion_blank),
-                        })
-                        if cut_before_halfway:
-                            continue
-                        else:
-                            df = df_trimmed
-                    metrics = get_task_metrics(df, task_name, cfg)
-                    if (not cfg.is_fmri) and 'stop_signal' in task_name:
-                        violations_df = pd.concat([violations_df, compute_violations(subject_id, df, task_name)])
-                    # Session for fmri from ses-* directory name
-                    session = Path(ses_dir).name if cfg.is_fmri else None
-                    update_qc_csv(output_path, task_name, subject_id, metrics, session=session)
-                except Exception as e:
-                    print(f"Error processing {task_name} for subject {subject_id}: {str(e)}")
-else:
-    # Out-of-scanner: iterate per subject and CSV files
-    for subject_folder in glob.glob(str(input_root / "s*")):
-        subject_id = Path(subject_folder).name
-        if re.match(r"s\d{2,}", subject_id):
-            print(f"Processing Subject: {subject_id}")
-            for file in glob.glob(str(Path(subject_folder) / "*.csv")):
-                filename = Path(file).name
-                task_name = extract_task_name_out_of_scanner(filename)
-                if task_name == 'stop_signal_with_go_no_go':
-                    task_name = 'stop_signal_with_go_nogo'
-                if task_name:
-                    try:
-                        df = pd.read_csv(file)
-                        # Normalize flanker conditions (remove h_ and f_ prefixes)
-                        if 'flanker' in task_name and 'stop_signal' in task_name:
-                            df = normalize_flanker_conditions(df)
-                        # Generic RT tail cutoff
-                        df_trimmed, cut_pos, cut_before_halfway, proportion_blank = preprocess_rt_tail_cutoff(
-                            df,
-                            subject_id=subject_id,
-                            session=None,
-                            task_name=task_name,
-                            last_n_test_trials=last_n_test_trials,
-                        )
-                        if cut_pos is not None:
-                            trimmed_records.append({
-                                'subject_id': subject_id,
-                                'session': '',
-                                'task_name': task_name,
-                                'cutoff_index': int(cut_pos),
-                                'before_halfway': bool(cut_before_halfway),
-                                'proportion_blank_trials': float(proportion_blank),
-                            })
-                            if cut_before_halfway:
-                                continue
-                            else:
-                                df = df_trimmed
-                        metrics = get_task_metrics(df, task_name, cfg)
-                        if (not cfg.is_fmri) and 'stop_signal' in task_name:
-                            violations_df = pd.concat([violations_df, compute_violations(subject_id, df, task_name)])
-                        update_qc_csv(output_path, task_name, subject_id, metrics, session=None)
-                    except Exception as e:
-                        print(f"Error processing {task_name} for subject {subject_id}: {str(e)}")
-
-for task in tasks:
-    exclusion_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
-    append_summary_rows_to_csv(output_path / f"{task}_qc.csv")
-    if task == 'flanker_with_cued_task_switching' or task == 'shape_matching_with_cued_task_switching':
-        correct_columns(output_path / f"{task}_qc.csv")
-    task_csv = pd.read_csv(output_path / f"{task}_qc.csv")
-    
-    # For fMRI: add condition accuracies and omission rates to flagged data before exclusion check
-    if cfg.is_fmri and 'session' in task_csv.columns:
-        from utils.exclusion_utils import flag_fmri_condition_metrics
-        condition_acc_flags_df, omission_rate_flags_df = flag_fmri_condition_metrics(task, task_csv)
+        if row.subject != last_subject:
+            print(f"Processing Subject: {row.subject}")
+            last_subject = row.subject
+        units.append(QCUnit(row.path, row.subject, row.session, row.task_name, size=row.size, mtime=row.mtime))
+
+    if args.shard is not None:
+        index, count = args.shard
+        results = run_qc_units(units, cfg, last_n_test_trials, workers=args.workers, cache=cache)
+        shard_dir = Path(args.shard_dir) if args.shard_dir else output_path / 'shards'
+        header = state_header('fmri' if cfg.is_fmri else 'out_of_scanner', last_n_test_trials, cfg.ssrt_methods)
+        path = write_shard(shard_dir, index, count, header, tasks, units, results)
+        print(f"Wrote {len(results)} results for shard {index}/{count} to {path}")
+    elif args.incremental or args.watch:
+        state_file = Path(args.state_file) if args.state_file else output_path / '.qc_state.json'
+        results = run_incremental_qc_units(units, cfg, last_n_test_trials, state_file, workers=args.workers, cache=cache)
     else:
-        condition_acc_flags_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
-        omission_rate_flags_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
-    
-    exclusion_df = check_exclusion_criteria(task, task_csv, exclusion_df)
-    
-    # Create a copy for flagged data (flags that will be removed)
-    flagged_df = exclusion_df.copy()
-    
-    # Remove some flags for exclusion data
-    exclusion_df = remove_some_flags_for_exclusion(task, exclusion_df)
-    
-    # Flagged data contains only the flags that were removed (original - filtered)
-    flagged_df = flagged_df[~flagged_df.index.isin(exclusion_df.index)]
-    
-    # For fMRI: merge condition accuracy and omission rate flags into flagged data
-    if cfg.is_fmri:
-        flags_to_merge = []
-        if len(condition_acc_flags_df) > 0:
-            flags_to_merge.append(condition_acc_flags_df)
-        if len(omission_rate_flags_df) > 0:
-            flags_to_merge.append(omission_rate_flags_df)
-        if flags_to_merge:
-            flagged_df = pd.concat([flagged_df] + flags_to_merge, ignore_index=True)
-            from utils.qc_utils import sort_subject_ids
-            flagged_df = sort_subject_ids(flagged_df)
-    
-    # Remove columns with 'new' in their name before saving
-    task_csv = task_csv.loc[:, ~task_csv.columns.str.contains('new', case=False)]
-    task_csv.to_csv(output_path / f"{task}_qc.csv", index=False)
-    
-    # Save both datasets
-    flagged_df.to_csv(flags_output_path / f"flagged_data_{task}.csv", index=False)
-    exclusion_df.to_csv(exclusions_output_path / f"excluded_data_{task}.csv", index=False)
-
-# Create combined exclusions CSV (after all tasks are processed)
-create_combined_exclusions_csv(tasks, exclusions_output_path)
-
-if not cfg.is_fmri:
-    violations_df.to_csv(violations_output_path / 'violations_data.csv', index=False)
-    aggregated_violations_df = aggregate_violations(violations_df)
-    aggregated_violations_df.to_csv(violations_output_path / 'aggregated_violations_data.csv', index=False)
-    plot_violations(aggregated_violations_df, violations_output_path)
-    create_violations_matrices(aggregated_violations_df, violations_output_path)
-
-# Save list of trimmed CSVs
-if len(trimmed_records) > 0:
-    trimmed_df = pd.DataFrame(trimmed_records)
-    out_csv = trimmed_csv_output_path / 'trimmed_fmri_behavior_tasks.csv' if cfg.is_fmri else trimmed_csv_output_path / 'trimmed_out_of_scanner_tasks.csv'
-    trimmed_df.to_csv(out_csv, index=False)
\ No newline at end of file
+        results = run_qc_units(units, cfg, last_n_test_trials, workers=args.workers, cache=cache, engine=args.engine)
+        if args.engine == 'cohort':
+            apply_cohort_metrics(results)
+    if args.shard is None:
+        write_outputs(cfg, tasks, results, tasks_to_write=tasks_to_write, formats=args.output_format)
+
+    if cfg.compact_trials:
+        print_memory_report(results)
+
+    if cache is not None:
+        hits = sum(1 for result in results if result.cache_hit is True)
+        misses = sum(1 for result in results if result.cache_hit is False)
+        evicted = cache.evict()
+        print(f"Metrics cache: {hits} hits, {misses} misses, {evicted} entries evicted")
+
+
+def print_memory_report(results):
+    """
+    Print trial table memory before and after compaction, summed over the files read in this run.
+
+    Args:
+        results (list): QCResult list; files served from the cache or state file have no memory_bytes
+    """
+    sizes = [result.memory_bytes for result in results if result.memory_bytes is not None]
+    if not sizes:
+        return
+    before = sum(b for b, _ in sizes)
+    after = sum(a for _, a in sizes)
+    print(f"Trial table memory: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB "
+          f"({1 - after / before:.0%} smaller) across {len(sizes)} files")
+
+
+def write_outputs(cfg, tasks, results, tasks_to_write=None, formats=('csv',)):
+    """
+    Merge per-file results and write the QC, flag, exclusion, violation and trimmed outputs.
+
+    Args:
+        cfg (PathConfig): Loaded configuration
+        tasks (list): Tasks to write outputs for
+        results (list): QCResult list, in the order rows should be merged
+        tasks_to_write (set | None): If given, only rewrite per-task outputs for these tasks
+        formats (list): Output formats for the QC, flag, exclusion and violation tables
+    """
+    output_path = cfg.qc_output_folder
+    flags_output_path = cfg.flags_output_folder
+    exclusions_output_path = cfg.exclusions_output_folder
+    violations_output_path = cfg.violations_output_folder
+    trimmed_csv_output_path = cfg.trimmed_csv_output_path
+    trimmed_records = []
+
+    # Fix every task's column layout from all result rows first, so rows are stored by position
+    schemas = build_qc_schemas(
+        tasks,
+        ((result.task_name, result.metrics, result.session) for result in results
+         if result.error is None and result.metrics is not None),
+        include_session=cfg.is_fmri,
+    )
+    # Collect QC rows for all tasks in memory (include session column for fmri mode)
+    qc_tables = QCTableBuilder(tasks, include_session=cfg.is_fmri, schemas=schemas)
+    violations_df = pd.DataFrame()
+
+    # Workers only compute; results are merged here in discovery order so outputs match a serial run.
+    # Everything below (QC tables, flags, exclusions) is always rebuilt from the full result set.
+    for result in results:
+        if result.trimmed_record is not None:
+            trimmed_records.append(result.trimmed_record)
+        if result.error is not None:
+            print(result.error)
+            continue
+        if result.metrics is None:
+            continue
+        try:
+            if not result.violations.empty:
+                violations_df = pd.concat([violations_df, result.violations])
+            qc_tables.add_row(result.task_name, result.subject_id, result.metrics, session=result.session)
+        except Exception as e:
+            print(f"Error processing {result.task_name} for subject {result.subject_id}: {str(e)}")
+
+    for task in tasks:
+        if tasks_to_write is not None and task not in tasks_to_write:
+            continue
+        exclusion_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
+        # Subject rows only; summary statistics are kept separately and appended when writing
+        task_csv = qc_tables.build(task)
+        if task == 'flanker_with_cued_task_switching' or task == 'shape_matching_with_cued_task_switching':
+            task_csv = correct_column_names(task_csv)
+
+        # For fMRI: add condition accuracies and omission rates to flagged data before exclusion check
+        if cfg.is_fmri and 'session' in task_csv.columns:
+            from utils.exclusion_utils import flag_fmri_condition_metrics
+            condition_acc_flags_df, omission_rate_flags_df = flag_fmri_condition_metrics(task, task_csv)
+        else:
+            condition_acc_flags_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
+            omission_rate_flags_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
+
+        exclusion_df = check_exclusion_criteria(task, task_csv, exclusion_df)
+
+        # Create a copy for flagged data (flags that will be removed)
+        flagged_df = exclusion_df.copy()
+
+        # Remove some flags for exclusion data
+        exclusion_df = remove_some_flags_for_exclusion(task, exclusion_df)
+
+        # Flagged data contains only the flags that were removed (original - filtered)
+        flagged_df = flagged_df[~flagged_df.index.isin(exclusion_df.index)]
+
+        # For fMRI: merge condition accuracy and omission rate flags into flagged data
+        if cfg.is_fmri:
+            flags_to_merge = []
+            if len(condition_acc_flags_df) > 0:
+                flags_to_merge.append(condition_acc_flags_df)
+            if len(omission_rate_flags_df) > 0:
+                flags_to_merge.append(omission_rate_flags_df)
+            if flags_to_merge:
+                flagged_df = pd.concat([flagged_df] + flags_to_merge, ignore_index=True)
+                from utils.qc_utils import sort_subject_ids
+                flagged_df = sort_subject_ids(flagged_df)
+
+        # Remove columns with 'new' in their name before saving
+        task_csv = task_csv.loc[:, ~task_csv.columns.str.contains('new', case=False)]
+        summary = compute_summary_stats(task_csv)
+        write_table(
+            append_summary_rows(task_csv, summary),
+            output_path / f"{task}_qc.csv",
+            formats,
+        )
+        if not task_csv.empty:
+            summary_table = (
+                summary.drop(columns='session', errors='ignore')
+                .rename_axis('statistic')
+            )
+            write_table(
+                summary_table,
+                output_path / f"{task}_qc_summary.csv",
+                formats,
+                index=True,
+            )
+
+        # Save both datasets
+        write_table(flagged_df, flags_output_path / f"flagged_data_{task}.csv", formats)
+        write_table(exclusion_df, exclusions_output_path / f"excluded_data_{task}.csv", formats)
+
+    # Create combined exclusions CSV (after all tasks are processed)
+    create_combined_exclusions_csv(tasks, exclusions_output_path, formats)
+
+    if not cfg.is_fmri:
+        write_table(violations_df, violations_output_path / 'violations_data.csv', formats)
+        aggregated_violations_df = aggregate_violations(violations_df)
+        write_table(aggregated_violations_df, violations_output_path / 'aggregated_violations_data.csv', formats)
+        plot_violations(aggregated_violations_df, violations_output_path)
+        create_violations_matrices(aggregated_violations_df, violations_output_path, formats)
+
+    # Save list of trimmed CSVs
+    if len(trimmed_records) > 0:
+        trimmed_df = pd.DataFrame(trimmed_records)
+        out_csv = trimmed_csv_output_path / 'trimmed_fmri_behavior_tasks.csv' if cfg.is_fmri else trimmed_csv_output_path / 'trimmed_out_of_scanner_tasks.csv'
+        trimmed_df.to_csv(out_csv, index=False)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Optional CLI override: --mode=fmri or --mode=out_of_scanner
+    if args.mode:
+        os.environ['QC_DATA_MODE'] = args.mode
+
+    check_output_formats(args.output_format)
+    cfg = dataclasses.replace(
+        load_config(),
+        ssrt_methods=tuple(dict.fromkeys(['integration'] + args.ssrt_methods)),
+        compact_trials=args.compact_trials,
+    )
+    cache = MetricsCache(args.cache_dir, max_bytes=args.cache_max_bytes) if args.cache_dir else None
+
+    if args.merge:
+        shard_dir = Path(args.shard_dir) if args.shard_dir else cfg.qc_output_folder / 'shards'
+        header = state_header('fmri' if cfg.is_fmri else 'out_of_scanner', LAST_N_TEST_TRIALS, cfg.ssrt_methods)
+        tasks, results = load_shards(shard_dir, header)
+        print(f"Merging {len(results)} results from {shard_dir}")
+        write_outputs(cfg, tasks, results, formats=args.output_format)
+        return
+
+    if args.watch:
+        print(f"Watching {cfg.input_folder} every {args.poll_interval:g}s (Ctrl-C to stop)")
+        try:
+            for manifest, affected_tasks in poll_input_changes(cfg.input_folder, cfg.is_fmri, args.poll_interval):
+                if affected_tasks is not None:
+                    print(f"Input changed; updating outputs for: {', '.join(sorted(affected_tasks))}")
+                run_qc_pass(cfg, args, manifest, cache=cache, tasks_to_write=affected_tasks)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return
+
+    # Walk the input tree once; discovery and processing both read from the manifest
+    manifest = build_input_manifest(cfg.input_folder, cfg.is_fmri)
+    print(f"Found {len(manifest)} CSV files ({int(manifest['is_practice'].sum())} practice) "
+          f"across {manifest['subject'].nunique()} subject folders")
+    run_qc_pass(cfg, args, manifest, cache=cache)
+
+
+if __name__ == '__main__':
+    main()
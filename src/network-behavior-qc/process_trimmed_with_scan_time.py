@@ -20,7 +20,7 @@ import os
 # Add parent directory to path to import utils
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils.trimmed_behavior_utils import preprocess_rt_tail_cutoff, get_bids_task_name
+from utils.task_spec_utils import resolve_task
 from utils.config import load_config
 
 # Load config to get paths
@@ -115,7 +115,7 @@ def process_trimmed_csvs():
         session = row['session']
         task_name = row['task_name']
 
-        task_name = get_bids_task_name(task_name)
+        task_name = resolve_task(task_name).bids_name
         
         # Determine which BIDS path to use
         if subject_id in DISCOVERY_SUBJECTS:
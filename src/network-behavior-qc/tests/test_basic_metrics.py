@@ -6,7 +6,8 @@ import os
 
 from utils.qc_utils import (
     calculate_acc, calculate_rt, calculate_omission_rate,
-    calculate_commission_rate, calculate_basic_metrics
+    calculate_commission_rate, calculate_basic_metrics,
+    calculate_go_nogo_metrics, calculate_grouped_dual_metrics
 )
 
 class TestBasicMetrics:
@@ -186,5 +187,37 @@ class TestBasicMetrics:
         assert omission == 1/3  # 1 omission out of 3
         assert commission == 1/3  # 1 commission out of 3
 
+    def test_calculate_grouped_dual_metrics_matches_row_masks(self):
+        """Test that the grouped dual engine matches per-cell row masks, including substring overlaps."""
+        df_test = pd.DataFrame({
+            'flanker_condition': ['H_congruent', 'F_incongruent', 'congruent', 'incongruent', np.nan, 'H_incongruent'],
+            'go_nogo_condition': ['go', 'Go', 'nogo', 'go', 'go', 'NOGO'],
+            'correct_trial': [1, 0, 1, np.nan, 1, 0],
+            'rt': [0.5, 0.6, np.nan, 0.8, 0.9, 1.0],
+            'key_press': [1, 2, -1, -1, 1, 2],
+        }, index=[4, 8, 15, 16, 23, 42])
+        conditions = {'flanker': ['congruent', 'incongruent'], 'go_nogo': ['go', 'nogo']}
+        columns = {'flanker': 'flanker_condition', 'go_nogo': 'go_nogo_condition'}
+        
+        grouped = calculate_grouped_dual_metrics(df_test, conditions, columns)
+        
+        expected = {}
+        for cond1 in conditions['flanker']:
+            for cond2 in conditions['go_nogo']:
+                mask = (df_test['flanker_condition'].str.contains(cond1, case=False, na=False) &
+                        (df_test['go_nogo_condition'].astype(str).str.lower() == cond2))
+                calculate_go_nogo_metrics(df_test, mask, f'{cond1}_{cond2}', expected)
+        assert list(grouped) == list(expected)
+        assert grouped == pytest.approx(expected, nan_ok=True)
+        # 'congruent' also matches the incongruent go rows (one correct, one incorrect, one without correct_trial)
+        assert grouped['congruent_go_acc'] == 0.5
+        
+    def test_calculate_grouped_dual_metrics_needs_trial_columns(self):
+        """Test that the grouped engine defers to the row-mask loop without correct_trial."""
+        df_test = self.df.drop(columns='correct_trial').assign(flanker_condition='congruent')
+        conditions = {'condition': ['A'], 'flanker': ['congruent']}
+        columns = {'condition': 'condition', 'flanker': 'flanker_condition'}
+        assert calculate_grouped_dual_metrics(df_test, conditions, columns) is None
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
@@ -0,0 +1,56 @@
+import os
+import shutil
+
+import pytest
+from tests.trial_data import write_trials_csv
+from utils.cache_utils import MetricsCache, cache_key
+from utils.config import load_config
+from utils.pipeline_utils import QCUnit, process_qc_unit
+
+
+def test_get_put_roundtrip(tmp_path):
+    cache = MetricsCache(tmp_path / 'cache')
+    key = cache_key('abc', 'flanker_single_task_network', 'out_of_scanner', 10, 'v1')
+    assert cache.get(key) is None
+    cache.put(key, {'metrics': {'acc': 0.5}})
+    assert cache.get(key) == {'metrics': {'acc': 0.5}}
+    assert not list((tmp_path / 'cache').glob('*/*.tmp'))
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = MetricsCache(tmp_path / 'cache', max_bytes=0)
+    keys = [cache_key(i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, {'value': 'x' * 100})
+        os.utime(cache._entry_path(key), (i, i))
+    cache.get(keys[0])
+    cache.max_bytes = cache._entry_path(keys[0]).stat().st_size
+    assert cache.evict() == 2
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None and cache.get(keys[2]) is None
+
+
+def test_process_qc_unit_hits_for_copied_file(tmp_path):
+    cache = MetricsCache(tmp_path / 'cache')
+    path = write_trials_csv(
+        tmp_path / 's01_flanker_single_task_network.csv', 'flanker_single_task_network'
+    )
+    copy = tmp_path / 's02_flanker_single_task_network.csv'
+    shutil.copy(path, copy)
+    first = process_qc_unit(QCUnit(str(path), 's01', None, 'flanker_single_task_network'), load_config(), 10, cache=cache)
+    second = process_qc_unit(QCUnit(str(copy), 's02', None, 'flanker_single_task_network'), load_config(), 10, cache=cache)
+    assert first.cache_hit is False and second.cache_hit is True
+    assert second.subject_id == 's02'
+    assert first.metrics == pytest.approx(second.metrics, nan_ok=True)
+
+
+def test_cached_trimmed_record_uses_current_subject(tmp_path):
+    cache = MetricsCache(tmp_path / 'cache')
+    path = write_trials_csv(
+        tmp_path / 'a.csv', 'flanker_single_task_network', n=30, blank_tail=20
+    )
+    process_qc_unit(QCUnit(str(path), 's01', None, 'flanker_single_task_network'), load_config(), 10, cache=cache)
+    result = process_qc_unit(QCUnit(str(path), 's07', None, 'flanker_single_task_network'), load_config(), 10, cache=cache)
+    assert result.cache_hit is True
+    assert result.trimmed_record['subject_id'] == 's07'
+    assert result.trimmed_record['before_halfway'] is True
@@ -0,0 +1,62 @@
+import pytest
+from tests.trial_data import make_trials, make_units
+from utils.cohort_utils import (
+    apply_cohort_metrics,
+    compute_cohort_metrics,
+    get_cohort_spec,
+    summarize_trials,
+)
+from utils.config import load_config
+from utils.pipeline_utils import run_qc_units
+from utils.qc_utils import get_task_metrics
+from utils.trial_table_utils import filter_to_test_trials
+
+# Condition spellings the cohort engine has to normalize like the per-file engine
+CONDITIONS = {
+    'flanker_condition': ['congruent', 'incongruent', 'H_congruent'],
+    'go_nogo_condition': ['go', 'nogo', 'Go'],
+}
+TRIALS = {'n': 48, 'omission_rate': 1 / 3, 'conditions': CONDITIONS}
+
+
+def per_file_and_cohort(task_name, n_files=4):
+    frames = [make_trials(task_name, seed=seed, **TRIALS) for seed in range(n_files)]
+    spec = get_cohort_spec(task_name)
+    summaries = [summarize_trials(filter_to_test_trials(df, task_name), spec) for df in frames]
+    expected = [get_task_metrics(df, task_name, load_config()) for df in frames]
+    return expected, compute_cohort_metrics(spec, summaries)
+
+
+def test_get_cohort_spec_scope():
+    assert get_cohort_spec('flanker_single_task_network')['columns'][0][2] == 'equals'
+    dual = get_cohort_spec('go_nogo_with_flanker')
+    assert [(column, match) for column, _, match in dual['columns']] == [
+        ('flanker_condition', 'contains'), ('go_nogo_condition', 'equals_lower')]
+    assert dual['go_nogo'] and not dual['overall_acc']
+    assert get_cohort_spec('stop_signal_single_task_network') is None
+    assert get_cohort_spec('n_back_single_task_network') is None
+
+
+@pytest.mark.parametrize('task_name', ['flanker_single_task_network', 'go_nogo_with_flanker'])
+def test_cohort_metrics_match_per_file_engine(task_name):
+    expected, actual = per_file_and_cohort(task_name)
+    for exp, act in zip(expected, actual):
+        assert list(act) == list(exp)
+        assert act == pytest.approx(exp, nan_ok=True)
+
+
+def test_summarize_trials_requires_correct_trial():
+    df = make_trials('flanker_single_task_network', **TRIALS)
+    df = df.drop(columns='correct_trial')
+    assert summarize_trials(df, get_cohort_spec('flanker_single_task_network')) is None
+
+
+def test_run_qc_units_cohort_engine(tmp_path):
+    units = make_units(tmp_path, 3, **TRIALS)
+    per_file = run_qc_units(units, load_config(), 10)
+    cohort = run_qc_units(units, load_config(), 10, engine='cohort')
+    assert all(r.metrics is None and r.trial_summary is not None for r in cohort)
+    apply_cohort_metrics(cohort)
+    for a, b in zip(per_file, cohort):
+        assert b.trial_summary is None
+        assert b.metrics == pytest.approx(a.metrics, nan_ok=True)
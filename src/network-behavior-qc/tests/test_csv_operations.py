@@ -1,7 +1,22 @@
-import pandas as pd
-from utils.qc_utils import initialize_qc_csvs, update_qc_csv
-from pathlib import Path
 import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from utils.qc_utils import (
+    QCTableBuilder,
+    append_summary_rows,
+    build_qc_schemas,
+    compute_summary_stats,
+    correct_column_names,
+    get_subject_order_keys,
+    get_task_columns,
+    initialize_qc_csvs,
+    insert_sorted_row,
+    sort_subject_ids,
+    update_qc_csv,
+)
+
 
 def test_initialize_and_update_qc_csvs(tmp_path: Path):
     tasks = ['stop_signal_with_flanker']
@@ -20,3 +35,140 @@ def test_initialize_and_update_qc_csvs(tmp_path: Path):
     assert 'congruent_go_rt' in df2.columns
 
 
+def test_qc_table_builder_matches_update_qc_csv(tmp_path: Path):
+    task = 'flanker_single_task_network'
+    rows = [
+        ('s10', 'ses-2', {'congruent_acc': 0.9, 'overall_acc': 0.8}),
+        ('s02', 'ses-10', {'congruent_acc': 0.7, 'overall_acc': 0.6}),
+        ('s02', 'ses-2', {'congruent_acc': 0.5, 'overall_acc': 0.4}),
+    ]
+    initialize_qc_csvs([task], tmp_path, include_session=True)
+    builder = QCTableBuilder([task], include_session=True)
+    for subject_id, session, metrics in rows:
+        update_qc_csv(tmp_path, task, subject_id, metrics, session=session)
+        builder.add_row(task, subject_id, metrics, session=session)
+
+    expected = pd.read_csv(tmp_path / f"{task}_qc.csv")
+    built = builder.build(task)
+    assert list(built.columns) == list(expected.columns)
+    assert list(built['subject_id']) == ['s02', 's02', 's10']
+    assert list(built['session']) == ['ses-2', 'ses-10', 'ses-2']
+    pd.testing.assert_frame_equal(built, expected, check_dtype=False)
+
+
+def test_subject_order_keys():
+    df = pd.DataFrame({
+        'subject_id': ['s10', 's2', None, 'x01', 's10'],
+        'session': ['ses-2', '11', 'ses-1', None, 'ses-x'],
+    })
+    subject_key, session_key = get_subject_order_keys(df)
+    assert subject_key.tolist() == [10, 2, np.inf, np.inf, 10]
+    assert session_key.tolist() == [2, 11, 1, np.inf, np.inf]
+    assert list(sort_subject_ids(df).index) == [1, 0, 4, 2, 3]
+    # Tied subjects keep their input order
+    ties = pd.DataFrame({'subject_id': ['s2', 's1'] * 20})
+    expected = list(range(1, 40, 2)) + list(range(0, 40, 2))
+    assert list(sort_subject_ids(ties).index) == expected
+
+
+def test_insert_sorted_row():
+    df = pd.DataFrame({
+        'subject_id': ['s01', 's03', 's03'],
+        'session': ['ses-1', 'ses-1', 'ses-3'],
+        'acc': [0.1, 0.2, 0.3],
+    })
+    new_row = pd.DataFrame({'subject_id': ['s03'], 'session': ['ses-2'], 'acc': [0.4]})
+    out = insert_sorted_row(df, new_row)
+    assert out['acc'].tolist() == [0.1, 0.2, 0.4, 0.3]
+    assert list(out.index) == [0, 1, 2, 3]
+    # Unsorted tables are re-sorted as a whole
+    out = insert_sorted_row(df.iloc[::-1], new_row)
+    assert out['acc'].tolist() == [0.1, 0.2, 0.4, 0.3]
+
+
+def test_build_qc_schemas_unions_dynamic_columns(tmp_path: Path):
+    task = 'stop_signal_with_flanker'
+    rows = [
+        (task, {'congruent_go_rt': 0.5, 'avg_ssd': 200.0}, None),
+        (task, {'congruent_go_rt': 0.4, 'avg_ssd': 250.0}, None),
+        (task, {'incongruent_go_rt': 0.6, 'avg_ssd': 300.0}, 'ses-1'),
+        ('unknown_task', {'x': 1.0}, None),
+    ]
+    schemas = build_qc_schemas([task], rows)
+    assert schemas[task] == (
+        'subject_id', 'session', 'congruent_go_rt', 'avg_ssd', 'incongruent_go_rt'
+    )
+    # Independent of which subject comes first; fuller layouts lead
+    assert build_qc_schemas([task], rows[::-1]) == schemas
+    fuller = {'incongruent_go_rt': 0.6, 'congruent_go_rt': 0.5, 'avg_ssd': 1.0}
+    assert build_qc_schemas([task], rows + [(task, fuller, None)])[task] == (
+        'subject_id', 'session', 'incongruent_go_rt', 'congruent_go_rt', 'avg_ssd'
+    )
+
+    builder = QCTableBuilder([task], schemas=schemas)
+    for _, metrics, session in rows[:3]:
+        builder.add_row(task, 's01', metrics, session=session)
+    assert builder.columns(task) == list(schemas[task])
+    assert builder.build(task)['incongruent_go_rt'].isna().sum() == 2
+
+    initialize_qc_csvs([task], tmp_path, schemas=schemas)
+    assert list(pd.read_csv(tmp_path / f"{task}_qc.csv").columns) == list(schemas[task])
+
+
+def test_get_task_columns_returns_copies():
+    columns = get_task_columns('flanker_single_task_network')
+    columns.append('extra')
+    assert 'extra' not in get_task_columns('flanker_single_task_network')
+
+
+def test_qc_table_builder_adds_new_metric_columns_and_drops_new():
+    builder = QCTableBuilder(['stop_signal_with_flanker'])
+    builder.add_row(
+        'stop_signal_with_flanker', 's01',
+        {'congruent_go_rt': 0.5, 'tswitch_new_cswitch_acc': 1.0},
+    )
+    df = builder.build('stop_signal_with_flanker')
+    assert list(df.columns) == ['subject_id', 'congruent_go_rt']
+
+
+def test_append_summary_rows_in_memory():
+    df = pd.DataFrame({'subject_id': ['s01', 's02'], 'go_acc': [0.5, 1.0]})
+    out = append_summary_rows(df)
+    assert list(out['subject_id']) == ['s01', 's02', 'mean', 'std', 'max', 'min']
+    assert out.loc[2, 'go_acc'] == 0.75
+    assert out.loc[4, 'go_acc'] == 1.0
+
+
+def test_compute_summary_stats():
+    df = pd.DataFrame({
+        'subject_id': ['s01', 's02', 's03', 's04'],
+        'session': ['ses-1'] * 4,
+        'go_acc': [0.5, 1.0, np.nan, 0.75],
+        'count': [1, 2, 3, 4],
+    })
+    summary = compute_summary_stats(df)
+    assert list(summary.index) == [
+        'mean', 'std', 'max', 'min', 'median', 'count', 'iqr'
+    ]
+    assert list(summary.columns) == ['session', 'go_acc', 'count']
+    assert summary['session'].isna().all()
+    assert summary.loc['count', 'go_acc'] == 3
+    assert summary.loc['median', 'go_acc'] == 0.75
+    assert summary.loc['iqr', 'count'] == 1.5
+    assert summary.loc['std', 'count'] == np.std([1, 2, 3, 4])
+    # The appended rows come from the same summary and leave the subject rows untouched
+    out = append_summary_rows(df, summary)
+    assert list(out['subject_id']) == [
+        's01', 's02', 's03', 's04', 'mean', 'std', 'max', 'min'
+    ]
+    assert out.loc[4, 'go_acc'] == 0.75
+
+
+def test_correct_column_names():
+    df = pd.DataFrame({
+        'subject_id': ['s01'],
+        'congruent_tswitch_new_cswitch_acc': [1.0],
+    })
+    assert list(correct_column_names(df).columns) == [
+        'subject_id', 'congruent_tswitch_cswitch_acc'
+    ]
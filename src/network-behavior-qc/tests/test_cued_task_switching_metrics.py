@@ -2,7 +2,9 @@ import pandas as pd
 import numpy as np
 import pytest
 from utils.qc_utils import (
+    align_next_trial_responses,
     compute_cued_task_switching_metrics,
+    normalize_condition_columns,
 ) 
 
 class TestCuedTaskSwitchingMetrics:
@@ -231,5 +233,59 @@ class TestCuedTaskSwitchingMetrics:
         assert metrics['tstay_cstay_rt'] == pytest.approx(0.5)  # Only correct trial
         assert metrics['tswitch_cstay_rt'] == pytest.approx(0.7)  # Only correct trial
 
+    def test_align_next_trial_responses(self):
+        """Test that responses are taken from the following row, keeping the original index."""
+        df_test = pd.DataFrame({
+            'correct': [np.nan, 1, np.nan, 0],
+            'key_press': [np.nan, 1, np.nan, -1],
+        }, index=[10, 11, 14, 15])
+        
+        aligned = align_next_trial_responses(df_test)
+        
+        assert list(aligned.index) == [10, 11, 14, 15]
+        assert aligned['correct'].iloc[0] == 1.0
+        assert aligned['correct'].iloc[2] == 0.0
+        assert aligned['key_press'].iloc[2] == -1.0
+        assert aligned['rt'].isna().all()
+        assert np.isnan(aligned['correct'].iloc[3])
+        
+    def test_in_scanner_flanker_reads_responses_from_next_row(self):
+        """Test in-scanner cued+flanker metrics where the response follows the cue row."""
+        df_test = pd.DataFrame({
+            'flanker_condition': ['congruent', None, 'incongruent', None],
+            'task_condition': ['stay', None, 'switch', None],
+            'cue_condition': ['stay', None, 'switch', None],
+            'correct': [np.nan, 1, np.nan, 0],
+            'rt': [np.nan, 0.5, np.nan, 0.7],
+            'key_press': [np.nan, 1, np.nan, 2],
+        })
+        
+        metrics = compute_cued_task_switching_metrics(
+            df_test, ['congruent_tstay_cstay', 'incongruent_tswitch_cswitch'], 'flanker',
+            flanker_col='flanker_condition', in_scanner=True
+        )
+        
+        assert metrics['congruent_tstay_cstay_acc'] == 1.0
+        assert metrics['congruent_tstay_cstay_rt'] == pytest.approx(0.5)
+        assert metrics['incongruent_tswitch_cswitch_acc'] == 0.0
+        assert metrics['incongruent_tswitch_cswitch_commission_rate'] == 1.0
+        assert metrics['incongruent_tswitch_cswitch_omission_rate'] == 0.0
+
+    def test_normalize_condition_columns(self):
+        """Test that labels are normalized once per distinct value and compared as categories."""
+        df_test = pd.DataFrame({
+            'task_condition': ['Stay', 'stay', np.nan, 'SWITCH'],
+            'task_switch': [' tstay_cstay', 'tstay_cstay', 'x', 'x'],
+        }, index=[3, 5, 7, 9])
+        
+        normalized = normalize_condition_columns(df_test, ['task_condition', 'missing'])
+        
+        assert list(normalized.columns) == ['task_condition']
+        assert list(normalized.index) == [3, 5, 7, 9]
+        assert list(normalized['task_condition'].cat.categories) == ['stay', 'nan', 'switch']
+        assert (normalized['task_condition'] == 'stay').tolist() == [True, True, False, False]
+        stripped = normalize_condition_columns(df_test, ['task_switch'], lowercase=False, strip=True)
+        assert (stripped['task_switch'] == 'tstay_cstay').tolist() == [True, True, False, False]
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
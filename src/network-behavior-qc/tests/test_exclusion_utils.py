@@ -59,6 +59,17 @@ def test_check_stop_signal_exclusion_criteria_flags():
     assert not (out['subject_id'] == 's02').any()
 
 
+def test_exclusion_checkers_use_every_row_without_summary_rows():
+    # In-memory tables have no summary rows, so the last subjects must still be checked
+    task_csv = pd.DataFrame({
+        'subject_id': ['s01', 's02', 's03', 's04'],
+        'congruent_acc': [ACC_THRESHOLD + 0.1, ACC_THRESHOLD + 0.1, ACC_THRESHOLD + 0.1, ACC_THRESHOLD - 0.1],
+    })
+    exclusion_df = pd.DataFrame({'subject_id': [], 'metric': [], 'metric_value': [], 'threshold': []})
+    out = check_other_exclusion_criteria('flanker_single_task_network', task_csv, exclusion_df)
+    assert out['subject_id'].tolist() == ['s04']
+
+
 def test_check_go_nogo_exclusion_criteria_flags():
     # Matching prefixes (e.g., "tstay_cstay_") so they pair
     task_csv = pd.DataFrame({
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+from tests.trial_data import make_units, write_trials_csv
+from utils.config import load_config
+from utils.incremental_utils import (
+    load_qc_state,
+    run_incremental_qc_units,
+    state_header,
+)
+
+
+def test_second_run_reuses_stored_results(tmp_path, capsys):
+    units = make_units(tmp_path, 3)
+    state_file = tmp_path / 'state.json'
+    first = run_incremental_qc_units(units, load_config(), 10, state_file)
+    second = run_incremental_qc_units(units, load_config(), 10, state_file)
+    assert '3 files unchanged, 0 new or changed' in capsys.readouterr().out
+    for a, b in zip(first, second):
+        assert a.metrics == pytest.approx(b.metrics, nan_ok=True)
+
+
+def test_changed_file_is_recomputed(tmp_path, capsys):
+    units = make_units(tmp_path, 3)
+    state_file = tmp_path / 'state.json'
+    run_incremental_qc_units(units, load_config(), 10, state_file)
+    # Touching without changing content is matched by hash
+    os.utime(units[0].path, (0, 0))
+    write_trials_csv(tmp_path / 'other.csv', 'flanker_single_task_network', n=40)
+    os.replace(tmp_path / 'other.csv', units[1].path)
+    run_incremental_qc_units(units, load_config(), 10, state_file)
+    assert '2 files unchanged, 1 new or changed' in capsys.readouterr().out.splitlines()[-1]
+
+
+def test_removed_files_are_dropped_from_state(tmp_path):
+    units = make_units(tmp_path, 3)
+    state_file = tmp_path / 'state.json'
+    run_incremental_qc_units(units, load_config(), 10, state_file)
+    run_incremental_qc_units(units[:2], load_config(), 10, state_file)
+    with open(state_file) as f:
+        assert set(json.load(f)['files']) == {u.path for u in units[:2]}
+
+
+def test_state_with_different_settings_is_ignored(tmp_path):
+    units = make_units(tmp_path, 1)
+    state_file = tmp_path / 'state.json'
+    run_incremental_qc_units(units, load_config(), 10, state_file)
+    assert load_qc_state(state_file, state_header('out_of_scanner', 10))
+    assert load_qc_state(state_file, state_header('out_of_scanner', 5)) == {}
+    assert load_qc_state(state_file, state_header('out_of_scanner', 10, ('integration', 'mean'))) == {}
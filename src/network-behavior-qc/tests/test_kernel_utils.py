@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.kernel_utils import (
+    kth_smallest_by_code,
+    mask_codes,
+    mean_by_code,
+    safe_divide,
+    ssrt_estimates_by_code,
+    sum_by_code,
+    trial_metrics_by_code,
+    trial_sums_by_code,
+)
+from utils.qc_utils import calculate_acc, calculate_omission_rate, calculate_rt
+
+
+def test_mean_by_code_skips_missing_values():
+    codes = np.array([0, 1, 1, 2, 2])
+    values = np.array([1.0, np.nan, 3.0, np.nan, np.nan])
+    sums, counts = sum_by_code(codes, values, 4)
+    assert sums.tolist() == [1.0, 3.0, 0.0, 0.0]
+    assert counts.tolist() == [1, 1, 0, 0]
+    means = mean_by_code(codes, values, 4)
+    assert means[:2].tolist() == [1.0, 3.0]
+    assert np.isnan(means[2:]).all()
+
+
+def test_safe_divide():
+    out = safe_divide(np.array([1.0, 2.0]), np.array([2, 0]))
+    assert out[0] == 0.5 and np.isnan(out[1])
+
+
+def test_mask_codes_aligns_series_to_index():
+    mask = pd.Series([True, False], index=[7, 3])
+    assert mask_codes(mask, pd.Index([3, 7, 9])).tolist() == [0, 1, 0]
+
+
+def test_trial_metrics_by_code():
+    codes = np.array([0, 0, 0, 1, 1])
+    correct = np.array([1.0, 0.0, np.nan, 1.0, 1.0])
+    rt = np.array([500.0, 700.0, np.nan, 400.0, 600.0])
+    key_press = np.array([1, 2, -1, 1, 1])
+    metrics = trial_metrics_by_code(trial_sums_by_code(codes, 2, correct, rt, key_press), gonogo=True)
+    assert metrics['acc'].tolist() == [0.5, 1.0]
+    assert metrics['rt'].tolist() == [500.0, 500.0]
+    assert metrics['omission_rate'].tolist() == pytest.approx([1 / 3, 0.0])
+    assert metrics['commission_rate'].tolist() == pytest.approx([1 / 3, 0.0])
+    assert metrics['nogo_rt'].tolist() == [600.0, 500.0]
+
+
+def test_wrappers_match_filtered_means():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'correct_trial': rng.choice([0.0, 1.0, np.nan], 50),
+        'rt': rng.integers(200, 900, 50).astype(float),
+        'key_press': rng.choice([-1, 1], 50),
+    }, index=rng.permutation(100)[:50])
+    mask = df['correct_trial'] == 1
+    assert calculate_acc(df, df['rt'] > 500) == df[df['rt'] > 500]['correct_trial'].mean()
+    assert calculate_rt(df, mask) == df[mask]['rt'].mean()
+    assert calculate_omission_rate(df, df['key_press'] == -1, 50) == (df['key_press'] == -1).sum() / 50
+    assert np.isnan(calculate_rt(df, df['rt'] < 0))
+
+
+def test_kth_smallest_by_code_matches_sorting():
+    rng = np.random.default_rng(1)
+    codes = rng.integers(0, 4, 60)
+    values = rng.normal(size=60)
+    kth = np.array([0, 3, 5, 1])
+    selected = kth_smallest_by_code(codes, values, 5, kth)
+    for code in range(4):
+        assert selected[code] == np.sort(values[codes == code])[kth[code]]
+    assert np.isnan(selected[4])
+
+
+def test_ssrt_estimates_by_code():
+    codes = np.zeros(8, dtype=np.intp)
+    is_go = np.array([1, 1, 0, 1, 0, 1, 0, 1], dtype=bool)
+    rt = np.array([0.5, 0.6, 0.7, 0.8, 0.9, 1.0, np.nan, 1.2])
+    ssd = np.array([np.nan, np.nan, 0.2, np.nan, 0.3, np.nan, 0.4, np.nan])
+    estimates = ssrt_estimates_by_code(codes, 1, is_go, ~is_go, rt, ssd, methods=('integration', 'mean', 'integration_per_ssd'))
+    # p_respond 2/3 of 5 go trials -> 3rd fastest go RT (0.8) minus mean SSD 0.3
+    assert estimates['integration'][0] == pytest.approx(0.5)
+    assert estimates['mean'][0] == pytest.approx(0.82 - 0.3)
+    # One stop trial per SSD: (1.2 - 0.2) + (1.2 - 0.3) + (0.5 - 0.4), averaged
+    assert estimates['integration_per_ssd'][0] == pytest.approx(2.0 / 3)
+    only_integration = ssrt_estimates_by_code(codes, 1, is_go, ~is_go, rt, ssd)
+    assert list(only_integration) == ['integration']
+    assert only_integration['integration'][0] == pytest.approx(0.5)
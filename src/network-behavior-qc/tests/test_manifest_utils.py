@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import pandas as pd
+from tests.trial_data import touch
+from utils.manifest_utils import (
+    build_input_manifest,
+    discover_tasks,
+    select_processing_rows,
+)
+
+
+def test_build_input_manifest_fmri(tmp_path: Path):
+    touch(tmp_path / 's01' / 'ses-01' / 's01_task-flanker_run-1.csv')
+    touch(tmp_path / 's01' / 'ses-01' / 's01_task-stop_signal_flanker_run-1.csv')
+    touch(tmp_path / 's01' / 'ses-01' / 'notes.txt')
+    touch(tmp_path / 's01' / 'ses-01' / 'practice' / 's01_flanker.csv')
+    touch(tmp_path / 's01' / 'anat' / 's01_flanker.csv')
+    touch(tmp_path / 'other' / 'ses-01' / 's01_flanker.csv')
+
+    manifest = build_input_manifest(tmp_path, is_fmri=True)
+    assert list(manifest.columns) == ['subject', 'session', 'path', 'task_name', 'size', 'mtime', 'is_practice']
+    assert len(manifest) == 2
+    assert set(manifest['task_name']) == {'flanker_single_task_network', 'stop_signal_with_flanker'}
+    assert (manifest['session'] == 'ses-01').all()
+    assert manifest['size'].dtype == 'int64'
+    assert (manifest['size'] > 0).all()
+
+
+def test_build_input_manifest_out_of_scanner(tmp_path: Path):
+    touch(tmp_path / 's01' / 's01_flanker_single_task_network.csv')
+    touch(tmp_path / 's01' / 's01_stop_signal_with_go_no_go.csv')
+    touch(tmp_path / 's01' / 'readme.csv')
+    touch(tmp_path / 'sx' / 'sx_flanker_single_task_network.csv')
+
+    manifest = build_input_manifest(tmp_path, is_fmri=False)
+    assert len(manifest) == 4
+    assert manifest['session'].isna().all()
+    assert 'stop_signal_with_go_nogo' in set(manifest['task_name'])
+
+    rows = select_processing_rows(manifest)
+    assert set(rows['subject']) == {'s01'}
+    assert set(rows['task_name']) == {'flanker_single_task_network', 'stop_signal_with_go_nogo'}
+
+
+def test_discover_tasks_ignores_practice():
+    manifest = pd.DataFrame({
+        'subject': ['s01', 's01', 's02'],
+        'session': ['ses-01'] * 3,
+        'path': ['/a/s01/ses-01/x.csv', '/a/practice/y.csv', '/a/s02/ses-01/z.csv'],
+        'task_name': ['n_back_single_task_network', 'go_nogo_single_task_network', None],
+        'size': [1, 1, 1],
+        'mtime': [0.0, 0.0, 0.0],
+        'is_practice': [False, True, False],
+    })
+    assert discover_tasks(manifest) == ['n_back_single_task_network']
+    assert len(select_processing_rows(manifest)) == 1
+
+
+def test_build_input_manifest_missing_root(tmp_path: Path):
+    manifest = build_input_manifest(tmp_path / 'missing', is_fmri=True)
+    assert manifest.empty
+    assert discover_tasks(manifest) == []
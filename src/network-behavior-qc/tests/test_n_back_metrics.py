@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.qc_utils import (
+    compute_n_back_metrics,
+    get_dual_n_back_columns,
+    get_n_back_cells,
+    get_n_back_paired_conditions,
+)
+
+
+class TestNBackMetrics:
+    """Test grouped n-back metric calculation and its column layout."""
+
+    def setup_method(self):
+        """Set up test data."""
+        self.df = pd.DataFrame({
+            'n_back_condition': ['Match', 'mismatch', 'match', 'mismatch', 'match', 'mismatch', 'match', 'mismatch'],
+            'delay': [1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 2.0, 2.0],
+            'flanker_condition': ['congruent', 'congruent', 'incongruent', 'incongruent'] * 2,
+            'correct_trial': [1, 0, 1, 1, 0, 1, np.nan, 1],
+            'rt': [0.5, 0.6, 0.7, np.nan, 0.9, 1.0, 1.1, 1.2],
+            'key_press': [1, 2, 1, -1, 2, 1, -1, 1],
+        }, index=[2, 3, 5, 7, 11, 13, 17, 19])
+
+    def test_single_n_back_cells(self):
+        """Test that each (n_back_condition, delay) cell matches its row mask."""
+        metrics = compute_n_back_metrics(self.df, None)
+
+        assert list(metrics) == [
+            f'{cond}_{delay}back_{metric}'
+            for cond in ['match', 'mismatch']
+            for delay in [1.0, 2.0]
+            for metric in ['acc', 'rt', 'omission_rate', 'commission_rate']
+        ]
+        assert metrics['match_1.0back_acc'] == 1.0
+        assert metrics['match_1.0back_rt'] == pytest.approx(0.6)
+        assert metrics['mismatch_1.0back_omission_rate'] == 0.5
+        assert metrics['mismatch_1.0back_commission_rate'] == 0.5
+        # The NaN correct_trial is skipped for acc but still counts as a trial
+        assert metrics['match_2.0back_acc'] == 0.0
+        assert metrics['match_2.0back_omission_rate'] == 0.5
+
+    def test_dual_n_back_overall_match_acc(self):
+        """Test the match/mismatch accuracies collapsed over paired conditions."""
+        paired_conditions = get_n_back_paired_conditions(self.df, 'flanker_condition')
+        metrics = compute_n_back_metrics(self.df, None, paired_task_col='flanker_condition', paired_conditions=paired_conditions)
+
+        assert paired_conditions == ['congruent', 'incongruent']
+        assert metrics['overall_match_1.0back_acc'] == 1.0
+        assert metrics['overall_mismatch_1.0back_acc'] == 0.5
+        # match_2.0back_incongruent has no accuracy and is left out of the mean
+        assert metrics['overall_match_2.0back_acc'] == 0.0
+
+    def test_dual_n_back_columns_match_metrics(self):
+        """Test that the column layout and computed metric keys come from the same cells."""
+        paired_conditions = get_n_back_paired_conditions(self.df, 'flanker_condition')
+        metrics = compute_n_back_metrics(self.df, None, paired_task_col='flanker_condition', paired_conditions=paired_conditions)
+        columns = get_dual_n_back_columns(['subject_id'], self.df, 'flanker_condition')
+
+        assert columns == ['subject_id'] + list(metrics)
+
+    def test_go_nogo_cells_keep_missing_delay(self):
+        """Test that go/nogo cells include a NaN delay cell with no trials, as the row masks did."""
+        df_test = self.df.assign(go_nogo_condition=['go', 'nogo'] * 4)
+        df_test.loc[19, 'delay'] = np.nan
+        _, cells = get_n_back_cells(df_test, 'go_nogo_condition', ['go', 'nogo'], gonogo=True)
+        metrics = compute_n_back_metrics(df_test, None, paired_task_col='go_nogo_condition', paired_conditions=['go', 'nogo'], gonogo=True)
+
+        assert 'match_nanback_go' in [name for name, _ in cells]
+        assert np.isnan(metrics['match_nanback_go_acc'])
+        assert 'match_1.0back_nogo_omission_rate' not in metrics
+
+if __name__ == "__main__":
+    pytest.main([__file__])
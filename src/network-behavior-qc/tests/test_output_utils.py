@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from utils.output_utils import read_table, to_columnar_frame, write_table
+
+
+def make_qc_table():
+    return pd.DataFrame({
+        'subject_id': ['s01', 's02', 'mean'],
+        'session': ['ses-1', 'ses-2', None],
+        'go_acc': [0.9, 0.8, 0.85],
+    })
+
+
+def test_to_columnar_frame_types_identifiers():
+    out = to_columnar_frame(make_qc_table())
+    assert isinstance(out['subject_id'].dtype, pd.CategoricalDtype)
+    assert isinstance(out['session'].dtype, pd.CategoricalDtype)
+    assert out['go_acc'].dtype == 'float64'
+
+
+def test_to_columnar_frame_keeps_index_and_stringifies_columns():
+    matrix = pd.DataFrame({250.0: [0.1, 0.2], 300.0: [0.3, 0.4]}, index=pd.Index(['s01', 's02'], name='subject_id'))
+    out = to_columnar_frame(matrix, index=True)
+    assert list(out.columns) == ['subject_id', '250.0', '300.0']
+    assert list(out['subject_id']) == ['s01', 's02']
+
+
+def test_write_table_csv_only(tmp_path):
+    write_table(make_qc_table(), tmp_path / 'task_qc.csv')
+    assert [p.name for p in tmp_path.iterdir()] == ['task_qc.csv']
+    pd.testing.assert_frame_equal(read_table(tmp_path / 'task_qc.csv'), pd.read_csv(tmp_path / 'task_qc.csv'))
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+def test_write_and_read_columnar(tmp_path, fmt):
+    pytest.importorskip('pyarrow')
+    df = make_qc_table()
+    write_table(df, tmp_path / 'task_qc.csv', [fmt])
+    assert (tmp_path / f'task_qc.{fmt}').exists()
+    assert not (tmp_path / 'task_qc.csv').exists()
+    loaded = read_table(tmp_path / 'task_qc.csv', [fmt])
+    assert list(loaded['subject_id']) == ['s01', 's02', 'mean']
+    assert loaded['go_acc'].tolist() == df['go_acc'].tolist()
@@ -0,0 +1,59 @@
+import dataclasses
+
+import pytest
+from tests.trial_data import make_units, write_trials_csv
+from utils.config import load_config
+from utils.pipeline_utils import QCResult, QCUnit, process_qc_unit, run_qc_units
+
+TASK = 'flanker_single_task_network'
+
+
+def test_process_qc_unit_returns_metrics(tmp_path):
+    path = write_trials_csv(tmp_path / f's01_{TASK}.csv', TASK)
+    unit = QCUnit(str(path), 's01', None, TASK)
+    result = process_qc_unit(unit, load_config(), 10)
+    assert isinstance(result, QCResult)
+    assert result.error is None
+    assert result.trimmed_record is None
+    assert 'congruent_acc' in result.metrics
+    assert result.violations.empty
+
+
+def test_process_qc_unit_compact_trials(tmp_path):
+    path = write_trials_csv(tmp_path / f's01_{TASK}.csv', TASK)
+    unit = QCUnit(str(path), 's01', None, TASK)
+    plain = process_qc_unit(unit, load_config(), 10)
+    compact = process_qc_unit(unit, dataclasses.replace(load_config(), compact_trials=True), 10)
+    assert plain.memory_bytes is None
+    before, after = compact.memory_bytes
+    assert after < before
+    assert compact.metrics == plain.metrics
+
+
+def test_process_qc_unit_skips_when_cut_before_halfway(tmp_path):
+    path = write_trials_csv(tmp_path / f's01_{TASK}.csv', TASK, n=30, blank_tail=20)
+    unit = QCUnit(str(path), 's01', None, TASK)
+    result = process_qc_unit(unit, load_config(), 10)
+    assert result.metrics is None
+    assert result.trimmed_record['before_halfway'] is True
+    assert result.trimmed_record['session'] == ''
+
+
+def test_process_qc_unit_captures_errors(tmp_path):
+    unit = QCUnit(str(tmp_path / 'missing.csv'), 's01', None, TASK)
+    result = process_qc_unit(unit, load_config(), 10)
+    assert result.metrics is None
+    assert result.error.startswith('Error processing flanker_single_task_network for subject s01')
+
+
+def test_run_qc_units_parallel_matches_serial_order(tmp_path):
+    units = make_units(tmp_path, 6)
+    serial = run_qc_units(units, load_config(), 10, workers=1)
+    parallel = run_qc_units(units, load_config(), 10, workers=2)
+    assert [r.subject_id for r in parallel] == [u.subject_id for u in units]
+    # Every subject's file differs, so a permuted or misattributed result shows up
+    expected = {u.subject_id: process_qc_unit(u, load_config(), 10).metrics for u in units}
+    assert len({repr(metrics) for metrics in expected.values()}) == len(units)
+    for a, b in zip(serial, parallel):
+        assert a.metrics == pytest.approx(expected[a.subject_id], nan_ok=True)
+        assert b.metrics == pytest.approx(expected[b.subject_id], nan_ok=True)
@@ -0,0 +1,78 @@
+import io
+
+import numpy as np
+import pandas as pd
+from tests.trial_data import make_trials
+from utils.config import load_config
+from utils.qc_utils import get_task_metrics
+from utils.schema_utils import (
+    compact_trial_table,
+    frame_memory,
+    get_task_components,
+    get_task_read_columns,
+    read_task_csv,
+)
+
+
+def test_get_task_components_handles_dual_and_fmri_names():
+    assert get_task_components('stop_signal_with_flanker') == ['flanker', 'stop_signal']
+    assert get_task_components('CuedTS_spatialTS') == ['cued_task_switching', 'spatial_task_switching']
+    assert get_task_components('n_back_single_task_network') == ['n_back']
+
+
+def test_get_task_read_columns():
+    columns = get_task_read_columns('flanker_single_task_network')
+    assert {'trial_id', 'rt', 'key_press', 'flanker_condition'} <= columns
+    assert 'SS_delay' not in columns
+    assert get_task_read_columns('unknown_task') is None
+
+
+def test_read_task_csv_selects_columns_and_dtypes():
+    csv = io.StringIO(
+        'trial_id,rt,key_press,correct_trial,flanker_condition,extra\n'
+        'test_trial,512,1,1,congruent,x\n'
+        'test_trial,-1,-1,0,,y\n'
+    )
+    df = read_task_csv(csv, 'flanker_single_task_network')
+    assert list(df.columns) == ['trial_id', 'rt', 'key_press', 'correct_trial', 'flanker_condition']
+    assert df['rt'].dtype == 'float64'
+    assert df['flanker_condition'].dtype == object
+    assert pd.isna(df['flanker_condition'].iloc[1])
+
+
+def test_read_task_csv_falls_back_when_rt_has_text():
+    csv = io.StringIO('trial_id,rt\ntest_trial,512\ntest_trial,timeout\n')
+    df = read_task_csv(csv, 'flanker_single_task_network')
+    assert df['rt'].tolist() == ['512', 'timeout']
+
+
+def test_compact_trial_table_dtypes():
+    trials = make_trials('stop_signal_single_task_network').to_csv(index=False)
+    df = read_task_csv(io.StringIO(trials), 'stop_signal_single_task_network')
+    compact = compact_trial_table(df)
+    assert compact['SS_trial_type'].dtype == 'category'
+    assert compact['trial_id'].dtype == 'category'
+    assert compact['correct_trial'].dtype == np.int8
+    assert compact['rt'].dtype == np.float32
+    assert compact['SS_delay'].dtype == np.float32
+    assert df['rt'].dtype == np.float64
+    assert frame_memory(compact) < frame_memory(df)
+
+
+def test_compact_trial_table_keeps_inexact_columns():
+    df = pd.DataFrame({'rt': [512.3, np.nan], 'correct_trial': [1.0, np.nan], 'key_press': [1, 300]})
+    compact = compact_trial_table(df)
+    assert compact['rt'].dtype == np.float64
+    assert compact['correct_trial'].dtype == np.float64
+    assert compact['key_press'].dtype == np.int16
+
+
+def test_compacted_table_gives_identical_metrics():
+    trials = make_trials('stop_signal_single_task_network').to_csv(index=False)
+    df = read_task_csv(io.StringIO(trials), 'stop_signal_single_task_network')
+    expected = get_task_metrics(df, 'stop_signal_single_task_network', load_config())
+    actual = get_task_metrics(compact_trial_table(df), 'stop_signal_single_task_network', load_config())
+    assert list(actual) == list(expected)
+    for key, value in expected.items():
+        assert type(actual[key]) is type(value)
+        assert actual[key] == value or (np.isnan(value) and np.isnan(actual[key]))
@@ -0,0 +1,108 @@
+import dataclasses
+
+import main
+import pytest
+from tests.trial_data import make_units, write_trials_csv
+from utils.config import load_config
+from utils.incremental_utils import state_header
+from utils.pipeline_utils import run_qc_units
+from utils.shard_utils import load_shards, parse_shard_spec, subject_shard, write_shard
+
+# Stop signal + flanker files prefix the flanker condition with the center letter
+STOP_SIGNAL_FLANKER_CONDITIONS = [
+    'H_congruent', 'F_congruent', 'H_incongruent', 'F_incongruent'
+]
+
+
+def test_parse_shard_spec():
+    assert parse_shard_spec('2/8') == (2, 8)
+    for spec in ['8/8', '-1/4', '1', 'a/b', '0/0']:
+        with pytest.raises(ValueError):
+            parse_shard_spec(spec)
+
+
+def test_subject_shard_is_stable_and_in_range():
+    assignments = [subject_shard(f's{i:02d}', 4) for i in range(1, 50)]
+    assert all(0 <= a < 4 for a in assignments)
+    assert len(set(assignments)) == 4
+    assert assignments == [subject_shard(f's{i:02d}', 4) for i in range(1, 50)]
+
+
+def test_merge_orders_by_path_and_checks_completeness(tmp_path):
+    header = state_header('out_of_scanner', 10)
+    units = make_units(tmp_path, 6)
+    shard_dir = tmp_path / 'shards'
+    # Write shards in reverse so the merge has to reorder
+    for index in reversed(range(3)):
+        shard_units = [u for u in units if subject_shard(u.subject_id, 3) == index]
+        results = run_qc_units(shard_units, load_config(), 10)
+        write_shard(
+            shard_dir, index, 3, header, ['flanker_single_task_network'],
+            shard_units, results,
+        )
+        if index == 1:
+            with pytest.raises(ValueError, match='Missing shards'):
+                load_shards(shard_dir, header)
+    tasks, results = load_shards(shard_dir, header)
+    assert tasks == ['flanker_single_task_network']
+    assert [r.subject_id for r in results] == [u.subject_id for u in units]
+    with pytest.raises(ValueError, match='different settings'):
+        load_shards(shard_dir, state_header('fmri', 10))
+
+
+def _run_main(monkeypatch, input_root, output_root, argv):
+    folders = {
+        'qc_output_folder': 'qc',
+        'flags_output_folder': 'flags',
+        'exclusions_output_folder': 'exclusions',
+        'violations_output_folder': 'violations',
+        'trimmed_csv_output_path': 'trimmed',
+    }
+    for folder in folders.values():
+        (output_root / folder).mkdir(parents=True, exist_ok=True)
+    cfg = dataclasses.replace(
+        load_config(),
+        input_folder=input_root,
+        **{field: output_root / folder for field, folder in folders.items()},
+    )
+    monkeypatch.setattr(main, 'load_config', lambda: cfg)
+    main.main(['--mode', 'out_of_scanner'] + argv)
+
+
+def _csv_outputs(output_root):
+    # Plots embed their creation time, so compare the tables
+    return {
+        path.relative_to(output_root): path.read_bytes()
+        for path in output_root.rglob('*.csv')
+    }
+
+
+def test_merged_shards_match_single_run(tmp_path, monkeypatch):
+    input_root = tmp_path / 'input'
+    # Create subjects in reverse so directory order differs from path order
+    for i in reversed(range(6)):
+        subject_dir = input_root / f's{i + 1:02d}'
+        subject_dir.mkdir(parents=True)
+        write_trials_csv(
+            subject_dir / f'{subject_dir.name}_flanker_single_task_network.csv',
+            'flanker_single_task_network', seed=i + 1, blank_tail=i,
+        )
+        write_trials_csv(
+            subject_dir / f'{subject_dir.name}_stop_signal_with_flanker.csv',
+            'stop_signal_with_flanker', n=60, seed=i + 1,
+            conditions={'flanker_condition': STOP_SIGNAL_FLANKER_CONDITIONS},
+        )
+    _run_main(monkeypatch, input_root, tmp_path / 'single', [])
+    shard_dir = ['--shard-dir', str(tmp_path / 'shards')]
+    for index in reversed(range(3)):
+        _run_main(
+            monkeypatch, input_root, tmp_path / 'merged',
+            ['--shard', f'{index}/3'] + shard_dir,
+        )
+    _run_main(
+        monkeypatch, input_root, tmp_path / 'merged', ['--merge'] + shard_dir
+    )
+
+    single = _csv_outputs(tmp_path / 'single')
+    assert single
+    assert _csv_outputs(tmp_path / 'merged') == single
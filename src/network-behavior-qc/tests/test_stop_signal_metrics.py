@@ -10,7 +10,10 @@ from utils.qc_utils import (
     get_go_trials_rt,
     get_stop_trials_info,
     get_nth_rt,
-    compute_SSRT
+    compute_SSRT,
+    compute_batched_SSRT,
+    factorize_stimulus_responses,
+    get_stimulus_response_modes,
 )
 
 class TestStopSignalMetrics:
@@ -274,5 +277,61 @@ class TestStopSignalMetrics:
         assert 'avg_ssd' in metrics
         # Note: Global SSRT is no longer calculated for dual tasks
 
+    def test_stimulus_response_modes(self):
+        """Test the most frequent response per stimulus, with ties to the first one seen."""
+        df = pd.DataFrame({
+            'stim': ['A', 'A', 'A', 'B', 'B', np.nan, 'C'],
+            'correct_response': [2, 1, 1, 3, 4, 1, np.nan],
+        })
+        stim_codes, resp_codes, resp_values = factorize_stimulus_responses(df, ['stim'])
+        modes = get_stimulus_response_modes(stim_codes, resp_codes, np.ones(len(df), dtype=bool))
+
+        assert stim_codes[5] == -1
+        assert [resp_values[m] for m in modes[:2]] == [1, 3]
+        # C has no go trial with a response
+        assert modes[2] == -1
+
+    def test_stop_fail_acc_with_multiple_stim_columns(self):
+        """Test stop-failure accuracy keyed on a combination of stimulus columns."""
+        df = self.df.assign(side=['L', 'L', 'R', 'L', 'L', 'L', 'L', 'L'])
+        metrics = calculate_dual_stop_signal_condition_metrics(
+            df, 'all', pd.Series(True, index=df.index), stim_cols=['stim', 'side']
+        )
+
+        # ('A', 'R') never appears on go trials, ('A', 'L') maps to 1 but the key press is 2
+        assert metrics['all_stop_fail_acc'] == 0.0
+
+    def test_compute_batched_SSRT_matches_per_condition(self):
+        """Test that one batched call matches compute_SSRT for overlapping conditions."""
+        masks = [self.df['stim'] == 'A', self.df['stim'] == 'B', pd.Series(True, index=self.df.index)]
+        ssrt, overall = compute_batched_SSRT(self.df, masks)
+
+        for mask, value in zip(masks, ssrt):
+            expected = compute_SSRT(self.df, condition_mask=mask)
+            assert (np.isnan(value) and np.isnan(expected)) or value == pytest.approx(expected)
+        assert overall == pytest.approx(ssrt[2])
+        # Stim 'B' has no stop trials
+        assert np.isnan(ssrt[1])
+
+    def test_additional_ssrt_methods(self):
+        """Test that extra SSRT estimators are added next to the integration SSRT."""
+        methods = ('mean', 'integration_per_ssd')
+        single = compute_stop_signal_metrics(self.df, ssrt_methods=methods)
+        keys = list(single)
+
+        assert keys[keys.index('ssrt'):keys.index('ssrt') + 3] == ['ssrt', 'ssrt_mean', 'ssrt_integration_per_ssd']
+        assert single['ssrt'] == compute_stop_signal_metrics(self.df)['ssrt']
+        assert single['ssrt_mean'] == pytest.approx(0.52)
+        assert single['ssrt_integration_per_ssd'] == pytest.approx(2.0 / 3)
+
+        df_dual = self.df.assign(flanker_condition=['congruent', 'incongruent'] * 4)
+        dual = compute_stop_signal_metrics(
+            df_dual, dual_task=True, paired_task_col='flanker_condition',
+            paired_conditions=['congruent', 'incongruent'], stim_cols=['stim'], ssrt_methods=methods
+        )
+        for condition in ['congruent', 'incongruent']:
+            assert f'{condition}_ssrt_mean' in dual
+            assert f'{condition}_ssrt_integration_per_ssd' in dual
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
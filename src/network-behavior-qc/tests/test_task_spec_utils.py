@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+from tests.trial_data import make_trials
+from utils.globals import DUAL_TASKS, SINGLE_TASKS
+from utils.qc_utils import get_task_columns, get_task_metrics
+from utils.task_spec_utils import (
+    ResolvedTask,
+    get_task_spec,
+    is_dual_task,
+    resolve_task,
+    resolve_task_filename,
+)
+
+
+@pytest.mark.parametrize('task_name', SINGLE_TASKS + DUAL_TASKS)
+def test_every_task_has_a_spec(task_name):
+    spec = get_task_spec(task_name)
+    assert spec is not None
+    assert spec.is_dual == is_dual_task(task_name)
+    assert get_task_columns(task_name)[0] == 'subject_id'
+
+
+def test_spec_resolution():
+    assert get_task_spec('cued_task_switching_with_flanker') is get_task_spec('flanker_with_cued_task_switching')
+    assert get_task_spec('spatialTS_single_task_network').engine == 'conditions'
+    assert get_task_spec('stop_signal_with_go_nogo').paired_conditions == ['go']
+    assert get_task_spec('n_back_with_spatial_task_switching').flags == {'spatialts': True}
+    assert 'flanker_condition' in get_task_spec('flanker_single_task_network').read_columns
+    assert get_task_spec('unknown_task') is None
+
+
+def test_unknown_task():
+    df = pd.DataFrame({'trial_id': ['test_trial'], 'rt': [500.0]})
+    assert get_task_columns('unknown_task') is None
+    with pytest.raises(ValueError):
+        get_task_metrics(df, 'unknown_task', None)
+
+
+def test_stop_signal_go_nogo_columns_are_metrics():
+    df = make_trials('stop_signal_with_go_nogo', omission_rate=0.25)
+    metrics = get_task_metrics(df, 'stop_signal_with_go_nogo', None)
+    columns = get_task_columns('stop_signal_with_go_nogo', sample_df=df)
+    assert set(columns[1:]) <= set(metrics)
+    assert 'nogo_stop_success_rate' in columns
+
+
+def test_resolve_task():
+    resolved = resolve_task('stop_signal_with_go_no_go')
+    assert resolved == ResolvedTask('stop_signal_with_go_nogo', ('stop_signal', 'go_nogo'), True, 'goNogo')
+    assert resolve_task('stop_signal_with_go_no_go') is resolved
+    assert resolve_task('flanker_with_cued_task_switching').bids_name == 'cuedTS'
+    assert resolve_task('spatialTS_single_task_network').components == ('spatial_task_switching',)
+    assert not resolve_task('spatialTS_single_task_network').is_dual
+    assert resolve_task('readme') == ResolvedTask('readme', (), False, None)
+
+
+def test_resolve_task_filename():
+    fmri = resolve_task_filename('s42_ses-10_task-n_back_flanker_run-1.csv', is_fmri=True)
+    assert fmri.task_name == 'flanker_with_n_back'
+    assert fmri.is_dual
+    assert resolve_task_filename('s01_task-StopSignal_GoNogo_run-1.csv', is_fmri=True).task_name == 'stop_signal_with_go_nogo'
+    assert resolve_task_filename('s01_notes.csv', is_fmri=True) is None
+    oos = resolve_task_filename('s01_stop_signal_with_go_no_go.csv', is_fmri=False)
+    assert oos.task_name == 'stop_signal_with_go_nogo'
+    assert resolve_task_filename('sx_flanker_single_task_network.csv', is_fmri=False) is None
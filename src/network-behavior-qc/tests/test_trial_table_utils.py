@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+from tests.trial_data import make_trials
+from utils.config import load_config
+from utils.qc_utils import compute_stop_signal_metrics, get_task_metrics
+from utils.trial_table_utils import TrialTable, as_trial_table, filter_to_test_trials
+from utils.violations_utils import compute_violations
+
+
+def make_stop_signal_trials():
+    # A fifth of the rows are fixations, so filtering drops some
+    return make_trials('stop_signal_single_task_network', omission_rate=0.2,
+                       conditions={'trial_id': ['test_trial'] * 4 + ['fixation']})
+
+
+def test_test_trials_are_filtered_once():
+    df = make_stop_signal_trials()
+    trials = TrialTable(df, 'stop_signal_single_task_network')
+    assert trials.test_trials is trials.test_trials
+    pd.testing.assert_frame_equal(trials.test_trials, filter_to_test_trials(df, 'stop_signal_single_task_network'))
+
+
+def test_masks_and_numeric_columns_are_cached():
+    df = make_stop_signal_trials().assign(key_press=lambda d: d['key_press'].astype(str))
+    trials = TrialTable(df, 'stop_signal_single_task_network')
+    test = trials.test_trials
+    assert trials.go_mask is trials.go_mask
+    assert trials.go_mask.equals(test['SS_trial_type'] == 'go')
+    assert trials.stop_mask.equals(test['SS_trial_type'] == 'stop')
+    assert trials.correct_mask.equals(test['correct_trial'] == 1)
+    assert trials.numeric('key_press') is trials.numeric('key_press')
+    assert trials.numeric('key_press').equals(pd.to_numeric(test['key_press'], errors='coerce'))
+
+
+def test_as_trial_table():
+    df = make_stop_signal_trials()
+    trials = TrialTable(df, 'stop_signal_single_task_network')
+    assert as_trial_table(trials) is trials
+    # Without a task name the frame is taken as test trials already
+    assert as_trial_table(df).test_trials is df
+    assert len(as_trial_table(df, 'stop_signal_single_task_network').test_trials) < len(df)
+
+
+def test_shared_table_matches_dataframe_inputs():
+    df = make_stop_signal_trials()
+    task_name = 'stop_signal_single_task_network'
+    trials = TrialTable(df, task_name)
+    expected = get_task_metrics(df, task_name, load_config())
+    assert get_task_metrics(trials, task_name, load_config()) == pytest.approx(expected, nan_ok=True)
+    assert compute_stop_signal_metrics(trials.test_trials) == pytest.approx(expected, nan_ok=True)
+    pd.testing.assert_frame_equal(compute_violations('s01', trials, task_name), compute_violations('s01', df, task_name))
@@ -0,0 +1,26 @@
+from tests.trial_data import touch
+from utils.watch_utils import affected_tasks, poll_input_changes
+
+
+def test_affected_tasks_covers_added_changed_and_removed():
+    previous = {'a.csv': (10, 1.0, 'flanker'), 'b.csv': (10, 1.0, 'go_nogo'), 'c.csv': (10, 1.0, 'n_back')}
+    current = {'a.csv': (12, 2.0, 'flanker'), 'b.csv': (10, 1.0, 'go_nogo'), 'd.csv': (10, 1.0, 'stop_signal')}
+    assert affected_tasks(previous, current) == {'flanker', 'n_back', 'stop_signal'}
+
+
+def test_poll_input_changes_waits_for_tree_to_settle(tmp_path):
+    touch(tmp_path / 's01' / 's01_flanker_single_task_network.csv')
+    steps = [
+        lambda: touch(tmp_path / 's02' / 's02_go_nogo_single_task_network.csv'),
+        lambda: None,
+        lambda: None,
+    ]
+
+    def fake_sleep(_):
+        steps.pop(0)()
+
+    polls = list(poll_input_changes(tmp_path, False, 0, max_polls=3, sleep=fake_sleep))
+    assert polls[0][1] is None
+    assert len(polls[0][0]) == 1
+    # The new file is reported once, on the poll after it first appeared
+    assert [tasks for _, tasks in polls[1:]] == [{'go_nogo_single_task_network'}]
@@ -0,0 +1,85 @@
+"""Random trial tables and input files shared by the tests."""
+import numpy as np
+import pandas as pd
+from utils.pipeline_utils import QCUnit
+
+# Condition column and the values drawn for it, by task component
+CONDITION_VALUES = {
+    'flanker': ('flanker_condition', ['congruent', 'incongruent']),
+    'go_nogo': ('go_nogo_condition', ['go', 'nogo']),
+    'stop_signal': ('SS_trial_type', ['go', 'go', 'stop']),
+}
+
+
+def make_trials(task_name, n=40, seed=0, omission_rate=0.0, conditions=None):
+    """
+    Random test trials with the condition columns task_name's metrics read.
+
+    Args:
+        task_name (str): Task name, picks the condition columns
+        n (int): Number of trials
+        seed (int): Seed for the random generator
+        omission_rate (float): Share of trials without a response
+        conditions (dict, optional): Values to draw per column, overriding the
+            defaults; columns the task does not have are ignored
+
+    Returns:
+        pd.DataFrame: The trials
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'trial_id': ['test_trial'] * n,
+        'rt': rng.integers(200, 900, n).astype(float),
+        'key_press': rng.choice([1, 2], n),
+        'correct_response': rng.choice([1, 2], n),
+        'correct_trial': rng.integers(0, 2, n),
+    })
+    values = {
+        column: default
+        for component, (column, default) in CONDITION_VALUES.items()
+        if component in task_name
+    }
+    for column, choices in (conditions or {}).items():
+        if column in values or column in df:
+            values[column] = choices
+    for column, choices in values.items():
+        df[column] = rng.choice(choices, n)
+    if 'stop_signal' in task_name:
+        stop = df['SS_trial_type'] == 'stop'
+        df['stop_signal_condition'] = df['SS_trial_type']
+        df['SS_delay'] = np.where(stop, rng.choice([50.0, 100.0, 150.0], n), np.nan)
+        df['stim'] = rng.choice(['circle', 'square'], n)
+        # Half of the stop trials are inhibited
+        df.loc[stop & (rng.random(n) < 0.5), ['key_press', 'rt']] = -1
+        if 'flanker' in task_name:
+            df['center_letter'] = rng.choice(['H', 'F'], n)
+    if omission_rate:
+        df.loc[rng.random(n) < omission_rate, ['key_press', 'rt']] = -1
+    return df
+
+
+def write_trials_csv(path, task_name, n=20, seed=0, blank_tail=0, **kwargs):
+    """Write make_trials output to path, leaving the last blank_tail trials blank."""
+    df = make_trials(task_name, n=n, seed=seed, **kwargs)
+    if blank_tail:
+        df.loc[n - blank_tail:, 'rt'] = -1
+    df.to_csv(path, index=False)
+    return path
+
+
+def make_units(directory, n_subjects, task_name='flanker_single_task_network',
+               **kwargs):
+    """Write one trials file per subject, seeded by subject, and return their units."""
+    units = []
+    for i in range(n_subjects):
+        subject_id = f's{i + 1:02d}'
+        path = directory / f'{subject_id}_{task_name}.csv'
+        write_trials_csv(path, task_name, seed=i + 1, **kwargs)
+        units.append(QCUnit(str(path), subject_id, None, task_name))
+    return units
+
+
+def touch(path, content='trial_id,rt\n'):
+    """Write a placeholder input file, creating its folders."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
@@ -15,7 +15,6 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.config import load_config
-from utils.trimmed_behavior_utils import get_bids_task_name
 
 # Load config
 cfg = load_config()
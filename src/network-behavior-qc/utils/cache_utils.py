@@ -0,0 +1,122 @@
+"""
+Content-addressed on-disk cache of per-file QC results with LRU eviction.
+
+Entries are keyed by the SHA-256 of the input file bytes, the task name, the
+data mode, the trim setting and the metric engine version, so a renamed or
+copied file still hits and any change to the metric code misses. Each entry is
+a small JSON file written atomically, which makes the cache safe to share
+between worker processes and concurrent runs. Recency is tracked through the
+entry file's mtime, which is bumped on every hit.
+"""
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(*parts):
+    """
+    Build a cache key from the values that identify one processed file.
+
+    Args:
+        *parts: Values such as the content hash, task name, mode and engine version
+
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def json_default(value):
+    """json.dump default hook for numpy scalars in metric dicts."""
+    # numpy scalars (np.int64, np.bool_, ...) expose .item()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class MetricsCache:
+    """
+    Directory of cached per-file results bounded by a total byte budget.
+
+    Instances only hold the directory and budget, so they can be passed to
+    worker processes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """
+        Look up an entry and mark it as recently used.
+
+        Args:
+            key (str): Key from cache_key
+
+        Returns:
+            dict | None: Stored payload, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r') as f:
+                payload = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, evicted by another process mid-read, or unreadable
+            return None
+        return payload
+
+    def put(self, key, payload):
+        """
+        Store an entry, replacing any existing one atomically.
+
+        Args:
+            key (str): Key from cache_key
+            payload (dict): JSON-serializable payload
+        """
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(payload, f, default=json_default)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write cache entry {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits the byte budget.
+
+        Returns:
+            int: Number of entries removed
+        """
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
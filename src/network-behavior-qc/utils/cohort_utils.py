@@ -0,0 +1,211 @@
+"""
+Cohort-batched metric engine.
+
+Instead of masking every file once per condition, each file is reduced to a
+small table of sufficient statistics grouped by its raw condition values
+(trial count, correct sum/count, RT sums/counts, omission and commission
+counts). All tables for a task are then concatenated and aggregated in one
+grouped pass over (file, condition cell); a group that matches several cells
+(e.g. 'incongruent' also contains 'congruent') counts towards each. Condition
+matching is done on the distinct condition values only, with the same
+equality / case-insensitive substring rules that calculate_metrics applies row
+by row, so outputs match the per-file engine.
+
+Only tasks whose metrics come from calculate_metrics without extra category
+accuracies are supported; everything else keeps using get_task_metrics.
+"""
+import functools
+import itertools
+
+import numpy as np
+import pandas as pd
+from utils.kernel_utils import safe_divide
+from utils.qc_utils import condition_value_mask
+from utils.task_spec_utils import get_task_spec
+
+# Sufficient statistics kept per (file, condition values) group
+STAT_COLUMNS = [
+    'n',
+    'correct_sum',
+    'correct_count',
+    'rt_correct_sum',
+    'rt_correct_count',
+    'rt_responded_sum',
+    'rt_responded_count',
+    'omissions',
+    'commissions',
+    'go_nogo_commissions',
+]
+
+
+@functools.lru_cache(maxsize=None)
+def get_cohort_spec(task_name):
+    """
+    Describe how the cohort engine computes a task, if it can.
+
+    Args:
+        task_name (str): Task name
+
+    Returns:
+        dict | None: Spec with 'columns' (list of (column, conditions, match)
+        where match is 'equals', 'equals_lower' or 'contains'), 'go_nogo' (bool)
+        and 'overall_acc' (bool); None if the task needs the per-file engine
+    """
+    task_spec = get_task_spec(task_name)
+    # Plain condition-engine tasks only: no engine flags, in-scanner columns or single go/nogo
+    if task_spec is None or task_spec.engine != 'conditions' or task_spec.flags or task_spec.in_scanner_columns:
+        return None
+    if task_spec.components == ('go_nogo',):
+        return None
+    if not task_spec.is_dual:
+        (column,), (conditions,) = task_spec.condition_columns.values(), task_spec.conditions.values()
+        return {'columns': [(column, conditions, 'equals')], 'go_nogo': False, 'overall_acc': True}
+    has_go_nogo = task_spec.go_nogo_columns
+    return {
+        'columns': [
+            (column, task_spec.conditions[component], 'equals_lower' if column == 'go_nogo_condition' else 'contains')
+            for component, column in task_spec.condition_columns.items()
+        ],
+        'go_nogo': has_go_nogo,
+        'overall_acc': not has_go_nogo,
+    }
+
+
+def summarize_trials(df, spec):
+    """
+    Reduce one file's test trials to sufficient statistics per condition-value group.
+
+    Args:
+        df (pd.DataFrame): Test trials (after filter_to_test_trials)
+        spec (dict): Spec from get_cohort_spec
+
+    Returns:
+        pd.DataFrame | None: One row per distinct combination of the spec's
+        condition columns with STAT_COLUMNS, or None if required columns are missing
+    """
+    group_cols = [column for column, _, _ in spec['columns']]
+    # calculate_basic_metrics always reads correct_trial, so files without it stay on the per-file path
+    if not set(group_cols + ['rt', 'key_press', 'correct_trial']).issubset(df.columns):
+        return None
+    correct = df['correct_trial']
+    rt = df['rt']
+    correct_one = correct == 1
+    responded = df['key_press'] != -1
+    rt_correct = correct_one & rt.notna()
+    rt_responded = responded & rt.notna()
+    stats = pd.DataFrame({
+        'n': np.ones(len(df), dtype=np.int64),
+        'correct_sum': correct.where(correct.notna(), 0),
+        'correct_count': correct.notna().astype(np.int64),
+        'rt_correct_sum': rt.where(rt_correct, 0),
+        'rt_correct_count': rt_correct.astype(np.int64),
+        'rt_responded_sum': rt.where(rt_responded, 0),
+        'rt_responded_count': rt_responded.astype(np.int64),
+        'omissions': (~responded).astype(np.int64),
+        'commissions': (responded & ~correct_one).astype(np.int64),
+        'go_nogo_commissions': (responded & (correct == 0)).astype(np.int64),
+    }, index=df.index)
+    for column in group_cols:
+        stats[column] = df[column].astype(object)
+    return stats.groupby(group_cols, dropna=False, sort=False)[STAT_COLUMNS].sum().reset_index()
+
+
+def _is_nogo_cell(cond_name):
+    # Same rule calculate_go_nogo_metrics uses
+    return cond_name.endswith('_nogo') or 'nogo' in cond_name or cond_name == 'nogo'
+
+
+def compute_cohort_metrics(spec, summaries):
+    """
+    Compute metrics for every file of a task in one pass over their summaries.
+
+    Args:
+        spec (dict): Spec from get_cohort_spec
+        summaries (list): summarize_trials output for each file
+
+    Returns:
+        list: Metrics dict for each summary, in input order, with the same keys
+        (and key order) get_task_metrics produces
+    """
+    n_files = len(summaries)
+    stats = pd.concat(
+        [summary.assign(_file=i) for i, summary in enumerate(summaries)],
+        ignore_index=True,
+    )
+    file_index = stats['_file'].to_numpy()
+
+    # Match every distinct condition value once, then broadcast to rows by code;
+    # cells are the product of every column's conditions, in itertools order
+    membership = np.ones((len(stats), 1), dtype=bool)
+    for column, conditions, match in spec['columns']:
+        codes, uniques = pd.factorize(stats[column], use_na_sentinel=False)
+        values = pd.Series(uniques, dtype=object)
+        column_masks = np.column_stack([
+            condition_value_mask(values, condition, match)[codes]
+            for condition in conditions
+        ])
+        membership = membership[:, :, None] & column_masks[:, None, :]
+        membership = membership.reshape(len(stats), -1)
+    cell_conditions = [conditions for _, conditions, _ in spec['columns']]
+    cell_names = ['_'.join(cell) for cell in itertools.product(*cell_conditions)]
+    n_cells = len(cell_names)
+
+    # One grouped pass over (file, cell); a summary row counts towards every cell
+    # it matches
+    rows, cells = np.nonzero(membership)
+    totals = stats[STAT_COLUMNS].iloc[rows].groupby([file_index[rows], cells]).sum()
+    index = pd.MultiIndex.from_product([range(n_files), range(n_cells)])
+    totals = totals.reindex(index, fill_value=0)
+
+    def cell_totals(column):
+        return totals[column].to_numpy().reshape(n_files, n_cells)
+
+    n = cell_totals('n')
+    acc = safe_divide(cell_totals('correct_sum'), cell_totals('correct_count'))
+    rt_correct = safe_divide(
+        cell_totals('rt_correct_sum'), cell_totals('rt_correct_count'))
+    rt_responded = safe_divide(
+        cell_totals('rt_responded_sum'), cell_totals('rt_responded_count'))
+    omission_rate = safe_divide(cell_totals('omissions'), n)
+    commissions = 'go_nogo_commissions' if spec['go_nogo'] else 'commissions'
+    commission_rate = safe_divide(cell_totals(commissions), n)
+
+    metrics = [{} for _ in range(n_files)]
+    for j, cond_name in enumerate(cell_names):
+        nogo_cell = spec['go_nogo'] and _is_nogo_cell(cond_name)
+        for i in range(n_files):
+            metrics[i][f'{cond_name}_acc'] = acc[i, j]
+            if nogo_cell:
+                metrics[i][f'{cond_name}_rt'] = rt_responded[i, j]
+            else:
+                metrics[i][f'{cond_name}_rt'] = rt_correct[i, j]
+                metrics[i][f'{cond_name}_omission_rate'] = omission_rate[i, j]
+                metrics[i][f'{cond_name}_commission_rate'] = commission_rate[i, j]
+
+    if spec['overall_acc']:
+        t = stats.groupby('_file')[STAT_COLUMNS].sum()
+        t = t.reindex(range(n_files), fill_value=0)
+        overall = safe_divide(
+            t['correct_sum'].to_numpy(), t['correct_count'].to_numpy())
+        for i in range(n_files):
+            metrics[i]['overall_acc'] = overall[i]
+    return metrics
+
+
+def apply_cohort_metrics(results):
+    """
+    Fill metrics for results that carry a trial summary, one batch per task.
+
+    Args:
+        results (list): QCResult list from run_qc_units(..., engine='cohort')
+    """
+    by_task = {}
+    for result in results:
+        if result.trial_summary is not None:
+            by_task.setdefault(result.task_name, []).append(result)
+    for task_name, task_results in by_task.items():
+        spec = get_cohort_spec(task_name)
+        metrics = compute_cohort_metrics(spec, [result.trial_summary for result in task_results])
+        for result, task_metrics in zip(task_results, metrics):
+            result.metrics = task_metrics
+            result.trial_summary = None
@@ -20,6 +20,10 @@ class PathConfig:
     discovery_subjects: list[str]
     # Trimmed CSV output path
     trimmed_csv_output_path: Path
+    # SSRT estimators reported for stop signal tasks (see kernel_utils.SSRT_METHODS)
+    ssrt_methods: tuple = ('integration',)
+    # Compact trial tables after reading them (see schema_utils.compact_trial_table)
+    compact_trials: bool = False
 
 
 def load_config() -> PathConfig:
@@ -21,7 +21,7 @@ from utils.globals import (
     ACC_THRESHOLD,
     OMISSION_RATE_THRESHOLD,
     NOGO_STOP_SUCCESS_MIN,
-    SUMMARY_ROWS,
+    SUMMARY_ROW_STATS,
     NBACK_1BACK_MATCH_ACC_COMBINED_THRESHOLD_1,
     NBACK_1BACK_MISMATCH_ACC_COMBINED_THRESHOLD_1,
     NBACK_1BACK_MATCH_ACC_COMBINED_THRESHOLD_2,
@@ -36,6 +36,7 @@ from utils.globals import (
     GONOGO_NOGO_ACC_THRESHOLD_2
 )
 from utils.qc_utils import sort_subject_ids, is_dual_task
+from utils.output_utils import read_table, write_table
 
 # Build maps by condition suffix to require same non-nback condition (e.g., flanker congruency, cuedTS state)
 def suffix(col: str, prefix: str) -> str:
@@ -48,6 +49,22 @@ def prefix(col: str, prefix: str) -> str:
     idx = col.find(prefix)
     return col[:idx] if idx != -1 else col
 
+def subject_rows(task_csv):
+    """
+    Get the subject rows of a QC table.
+
+    In-memory QC tables keep their summary statistics separately (see
+    compute_summary_stats); tables read back from a QC CSV still end with rows
+    labelled SUMMARY_ROW_STATS in subject_id, which are left out by label.
+
+    Args:
+        task_csv (pd.DataFrame): QC table
+
+    Returns:
+        pd.DataFrame: Rows belonging to subjects
+    """
+    return task_csv[~task_csv['subject_id'].isin(SUMMARY_ROW_STATS)]
+
 
 def check_exclusion_criteria(task_name, task_csv, exclusion_df):
         if 'stop_signal' in task_name:
@@ -118,10 +135,7 @@ def check_stop_signal_exclusion_criteria(task_name, task_csv, exclusion_df):
     is_fmri = 'session' in task_csv.columns
     is_stop_dual = is_dual_task(task_name) and 'stop_signal' in task_name
     
-    for index, row in task_csv.iterrows():
-        #ignore the last 4 rows (summary rows)
-        if index >= len(task_csv) - SUMMARY_ROWS:
-            continue
+    for index, row in subject_rows(task_csv).iterrows():
         subject_id = row['subject_id']
         session = row['session'] if 'session' in row.index else None
 
@@ -216,10 +230,7 @@ def check_go_nogo_exclusion_criteria(task_name, task_csv, exclusion_df):
     # Detect if this is fMRI mode (has session column)
     is_fmri = 'session' in task_csv.columns
     
-    for index, row in task_csv.iterrows():
-        #ignore the last 4 rows (summary rows)
-        if index >= len(task_csv) - SUMMARY_ROWS:
-            continue
+    for index, row in subject_rows(task_csv).iterrows():
         subject_id = row['subject_id']
         session = row['session'] if 'session' in row.index else None
 
@@ -291,10 +302,7 @@ def check_n_back_exclusion_criteria(task_name, task_csv, exclusion_df):
     is_fmri = 'session' in task_csv.columns
     is_nback_dual = is_dual_task(task_name) and 'n_back' in task_name
     
-    for index, row in task_csv.iterrows():
-        #ignore the last 4 rows (summary rows)
-        if index >= len(task_csv) - SUMMARY_ROWS:
-            continue
+    for index, row in subject_rows(task_csv).iterrows():
         subject_id = row['subject_id']
         session = row['session'] if 'session' in row.index else None
         for load in [1, 2, 3]:
@@ -517,9 +525,7 @@ def check_other_exclusion_criteria(task_name, task_csv, exclusion_df):
     # Detect if this is fMRI mode (has session column)
     is_fmri = 'session' in task_csv.columns
     
-    for index, row in task_csv.iterrows():
-        if index >= len(task_csv) - SUMMARY_ROWS:
-            continue
+    for index, row in subject_rows(task_csv).iterrows():
         subject_id = row['subject_id']
         session = row['session'] if 'session' in row.index else None
         
@@ -579,13 +585,15 @@ def remove_some_flags_for_exclusion(task_name, exclusion_df):
     
     return exclusion_df
 
-def create_combined_exclusions_csv(tasks, exclusions_output_path):
+def create_combined_exclusions_csv(tasks, exclusions_output_path, formats=('csv',)):
     """
     Create combined and summarized exclusions CSVs from all individual task exclusion files.
     
     Args:
         tasks (list): List of task names
         exclusions_output_path (Path): Path to the exclusions output folder
+        formats (list): Output formats the task files were written in and to write the
+            combined files in (see output_utils.OUTPUT_FORMATS)
         
     Returns:
         None: Saves two CSVs:
@@ -595,9 +603,9 @@ def create_combined_exclusions_csv(tasks, exclusions_output_path):
     all_exclusions = []
     for task in tasks:
         exclusion_file = exclusions_output_path / f"excluded_data_{task}.csv"
-        if exclusion_file.exists():
+        if any(exclusion_file.with_suffix(f'.{fmt}').exists() for fmt in formats):
             try:
-                task_exclusions = pd.read_csv(exclusion_file)
+                task_exclusions = read_table(exclusion_file, formats)
                 if len(task_exclusions) > 0:
                     # Add task_name column
                     task_exclusions['task_name'] = task
@@ -627,7 +635,7 @@ def create_combined_exclusions_csv(tasks, exclusions_output_path):
             combined_exclusions = combined_exclusions.sort_values(['subject_id', 'task_name']).reset_index(drop=True)
         
         # Save all_exclusions.csv with all details
-        combined_exclusions.to_csv(exclusions_output_path / 'all_exclusions.csv', index=False)
+        write_table(combined_exclusions, exclusions_output_path / 'all_exclusions.csv', formats)
         
         # Create summarized_exclusions.csv: one row per subject-session-task combination
         if 'session' in combined_exclusions.columns:
@@ -639,7 +647,7 @@ def create_combined_exclusions_csv(tasks, exclusions_output_path):
             summarized = combined_exclusions[['subject_id', 'task_name']].drop_duplicates()
             summarized = summarized.sort_values(['subject_id', 'task_name']).reset_index(drop=True)
         
-        summarized.to_csv(exclusions_output_path / 'summarized_exclusions.csv', index=False)
+        write_table(summarized, exclusions_output_path / 'summarized_exclusions.csv', formats)
 
 
 def flag_fmri_condition_metrics(task_name, task_csv):
@@ -684,9 +692,7 @@ def flag_fmri_condition_metrics(task_name, task_csv):
     # Get all omission rate columns
     omission_rate_cols = [col for col in task_csv.columns if 'omission_rate' in col]
     
-    for idx, (index, row) in enumerate(task_csv.iterrows()):
-        if idx >= len(task_csv) - 4:  # Skip summary rows
-            continue
+    for index, row in subject_rows(task_csv).iterrows():
         subject_id = row['subject_id']
         session = row['session'] if 'session' in row.index else None
         
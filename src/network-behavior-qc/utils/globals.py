@@ -107,5 +107,8 @@ GONOGO_NOGO_ACC_THRESHOLD_2 = 0.5
 ACC_THRESHOLD = 0.55
 OMISSION_RATE_THRESHOLD = 0.25
 
-SUMMARY_ROWS = 4
+# Summary statistics appended to each QC table as rows (labelled in the subject_id column)
+SUMMARY_ROW_STATS = ['mean', 'std', 'max', 'min']
+# All statistics compute_summary_stats reports
+SUMMARY_STATS = SUMMARY_ROW_STATS + ['median', 'count', 'iqr']
 LAST_N_TEST_TRIALS = 10
\ No newline at end of file
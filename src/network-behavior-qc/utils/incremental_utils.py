@@ -0,0 +1,191 @@
+"""
+Utilities for incremental QC runs keyed on input file fingerprints.
+
+A state file maps each processed input path to its fingerprint (size, mtime,
+content hash) and the stored per-file result (metrics row, trimmed record and
+violation rows). On the next run only new or changed files are recomputed;
+per-task QC, flag and exclusion outputs are then rebuilt from all stored rows.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from utils.cache_utils import json_default
+from utils.pipeline_utils import QCResult, metric_engine_version, run_qc_units
+
+STATE_VERSION = 1
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 of a file's bytes.
+
+    Args:
+        path (str | Path): File to hash
+        chunk_size (int): Read size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def state_header(mode, last_n_test_trials, ssrt_methods=('integration',)):
+    """
+    Settings that must match for stored results to be reused.
+
+    Args:
+        mode (str): 'fmri' or 'out_of_scanner'
+        last_n_test_trials (int): Trailing test trials used by the RT tail cutoff
+        ssrt_methods (tuple): SSRT estimators reported for stop signal tasks
+
+    Returns:
+        dict: Header stored at the top of the state file
+    """
+    return {
+        'state_version': STATE_VERSION,
+        'mode': mode,
+        'last_n_test_trials': last_n_test_trials,
+        'ssrt_methods': list(ssrt_methods),
+        'engine_version': metric_engine_version(),
+    }
+
+
+def load_qc_state(state_file, header):
+    """
+    Load stored per-file entries, discarding them if the header does not match.
+
+    Args:
+        state_file (Path): Path to the JSON state file
+        header (dict): Expected header from state_header
+
+    Returns:
+        dict: Mapping of input path to stored entry (empty if missing or stale)
+    """
+    state_file = Path(state_file)
+    if not state_file.exists():
+        return {}
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read QC state file {state_file}: {e}")
+        return {}
+    if state.get('header') != header:
+        print("QC state was written by a different engine version or settings; recomputing all files")
+        return {}
+    return state.get('files', {})
+
+
+def save_qc_state(state_file, header, entries):
+    """
+    Atomically write the state file.
+
+    Args:
+        state_file (Path): Path to the JSON state file
+        header (dict): Header from state_header
+        entries (dict): Mapping of input path to entry
+    """
+    state_file = Path(state_file)
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = state_file.with_name(f".{state_file.name}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump({'header': header, 'files': entries}, f, default=json_default)
+    os.replace(tmp_file, state_file)
+
+
+def _fingerprint(unit):
+    if unit.size is not None and unit.mtime is not None:
+        return unit.size, unit.mtime
+    stat = os.stat(unit.path)
+    return stat.st_size, stat.st_mtime
+
+
+def split_stale_units(units, entries):
+    """
+    Split units into ones with a reusable stored result and ones to recompute.
+
+    A stored entry is reused when size and mtime match, or when they differ but
+    the content hash is unchanged (e.g. a file was copied or touched).
+
+    Args:
+        units (list): QCUnit list for the current manifest
+        entries (dict): Stored entries from load_qc_state
+
+    Returns:
+        tuple: (reused, stale, hashes) where reused maps path to QCResult,
+        stale is the list of units to recompute and hashes maps path to the
+        content hash computed during the check
+    """
+    reused = {}
+    stale = []
+    hashes = {}
+    for unit in units:
+        size, mtime = _fingerprint(unit)
+        entry = entries.get(unit.path)
+        if entry is not None and entry['size'] == size and entry['mtime'] == mtime:
+            reused[unit.path] = QCResult.from_dict(entry['result'])
+            continue
+        content_hash = file_content_hash(unit.path)
+        hashes[unit.path] = content_hash
+        if entry is not None and entry['sha256'] == content_hash:
+            reused[unit.path] = QCResult.from_dict(entry['result'])
+        else:
+            stale.append(unit)
+    return reused, stale, hashes
+
+
+def run_incremental_qc_units(units, config, last_n_test_trials, state_file, workers=1, cache=None):
+    """
+    Process only new or changed files and return results for every unit.
+
+    Results are returned in the same order as `units` so downstream merging
+    is identical to a full run. Files that no longer exist in the manifest
+    are dropped from the state file. Results with errors are not stored, so
+    they are retried on the next run.
+
+    Args:
+        units (list): QCUnit list for the current manifest
+        config (PathConfig): Loaded configuration
+        last_n_test_trials (int): Passed through to the RT tail cutoff
+        state_file (Path): Path to the JSON state file
+        workers (int): Number of worker processes for recomputed files
+        cache (MetricsCache | None): Optional cache consulted for recomputed files
+
+    Returns:
+        list: QCResult for each unit, in input order
+    """
+    header = state_header('fmri' if config.is_fmri else 'out_of_scanner', last_n_test_trials, config.ssrt_methods)
+    entries = load_qc_state(state_file, header)
+    reused, stale, hashes = split_stale_units(units, entries)
+    print(f"Incremental run: {len(reused)} files unchanged, {len(stale)} new or changed")
+
+    fresh = dict(zip([unit.path for unit in stale], run_qc_units(stale, config, last_n_test_trials, workers=workers, cache=cache)))
+
+    new_entries = {}
+    results = []
+    for unit in units:
+        if unit.path in fresh:
+            result = fresh[unit.path]
+            if result.error is None:
+                size, mtime = _fingerprint(unit)
+                new_entries[unit.path] = {
+                    'size': size,
+                    'mtime': mtime,
+                    'sha256': hashes.get(unit.path) or file_content_hash(unit.path),
+                    'result': result.to_dict(),
+                }
+        else:
+            result = reused[unit.path]
+            entry = entries[unit.path]
+            size, mtime = _fingerprint(unit)
+            new_entries[unit.path] = {**entry, 'size': size, 'mtime': mtime}
+        results.append(result)
+
+    save_qc_state(state_file, header, new_entries)
+    return results
@@ -0,0 +1,281 @@
+"""
+NumPy metric kernels over integer condition codes.
+
+Every trial carries a code in [0, n_codes) (a factorized condition, or 0/1
+for a single boolean mask). Counts, sums and means for all codes come from
+one np.bincount each, with no filtered DataFrame copies. The qc_utils
+helpers (calculate_acc, calculate_rt, ...) and grouped engines are thin
+wrappers over these kernels.
+"""
+import numpy as np
+import pandas as pd
+
+# SSRT estimators ssrt_estimates_by_code can compute
+SSRT_METHODS = ('integration', 'mean', 'integration_per_ssd')
+
+
+def safe_divide(numerator, denominator):
+    """
+    Divide element-wise, giving NaN where the denominator is not positive.
+
+    Args:
+        numerator (np.ndarray): Numerators
+        denominator (np.ndarray): Denominators
+
+    Returns:
+        np.ndarray: Float ratios
+    """
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.full(denominator.shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def mask_codes(mask, index=None):
+    """
+    Turn a boolean row mask into codes (1 for selected rows, 0 otherwise).
+
+    Args:
+        mask (pd.Series | np.ndarray): Boolean mask; missing values count as unselected
+        index (pd.Index, optional): Row order to align a Series mask to
+
+    Returns:
+        np.ndarray: intp codes, one per row
+    """
+    if isinstance(mask, pd.Series):
+        if index is not None and not mask.index.equals(index):
+            mask = mask.reindex(index, fill_value=False)
+        mask = mask.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(mask, dtype=bool).astype(np.intp)
+
+
+def as_float_array(values):
+    """Get values as a float array with NaN for missing entries."""
+    if isinstance(values, pd.Series):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return np.asarray(values, dtype=float)
+
+
+def count_by_code(codes, n_codes):
+    """
+    Count rows per code.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each row
+        n_codes (int): Number of codes
+
+    Returns:
+        np.ndarray: Row count for each code
+    """
+    return np.bincount(codes, minlength=n_codes)
+
+
+def sum_by_code(codes, values, n_codes):
+    """
+    Sum non-missing values per code.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each row
+        values (np.ndarray): Float values (NaN is skipped)
+        n_codes (int): Number of codes
+
+    Returns:
+        tuple: (sums, counts) arrays of length n_codes, counting non-missing values only
+    """
+    present = ~np.isnan(values)
+    sums = np.bincount(codes, weights=np.where(present, values, 0), minlength=n_codes)
+    counts = np.bincount(codes, weights=present, minlength=n_codes)
+    return sums, counts
+
+
+def mean_by_code(codes, values, n_codes):
+    """
+    Mean of non-missing values per code, NaN for codes without any.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each row
+        values (np.ndarray): Float values (NaN is skipped)
+        n_codes (int): Number of codes
+
+    Returns:
+        np.ndarray: Means of length n_codes
+    """
+    sums, counts = sum_by_code(codes, values, n_codes)
+    return safe_divide(sums, counts)
+
+
+def trial_sums_by_code(codes, n_codes, correct, rt, key_press, gonogo=False):
+    """
+    Sum the per-trial counts behind the basic and go/nogo metrics for each code.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each row
+        n_codes (int): Number of codes
+        correct (np.ndarray): Trial correctness as float (NaN when missing)
+        rt (np.ndarray): Reaction times as float (NaN when missing)
+        key_press (np.ndarray): Key presses (-1 for no response)
+        gonogo (bool): Count commissions as calculate_go_nogo_metrics does (correct == 0)
+            instead of calculate_basic_metrics (correct != 1)
+
+    Returns:
+        dict: 'n', 'correct_sum', 'correct_count', 'rt_sum', 'rt_count',
+        'nogo_rt_sum', 'nogo_rt_count', 'omissions', 'commissions' -> float
+        array of length n_codes
+    """
+    omitted = np.asarray(key_press == -1, dtype=bool)
+    responded = np.asarray(key_press != -1, dtype=bool)
+    correct_one = correct == 1
+    has_rt = ~np.isnan(rt)
+    commissions = responded & (correct == 0) if gonogo else responded & ~correct_one
+    correct_sum, correct_count = sum_by_code(codes, correct, n_codes)
+    rows = {
+        'rt_sum': np.where(correct_one & has_rt, rt, 0),
+        'rt_count': correct_one & has_rt,
+        'nogo_rt_sum': np.where(responded & has_rt, rt, 0),
+        'nogo_rt_count': responded & has_rt,
+        'omissions': omitted,
+        'commissions': commissions,
+    }
+    sums = {
+        'n': count_by_code(codes, n_codes).astype(float),
+        'correct_sum': correct_sum,
+        'correct_count': correct_count,
+    }
+    sums.update({key: np.bincount(codes, weights=values, minlength=n_codes) for key, values in rows.items()})
+    return sums
+
+
+def trial_metrics_by_code(sums, gonogo=False):
+    """
+    Turn trial_sums_by_code output into metric arrays.
+
+    Args:
+        sums (dict): Output of trial_sums_by_code
+        gonogo (bool): Also return nogo_rt (RT of any response)
+
+    Returns:
+        dict: 'acc', 'rt', 'omission_rate', 'commission_rate' (and 'nogo_rt')
+        -> float array, NaN where a code has no trials
+    """
+    metrics = {
+        'acc': safe_divide(sums['correct_sum'], sums['correct_count']),
+        'rt': safe_divide(sums['rt_sum'], sums['rt_count']),
+        'omission_rate': safe_divide(sums['omissions'], sums['n']),
+        'commission_rate': safe_divide(sums['commissions'], sums['n']),
+    }
+    if gonogo:
+        metrics['nogo_rt'] = safe_divide(sums['nogo_rt_sum'], sums['nogo_rt_count'])
+    return metrics
+
+
+def kth_smallest_by_code(codes, values, n_codes, kth):
+    """
+    Select the kth smallest value of each code with one np.partition per code.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each value
+        values (np.ndarray): Float values without NaN
+        n_codes (int): Number of codes
+        kth (np.ndarray): 0-based rank to select for each code, within its value count
+
+    Returns:
+        np.ndarray: Selected value for each code, NaN for codes without values
+    """
+    counts = count_by_code(codes, n_codes)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    # A stable sort on the small integer codes groups the values without ordering them
+    grouped = values[np.argsort(codes, kind='stable')]
+    selected = np.full(n_codes, np.nan)
+    for code in np.flatnonzero(counts):
+        group = grouped[bounds[code]:bounds[code + 1]]
+        selected[code] = np.partition(group, kth[code])[kth[code]]
+    return selected
+
+
+def ssrt_estimates_by_code(codes, n_codes, is_go, is_stop, rt, ssd, max_go_rt=2000, methods=('integration',)):
+    """
+    SSRT estimators for every code in one pass over go and stop trials.
+
+    - 'integration': missing (NaN or -1) go RTs are replaced by max_go_rt and
+      the go RT at rank rint(p_respond * n_go) - 1 (clipped to the go trials)
+      minus the mean SSD of the code's stop trials, as get_nth_rt and
+      compute_SSRT define it.
+    - 'mean': mean RT of go trials with a response minus the mean SSD.
+    - 'integration_per_ssd': the integration method applied separately at
+      each SSD (p_respond and SSD of that SSD's stop trials), averaged with
+      weights equal to each SSD's stop trial count.
+
+    With only 'integration' each code's order statistic is selected with
+    np.partition; when per-SSD ranks are needed the go RTs are sorted once per
+    code and every rank is read from that array.
+
+    Args:
+        codes (np.ndarray): Code in [0, n_codes) for each row
+        n_codes (int): Number of codes
+        is_go (np.ndarray): Boolean mask of go trials
+        is_stop (np.ndarray): Boolean mask of stop trials
+        rt (np.ndarray): Reaction times as float (NaN when missing)
+        ssd (np.ndarray): Stop signal delays as float (NaN when missing)
+        max_go_rt (float): RT used for go trials without a response
+        methods (tuple): Estimators to compute, from SSRT_METHODS
+
+    Returns:
+        dict: Method -> SSRT array of length n_codes (NaN without go trials or stop SSDs)
+    """
+    go_codes = codes[is_go]
+    go_rt = rt[is_go]
+    go_rt_replaced = np.where(np.isnan(go_rt) | (go_rt == -1), max_go_rt, go_rt)
+    n_go = count_by_code(go_codes, n_codes)
+
+    stop_codes = codes[is_stop]
+    stop_responded = rt[is_stop] > 0
+    n_stop = count_by_code(stop_codes, n_codes)
+    n_respond = count_by_code(stop_codes[stop_responded], n_codes)
+    p_respond = np.zeros(n_codes)
+    np.divide(n_respond, n_stop, out=p_respond, where=n_stop > 0)
+    avg_ssd = mean_by_code(stop_codes, ssd[is_stop], n_codes)
+
+    def rank(p, n):
+        return np.clip(np.rint(p * n).astype(np.intp) - 1, 0, np.maximum(n - 1, 0))
+
+    estimates = {}
+    kth = rank(p_respond, n_go)
+    if 'integration_per_ssd' in methods:
+        # One sort per file orders every code's go RTs; all ranks index into it
+        sorted_rt = go_rt_replaced[np.lexsort((go_rt_replaced, go_codes))]
+        starts = np.concatenate([[0], np.cumsum(n_go)[:-1]])
+        nth_rt = np.full(n_codes, np.nan)
+        has_go = n_go > 0
+        nth_rt[has_go] = sorted_rt[starts[has_go] + kth[has_go]]
+    else:
+        nth_rt = kth_smallest_by_code(go_codes, go_rt_replaced, n_codes, kth)
+    if 'integration' in methods:
+        estimates['integration'] = nth_rt - avg_ssd
+    if 'mean' in methods:
+        estimates['mean'] = mean_by_code(go_codes, np.where(go_rt > 0, go_rt, np.nan), n_codes) - avg_ssd
+    if 'integration_per_ssd' in methods:
+        stop_ssd = ssd[is_stop]
+        valid = ~np.isnan(stop_ssd) & (n_go[stop_codes] > 0)
+        ssd_values, ssd_codes = np.unique(stop_ssd[valid], return_inverse=True)
+        pair_keys = stop_codes[valid] * max(len(ssd_values), 1) + ssd_codes
+        pairs, pair_index, pair_n_stop = np.unique(pair_keys, return_inverse=True, return_counts=True)
+        pair_codes = pairs // max(len(ssd_values), 1)
+        pair_ssd = ssd_values[pairs % max(len(ssd_values), 1)] if len(pairs) else np.zeros(0)
+        pair_p_respond = np.bincount(pair_index, weights=stop_responded[valid], minlength=len(pairs)) / pair_n_stop
+        pair_rank = rank(pair_p_respond, n_go[pair_codes])
+        pair_ssrt = sorted_rt[starts[pair_codes] + pair_rank] - pair_ssd
+        weighted_sum = np.bincount(pair_codes, weights=pair_ssrt * pair_n_stop, minlength=n_codes)
+        weight = np.bincount(pair_codes, weights=pair_n_stop, minlength=n_codes)
+        estimates['integration_per_ssd'] = safe_divide(weighted_sum, weight)
+    return estimates
+
+
+def ssrt_by_code(codes, n_codes, is_go, is_stop, rt, ssd, max_go_rt=2000):
+    """
+    Integration-method SSRT for every code (see ssrt_estimates_by_code).
+
+    Returns:
+        np.ndarray: SSRT for each code, NaN without go trials or stop SSDs
+    """
+    return ssrt_estimates_by_code(codes, n_codes, is_go, is_stop, rt, ssd, max_go_rt)['integration']
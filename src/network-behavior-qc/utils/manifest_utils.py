@@ -0,0 +1,125 @@
+"""
+Utilities for building a single-pass manifest of behavioral input files.
+"""
+import os
+import re
+
+import pandas as pd
+from utils.task_spec_utils import resolve_task_filename
+
+MANIFEST_DTYPES = {
+    'subject': 'object',
+    'session': 'object',
+    'path': 'object',
+    'task_name': 'object',
+    'size': 'int64',
+    'mtime': 'float64',
+    'is_practice': 'bool',
+}
+
+SUBJECT_PATTERN = re.compile(r"s\d{2,}")
+
+
+def _scan(path, prefix='', suffix='', dirs=True):
+    """
+    List directory entries in os.scandir order, matching glob's '{prefix}*{suffix}' rules.
+
+    Hidden entries are skipped like glob does.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    matched = []
+    for entry in entries:
+        name = entry.name
+        if name.startswith('.') or not name.startswith(prefix) or not name.endswith(suffix):
+            continue
+        if dirs and not entry.is_dir():
+            continue
+        matched.append(entry)
+    return matched
+
+
+def _task_name(filename, is_fmri):
+    resolved = resolve_task_filename(filename, is_fmri)
+    return resolved.task_name if resolved is not None else None
+
+
+def _manifest_row(entry, subject, session, task_name):
+    stat = entry.stat()
+    return {
+        'subject': subject,
+        'session': session,
+        'path': entry.path,
+        'task_name': task_name,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'is_practice': '/practice/' in entry.path.lower(),
+    }
+
+
+def build_input_manifest(input_root, is_fmri):
+    """
+    Walk the input tree once and describe every candidate behavioral CSV.
+
+    fMRI mode scans s*/ses-*/*.csv and infers task names from the filename.
+    Out-of-scanner mode scans s*/*.csv and extracts the task name from the
+    's<id>_<task>.csv' pattern (see resolve_task_filename). Rows are sorted
+    by path so single, incremental, watch and merged sharded runs all process
+    files in the same order.
+
+    Args:
+        input_root (Path): Root of the behavioral data tree
+        is_fmri (bool): Whether to scan the in-scanner session layout
+
+    Returns:
+        pd.DataFrame: One row per file with columns subject, session, path,
+        task_name, size, mtime and is_practice
+    """
+    rows = []
+    for subj_entry in _scan(input_root, prefix='s'):
+        subject = subj_entry.name
+        if is_fmri:
+            for ses_entry in _scan(subj_entry.path, prefix='ses-'):
+                for file_entry in _scan(ses_entry.path, suffix='.csv', dirs=False):
+                    rows.append(_manifest_row(file_entry, subject, ses_entry.name, _task_name(file_entry.name, True)))
+        else:
+            for file_entry in _scan(subj_entry.path, suffix='.csv', dirs=False):
+                rows.append(_manifest_row(file_entry, subject, None, _task_name(file_entry.name, False)))
+    rows.sort(key=lambda row: row['path'])
+    manifest = pd.DataFrame(rows, columns=list(MANIFEST_DTYPES.keys()))
+    return manifest.astype(MANIFEST_DTYPES)
+
+
+def discover_tasks(manifest):
+    """
+    Get the sorted task names present in a manifest, ignoring practice files.
+
+    Args:
+        manifest (pd.DataFrame): Manifest from build_input_manifest
+
+    Returns:
+        list: Sorted task names
+    """
+    candidates = manifest[~manifest['is_practice'] & manifest['task_name'].notna()]
+    return sorted(candidates['task_name'].unique())
+
+
+def select_processing_rows(manifest):
+    """
+    Get the manifest rows that should be run through per-file QC.
+
+    Drops practice files, files without a recognised task and subject folders
+    that do not look like 's<digits>'.
+
+    Args:
+        manifest (pd.DataFrame): Manifest from build_input_manifest
+
+    Returns:
+        pd.DataFrame: Filtered manifest, in manifest order
+    """
+    valid_subject = manifest['subject'].map(lambda s: SUBJECT_PATTERN.match(s) is not None).astype(bool)
+    keep = ~manifest['is_practice'] & manifest['task_name'].notna() & valid_subject
+    return manifest[keep]
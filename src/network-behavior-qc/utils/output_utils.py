@@ -0,0 +1,97 @@
+"""
+Utilities for writing output tables as CSV and/or typed columnar files (Parquet, Feather).
+
+Columnar formats need pyarrow, installed with the 'columnar' extra:
+    uv sync --extra columnar
+"""
+import importlib.util
+
+import pandas as pd
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'feather']
+CATEGORICAL_COLUMNS = ['subject_id', 'session', 'task_name']
+
+
+def check_output_formats(formats):
+    """
+    Fail early if a requested columnar format cannot be written.
+
+    Args:
+        formats (list): Output formats from OUTPUT_FORMATS
+
+    Raises:
+        ImportError: If Parquet/Feather is requested and pyarrow is not installed
+    """
+    if any(fmt != 'csv' for fmt in formats) and importlib.util.find_spec('pyarrow') is None:
+        raise ImportError("Parquet/Feather output requires pyarrow; install it with 'uv sync --extra columnar'")
+
+
+def to_columnar_frame(df, index=False):
+    """
+    Prepare a table for columnar storage.
+
+    Identifier columns become categoricals and column labels become strings
+    (Parquet and Feather require string column names, e.g. for SSD matrices).
+
+    Args:
+        df (pd.DataFrame): Table as written to CSV
+        index (bool): Whether the index carries data (e.g. subject_id in violation matrices)
+
+    Returns:
+        pd.DataFrame: Typed copy with a default RangeIndex
+    """
+    out = df.reset_index() if index else df.reset_index(drop=True)
+    out.columns = [str(col) for col in out.columns]
+    for col in CATEGORICAL_COLUMNS:
+        if col in out.columns:
+            out[col] = out[col].astype('category')
+    return out
+
+
+def write_table(df, csv_path, formats=('csv',), index=False):
+    """
+    Write a table in each requested format next to its CSV path.
+
+    Args:
+        df (pd.DataFrame): Table to write
+        csv_path (Path): Path the CSV would be written to; other formats swap the suffix
+        formats (list): Output formats from OUTPUT_FORMATS
+        index (bool): Whether to write the index
+    """
+    for fmt in formats:
+        if fmt == 'csv':
+            df.to_csv(csv_path, index=index)
+        elif fmt == 'parquet':
+            to_columnar_frame(df, index=index).to_parquet(csv_path.with_suffix('.parquet'), index=False)
+        elif fmt == 'feather':
+            to_columnar_frame(df, index=index).to_feather(csv_path.with_suffix('.feather'))
+        else:
+            raise ValueError(f"Unknown output format: {fmt}")
+
+
+def read_table(csv_path, formats=('csv',)):
+    """
+    Read a table written by write_table, preferring CSV when it was written.
+
+    Args:
+        csv_path (Path): CSV path of the table
+        formats (list): Output formats the table was written in
+
+    Returns:
+        pd.DataFrame | None: The table, or None if no file exists in any format
+    """
+    for fmt in OUTPUT_FORMATS:
+        if fmt not in formats:
+            continue
+        path = csv_path if fmt == 'csv' else csv_path.with_suffix(f'.{fmt}')
+        if not path.exists():
+            continue
+        if fmt == 'csv':
+            return pd.read_csv(path)
+        df = pd.read_parquet(path) if fmt == 'parquet' else pd.read_feather(path)
+        # Categoricals from different files would not concatenate cleanly
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(object)
+        return df
+    return None
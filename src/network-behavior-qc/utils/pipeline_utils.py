@@ -0,0 +1,254 @@
+"""
+Utilities for running the per-file QC pipeline serially or across a process pool.
+"""
+import functools
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+import utils.globals as qc_globals
+from utils.cache_utils import cache_key
+from utils.cohort_utils import get_cohort_spec, summarize_trials
+from utils.qc_utils import get_task_metrics, normalize_flanker_conditions
+from utils.schema_utils import compact_trial_table, frame_memory, read_task_csv
+from utils.trial_table_utils import TrialTable
+from utils.trimmed_behavior_utils import preprocess_rt_tail_cutoff
+from utils.violations_utils import compute_violations
+
+# Modules whose source determines per-file metrics, trim outcomes and violations
+METRIC_ENGINE_MODULES = [
+    'cohort_utils.py',
+    'kernel_utils.py',
+    'pipeline_utils.py',
+    'qc_utils.py',
+    'schema_utils.py',
+    'task_spec_utils.py',
+    'trial_table_utils.py',
+    'trimmed_behavior_utils.py',
+    'violations_utils.py',
+]
+
+
+@dataclass
+class QCUnit:
+    """One behavioral CSV to run through the per-file QC pipeline."""
+    path: str
+    subject_id: str
+    session: str | None
+    task_name: str
+    size: int | None = None
+    mtime: float | None = None
+
+
+@dataclass
+class QCResult:
+    """Everything the parent process needs to merge one processed file."""
+    subject_id: str
+    session: str | None
+    task_name: str
+    metrics: dict | None = None
+    trimmed_record: dict | None = None
+    violations: pd.DataFrame = field(default_factory=pd.DataFrame)
+    error: str | None = None
+    # True/False when a MetricsCache was consulted, None when caching is off
+    cache_hit: bool | None = None
+    # Sufficient statistics for the cohort engine; metrics are filled in by apply_cohort_metrics
+    trial_summary: pd.DataFrame | None = None
+    # (bytes before, bytes after) compact_trial_table when config.compact_trials is set
+    memory_bytes: tuple | None = None
+
+    def to_dict(self):
+        """Convert to plain Python types for JSON storage."""
+        return {
+            'subject_id': self.subject_id,
+            'session': self.session,
+            'task_name': self.task_name,
+            'metrics': self.metrics,
+            'trimmed_record': self.trimmed_record,
+            'violations': self.violations.to_dict(orient='records'),
+            'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a result stored with to_dict."""
+        return cls(
+            subject_id=data['subject_id'],
+            session=data['session'],
+            task_name=data['task_name'],
+            metrics=data['metrics'],
+            trimmed_record=data['trimmed_record'],
+            violations=pd.DataFrame.from_records(data['violations']) if data['violations'] else pd.DataFrame(),
+            error=data['error'],
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def metric_engine_version():
+    """
+    Fingerprint of the code and settings that produce per-file results.
+
+    Hashes the source of METRIC_ENGINE_MODULES plus the non-threshold settings
+    in globals.py (task lists, condition lists, LAST_N_TEST_TRIALS). Exclusion
+    thresholds are deliberately left out: changing them only affects the
+    exclusion stage, which is always recomputed from stored metrics.
+
+    Returns:
+        str: Hex digest identifying the metric engine
+    """
+    digest = hashlib.sha256()
+    utils_dir = Path(__file__).parent
+    for module in METRIC_ENGINE_MODULES:
+        digest.update(module.encode())
+        digest.update((utils_dir / module).read_bytes())
+    for name in sorted(vars(qc_globals)):
+        if name.isupper() and ('CONDITIONS' in name or name.endswith('_TASKS') or name == 'LAST_N_TEST_TRIALS'):
+            digest.update(f"{name}={getattr(qc_globals, name)!r}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _compute_qc_result(result, source, unit, config, last_n_test_trials, engine='file'):
+    """Fill `result` from a file path or buffer; returns early for files cut before halfway."""
+    task_name = unit.task_name
+    df = read_task_csv(source, task_name)
+    # Normalize flanker conditions (remove h_ and f_ prefixes)
+    if 'flanker' in task_name and 'stop_signal' in task_name:
+        df = normalize_flanker_conditions(df)
+    if config.compact_trials:
+        before = frame_memory(df)
+        df = compact_trial_table(df)
+        result.memory_bytes = (before, frame_memory(df))
+    # Generic RT tail cutoff
+    df_trimmed, cut_pos, cut_before_halfway, proportion_blank = preprocess_rt_tail_cutoff(
+        df,
+        subject_id=unit.subject_id,
+        session=unit.session,
+        task_name=task_name,
+        last_n_test_trials=last_n_test_trials,
+    )
+    if cut_pos is not None:
+        result.trimmed_record = {
+            'subject_id': unit.subject_id,
+            'session': unit.session if unit.session is not None else '',
+            'task_name': task_name,
+            'cutoff_index': int(cut_pos),
+            'before_halfway': bool(cut_before_halfway),
+            'proportion_blank_trials': float(proportion_blank),
+        }
+        if cut_before_halfway:
+            return
+        df = df_trimmed
+    # Test trials are filtered once and shared by violations, the cohort summary and metrics
+    trials = TrialTable(df, task_name)
+    if (not config.is_fmri) and 'stop_signal' in task_name:
+        result.violations = compute_violations(unit.subject_id, trials, task_name)
+    spec = get_cohort_spec(task_name) if engine == 'cohort' else None
+    if spec is not None:
+        result.trial_summary = summarize_trials(trials.test_trials, spec)
+        if result.trial_summary is not None:
+            return
+    result.metrics = get_task_metrics(trials, task_name, config)
+
+
+def _cache_payload(result):
+    """Strip subject and session so identical files from different subjects share an entry."""
+    trimmed_record = None
+    if result.trimmed_record is not None:
+        trimmed_record = {k: v for k, v in result.trimmed_record.items() if k not in ('subject_id', 'session')}
+    violations = result.violations.drop(columns=['subject_id'], errors='ignore')
+    return {
+        'metrics': result.metrics,
+        'trimmed_record': trimmed_record,
+        'violations': violations.to_dict(orient='records'),
+    }
+
+
+def _apply_cache_payload(result, payload, unit):
+    result.metrics = payload['metrics']
+    if payload['trimmed_record'] is not None:
+        result.trimmed_record = {
+            'subject_id': unit.subject_id,
+            'session': unit.session if unit.session is not None else '',
+            **payload['trimmed_record'],
+        }
+    if payload['violations']:
+        violations = pd.DataFrame.from_records(payload['violations'])
+        violations.insert(0, 'subject_id', unit.subject_id)
+        result.violations = violations
+
+
+def process_qc_unit(unit, config, last_n_test_trials, cache=None, engine='file'):
+    """
+    Read, normalize, trim and compute metrics (and violations) for a single file.
+
+    Args:
+        unit (QCUnit): File to process
+        config (PathConfig): Loaded configuration (is_fmri, ssrt_methods and compact_trials are used)
+        last_n_test_trials (int): Trailing test trials required to be blank before trimming
+        cache (MetricsCache | None): Optional cache of results keyed on file content
+        engine (str): 'file' computes metrics here; 'cohort' returns a trial summary
+            instead for tasks the cohort engine supports (see apply_cohort_metrics)
+
+    Returns:
+        QCResult: Metrics, trimmed record and violations for the file. Errors are
+        captured on the result rather than raised so one bad file does not stop a run.
+    """
+    result = QCResult(subject_id=unit.subject_id, session=unit.session, task_name=unit.task_name)
+    try:
+        if cache is None:
+            _compute_qc_result(result, unit.path, unit, config, last_n_test_trials, engine)
+            return result
+        with open(unit.path, 'rb') as f:
+            data = f.read()
+        key = cache_key(
+            hashlib.sha256(data).hexdigest(),
+            unit.task_name,
+            'fmri' if config.is_fmri else 'out_of_scanner',
+            last_n_test_trials,
+            ','.join(config.ssrt_methods),
+            metric_engine_version(),
+        )
+        payload = cache.get(key)
+        if payload is not None:
+            _apply_cache_payload(result, payload, unit)
+            result.cache_hit = True
+            return result
+        result.cache_hit = False
+        _compute_qc_result(result, io.BytesIO(data), unit, config, last_n_test_trials)
+        cache.put(key, _cache_payload(result))
+    except Exception as e:
+        result.error = f"Error processing {unit.task_name} for subject {unit.subject_id}: {str(e)}"
+    return result
+
+
+def _process_qc_unit_star(args):
+    return process_qc_unit(*args)
+
+
+def run_qc_units(units, config, last_n_test_trials, workers=1, cache=None, engine='file'):
+    """
+    Process QC units, optionally across a process pool.
+
+    Results are always returned in the same order as `units`, so merging them
+    sequentially produces the same outputs as a serial run.
+
+    Args:
+        units (list): List of QCUnit
+        config (PathConfig): Loaded configuration
+        last_n_test_trials (int): Passed through to the RT tail cutoff
+        workers (int): Number of worker processes; 1 or less runs in-process
+        cache (MetricsCache | None): Optional cache of results keyed on file content
+        engine (str): 'file' or 'cohort' (see process_qc_unit)
+
+    Returns:
+        list: QCResult for each unit, in input order
+    """
+    args = [(unit, config, last_n_test_trials, cache, engine) for unit in units]
+    if workers <= 1 or len(units) <= 1:
+        return [_process_qc_unit_star(a) for a in args]
+    chunksize = max(1, len(units) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_process_qc_unit_star, args, chunksize=chunksize))
@@ -1,35 +1,41 @@
+import bisect
+import functools
 import pandas as pd
 import os
 from pathlib import Path
 import re
 import numpy as np
 
-from utils.globals import (
-    FLANKER_CONDITIONS,
-    DIRECTED_FORGETTING_CONDITIONS,
-    SPATIAL_TASK_SWITCHING_CONDITIONS,
-    CUED_TASK_SWITCHING_CONDITIONS,
-    SPATIAL_WITH_CUED_CONDITIONS,
-    GO_NOGO_CONDITIONS,
-    SHAPE_MATCHING_CONDITIONS,
-    FLANKER_WITH_CUED_CONDITIONS,
-    FLANKER_WITH_CUED_CONDITIONS_FMRI,
-    GO_NOGO_WITH_CUED_CONDITIONS,
-    SHAPE_MATCHING_WITH_CUED_CONDITIONS,
-    CUED_TASK_SWITCHING_WITH_DIRECTED_FORGETTING_CONDITIONS,
-    SHAPE_MATCHING_CONDITIONS_WITH_DIRECTED_FORGETTING,
+from utils.globals import SUMMARY_ROW_STATS, SUMMARY_STATS
+from utils.kernel_utils import as_float_array, count_by_code, mask_codes, mean_by_code, ssrt_estimates_by_code, trial_sums_by_code
+from utils.task_spec_utils import (
+    STOP_SIGNAL_COLUMNS,
+    get_task_spec,
+    is_dual_task,
 )
+# Filename helpers moved to utils.task_spec_utils, re-exported for existing callers
+from utils.task_spec_utils import extract_task_name_out_of_scanner as extract_task_name_out_of_scanner
+from utils.task_spec_utils import infer_task_name_from_filename as infer_task_name_from_filename
+from utils.trial_table_utils import as_trial_table
+# Moved to utils.trial_table_utils, re-exported for existing callers
+from utils.trial_table_utils import filter_to_test_trials as filter_to_test_trials
 
-def initialize_qc_csvs(tasks, output_path, include_session: bool = False):
+def initialize_qc_csvs(tasks, output_path, include_session: bool = False, schemas=None):
     """
     Initialize QC CSV files for all tasks.
     
     Args:
         tasks (list): List of task names
         output_path (Path): Path to save QC CSVs
+        include_session (bool): Whether tables start with a session column
+        schemas (dict, optional): build_qc_schemas output; tasks found there get
+            their full column layout instead of the get_task_columns one
     """
     for task in tasks:
-        columns = get_task_columns(task, include_session=include_session)
+        if schemas is not None and task in schemas:
+            columns = list(schemas[task])
+        else:
+            columns = get_task_columns(task, include_session=include_session)
         df = pd.DataFrame(columns=columns)
         df.to_csv(output_path / f"{task}_qc.csv", index=False)
 
@@ -51,41 +57,6 @@ def extend_metric_columns(base_columns, conditions):
         for metric in metric_types
     ]
 
-def infer_task_name_from_filename(fname: str) -> str | None:
-    name = fname.lower()
-    # Ignore practice files by caller
-    parts = []
-    if 'stop_signal' in name or 'stopsignal' in name or 'stop-signal' in name:
-        parts.append('stop_signal')
-    if 'go_nogo' in name or 'gonogo' in name or 'go-nogo' in name:
-        parts.append('go_nogo')
-    if 'shape_matching' in name or 'shapematching' in name or 'shape-matching' in name:
-        parts.append('shape_matching')
-    if 'directed_forgetting' in name or 'directedforgetting' in name or 'directed-forgetting' in name:
-        parts.append('directed_forgetting')
-    if 'spatial_task_switching' in name or 'spatialtaskswitching' in name or 'spatial-task-switching' in name:
-        parts.append('spatial_task_switching')
-    if 'flanker' in name:
-        parts.append('flanker')
-    if 'cued_task_switching' in name or 'cuedtaskswitching' in name or 'cued-task-switching' in name:
-        parts.append('cued_task_switching')
-    if 'n_back' in name or 'nback' in name or 'nback' in name or 'n-back' in name:
-        parts.append('n_back')
-    if not parts:
-        return None
-    if len(parts) == 1:
-        return f"{parts[0]}_single_task_network"
-    # Dual task: stable canonical order with 'with'
-    # Prefer stop_signal first if present, else lexicographic for consistency
-    if 'stop_signal' in parts:
-        first = 'stop_signal'
-        parts.remove('stop_signal')
-        second = parts[0]
-    else:
-        parts = sorted(parts)
-        first, second = parts[0], parts[1]
-    return f"{first}_with_{second}"
-
 def extend_go_nogo_metric_columns(base_columns, conditions):
     """
     Extend base columns with acc and RT metrics for go_nogo tasks.
@@ -112,58 +83,26 @@ def extend_go_nogo_metric_columns(base_columns, conditions):
 
 def get_dual_n_back_columns(base_columns, sample_df, paired_col=None, cuedts=False, gonogo=False):
     """
-    Generate columns for dual n-back tasks (n-back paired with another task).
+    Generate columns for n-back tasks (single, or n-back paired with another task).
     - base_columns: list of base columns (e.g., ['subject_id'])
     - sample_df: DataFrame with sample data
-    - paired_col: column name for the paired task (e.g., 'go_nogo_condition', 'flanker_condition')
+    - paired_col: column name for the paired task (e.g., 'go_nogo_condition', 'flanker_condition'); None for single n-back
     - cuedts: if True, handle n-back with cued task switching
+    Columns come from get_n_back_cells, the layout compute_n_back_metrics fills.
     Returns: list of columns
     """
-    conditions = []
-    if sample_df is not None:
-        if cuedts:
-            cue_conditions = [c for c in sample_df['cue_condition'].unique() if pd.notna(c) and str(c).lower() != 'na']
-            task_conditions = [t for t in sample_df['task_condition'].unique() if pd.notna(t) and str(t).lower() != 'na']
-            for n_back_condition in sample_df['n_back_condition'].unique():
-                if pd.isna(n_back_condition):
-                    continue
-                for delay in sample_df['delay'].unique():
-                    if pd.isna(delay):
-                        continue
-                    for cue in cue_conditions:
-                        for taskc in task_conditions:
-                            if cue == "stay" and taskc == "switch":
-                                continue
-                            else:
-                                col_prefix = f"{n_back_condition}_{delay}back_t{taskc}_c{cue}"
-                                conditions.append(col_prefix)
-            return extend_metric_columns(base_columns, conditions)
-        elif gonogo:
-            for n_back_condition in sample_df['n_back_condition'].str.lower().unique():
-                for delay in sample_df['delay'].unique():
-                    for paired_condition in sample_df[paired_col].str.lower().unique():
-                        if paired_condition == 'nogo':
-                            conditions.extend([
-                                f"{n_back_condition}_{delay}back_{paired_condition}_acc",
-                                f"{n_back_condition}_{delay}back_{paired_condition}_rt"
-                            ])
-                        else:
-                            conditions.extend([
-                                f"{n_back_condition}_{delay}back_{paired_condition}_acc",
-                                f"{n_back_condition}_{delay}back_{paired_condition}_rt",
-                                f"{n_back_condition}_{delay}back_{paired_condition}_omission_rate",
-                                f"{n_back_condition}_{delay}back_{paired_condition}_commission_rate"
-                            ])
-            return extend_go_nogo_metric_columns(base_columns, conditions)
-        else:
-            conditions = [
-                f"{n_back_condition}_{delay}back_{paired_condition}"
-                for n_back_condition in sample_df['n_back_condition'].str.lower().unique()
-                for delay in sample_df['delay'].unique()
-                for paired_condition in sample_df[paired_col].str.lower().unique()
-            ]
-        return extend_metric_columns(base_columns, conditions)
-    return base_columns  # Return base columns if no sample data available
+    if sample_df is None:
+        return base_columns  # Return base columns if no sample data available
+    paired_conditions = None if cuedts or paired_col is None else get_n_back_paired_conditions(sample_df, paired_col)
+    shapematching = paired_col == 'shape_matching_condition'
+    _, cells = get_n_back_cells(sample_df, paired_col, paired_conditions, cuedts=cuedts, gonogo=gonogo, shapematching=shapematching)
+    conditions = [cond_name for cond_name, _ in cells]
+    if gonogo:
+        return extend_go_nogo_metric_columns(base_columns, conditions)
+    columns = extend_metric_columns(base_columns, conditions)
+    if paired_conditions:
+        columns += [key for key, _, _ in n_back_overall_acc_keys()]
+    return columns
 
 def create_dual_task_conditions(task1_conditions, task2_conditions, separator='_'):
     """
@@ -215,218 +154,91 @@ def create_stop_signal_dual_columns(paired_conditions, include_nogo_commission=F
     
     return conditions
 
-def get_task_columns(task_name, sample_df=None, include_session: bool = False):
+def get_stop_signal_paired_conditions(df, spec):
     """
-    Define columns for each task's QC CSV.
+    Get the paired conditions a stop signal dual task is split by.
+
+    Args:
+        df (pd.DataFrame): Test trials
+        spec (TaskSpec): Stop signal dual task spec
+
+    Returns:
+        list: Paired condition names (n-back and cued task switching conditions
+        are combined names parsed by parse_dual_task_condition)
+    """
+    if spec.paired_conditions is not None:
+        return list(spec.paired_conditions)
+    if 'n_back' in spec.components:
+        paired_conditions = []
+        for n_back_condition in df['n_back_condition'].unique():
+            if pd.notna(n_back_condition):
+                paired_conditions.append(f"{n_back_condition}_collapsed")
+                for delay in df['delay'].unique():
+                    if pd.notna(delay):
+                        paired_conditions.append(f"{n_back_condition}_{delay}back")
+        return paired_conditions
+    if spec.flags.get('cuedts'):
+        # Combined conditions for cued task switching (e.g., "tstay_cstay", "tstay_cswitch")
+        paired_conditions = []
+        for cue_condition in df['cue_condition'].unique():
+            if pd.notna(cue_condition) and str(cue_condition).lower() != 'na':
+                for task_condition in df['task_condition'].unique():
+                    if pd.notna(task_condition) and str(task_condition).lower() != 'na':
+                        # Skip the combination where cue is stay and task is switch
+                        if cue_condition == "stay" and task_condition == "switch":
+                            continue
+                        paired_conditions.append(f"t{task_condition}_c{cue_condition}")
+        return paired_conditions
+    exclude_na = spec.flags.get('spatialts', False)
+    return [c for c in df[spec.paired_col].unique() if pd.notna(c) and not (exclude_na and c == 'na')]
+
+def get_task_columns(task_name, sample_df=None, include_session: bool = False):
     """
+    Define columns for each task's QC CSV from its task spec.
+
+    Columns that depend on the data (n-back cells, stop signal dual conditions)
+    need sample_df; without it only the base columns are returned. Layouts
+    without sample_df are computed once per task and session setting.
+    """
+    if sample_df is None:
+        columns = _get_static_task_columns(task_name, include_session)
+        return list(columns) if columns is not None else None
+    return _build_task_columns(task_name, sample_df, include_session)
+
+@functools.lru_cache(maxsize=None)
+def _get_static_task_columns(task_name, include_session):
+    columns = _build_task_columns(task_name, None, include_session)
+    return tuple(columns) if columns is not None else None
+
+def _build_task_columns(task_name, sample_df, include_session):
     base_columns = ['subject_id', 'session'] if include_session else ['subject_id']
-    
-    if is_dual_task(task_name):
-        # Handle dual tasks with stop signal first
-        if ('stop_signal' in task_name or 'stopSignal' in task_name) and 'flanker' in task_name:
-            if sample_df is not None:
-                flanker_conditions = [c for c in sample_df['flanker_condition'].unique() if pd.notna(c)]
-                return base_columns + create_stop_signal_dual_columns(flanker_conditions)
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'go_nogo' in task_name:
-            if sample_df is not None:
-                go_conditions = [c for c in sample_df['go_nogo_condition'].unique() if pd.notna(c) and c == 'go']
-                return base_columns + create_stop_signal_dual_columns(go_conditions, include_nogo_commission=True, include_nogo_metrics=True)
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'shape_matching' in task_name:
-            if sample_df is not None:
-                shape_conditions = [c for c in sample_df['shape_matching_condition'].unique() if pd.notna(c)]
-                return base_columns + create_stop_signal_dual_columns(shape_conditions)
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'directed_forgetting' in task_name:
-            if sample_df is not None:
-                df_conditions = [c for c in sample_df['directed_forgetting_condition'].unique() if pd.notna(c)]
-                return base_columns + create_stop_signal_dual_columns(df_conditions)
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'spatial_task_switching' in task_name:
-            if sample_df is not None:
-                spatial_conditions = [c for c in sample_df['task_switch'].unique() if pd.notna(c) and c != 'na']
-                cols = base_columns + create_stop_signal_dual_columns(spatial_conditions)
-                return cols
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'cued_task_switching' in task_name:
-            if sample_df is not None:
-                conditions = []
-                for cue_condition in sample_df['cue_condition'].unique():
-                    if pd.notna(cue_condition) and str(cue_condition).lower() != 'na':
-                        for task_condition in sample_df['task_condition'].unique():
-                            if pd.notna(task_condition) and str(task_condition).lower() != 'na':
-                                if cue_condition == "stay" and task_condition == "switch":
-                                    continue
-                                conditions.append(f"t{task_condition}_c{cue_condition}")
-                cols = base_columns + create_stop_signal_dual_columns(conditions)
-                return cols
-            return base_columns
-        elif ('stop_signal' in task_name or 'stopSignal' in task_name) and 'n_back' in task_name:
-            if sample_df is not None:
-                conditions = []
-                for n_back_condition in sample_df['n_back_condition'].unique():
-                    if pd.notna(n_back_condition):
-                        conditions.append(f"{n_back_condition}_collapsed")
-                        for delay in sample_df['delay'].unique():
-                            if pd.notna(delay):
-                                condition_name = f"{n_back_condition}_{delay}back"
-                                conditions.append(condition_name)
-                return base_columns + create_stop_signal_dual_columns(conditions)
-            # Fallback when no sample_df is provided during initialization
+    spec = get_task_spec(task_name)
+    if spec is None:
+        print(f"Unknown task: {task_name}")
+        return None
+
+    if spec.engine == 'stop_signal':
+        if not spec.is_dual:
+            return STOP_SIGNAL_COLUMNS.copy()
+        if sample_df is None:
             return base_columns
-        
-        # Handle regular dual tasks (non-stop signal)
-        elif 'directed_forgetting' in task_name and 'flanker' in task_name or 'directedForgetting' in task_name and 'flanker' in task_name:
-            conditions = create_dual_task_conditions(DIRECTED_FORGETTING_CONDITIONS, FLANKER_CONDITIONS)
-            return extend_metric_columns(base_columns, conditions)
-        elif 'flanker' in task_name and 'shape_matching' in task_name:
-            conditions = create_dual_task_conditions(FLANKER_CONDITIONS, SHAPE_MATCHING_CONDITIONS)
-            return extend_metric_columns(base_columns, conditions)
-        elif 'flanker' in task_name and 'go_nogo' in task_name:
-            conditions = create_dual_task_conditions(FLANKER_CONDITIONS, GO_NOGO_CONDITIONS)
-            return extend_go_nogo_metric_columns(base_columns, conditions)
-        elif 'directed_forgetting' in task_name and 'go_nogo' in task_name:
-            conditions = create_dual_task_conditions(DIRECTED_FORGETTING_CONDITIONS, GO_NOGO_CONDITIONS)
-            return extend_go_nogo_metric_columns(base_columns, conditions)
-        elif 'directed_forgetting' in task_name and 'shape_matching' in task_name or 'directedForgetting' in task_name and 'shape_matching' in task_name:
-            conditions = create_dual_task_conditions(DIRECTED_FORGETTING_CONDITIONS, SHAPE_MATCHING_CONDITIONS_WITH_DIRECTED_FORGETTING)
-            return extend_metric_columns(base_columns, conditions)
-        elif 'go_nogo' in task_name and 'shape_matching' in task_name:
-            conditions = create_dual_task_conditions(GO_NOGO_CONDITIONS, SHAPE_MATCHING_CONDITIONS)
-            return extend_go_nogo_metric_columns(base_columns, conditions)
-        elif 'directed_forgetting' in task_name and 'spatial_task_switching' in task_name or 'directedForgetting' in task_name and 'spatialTS' in task_name:
-            conditions = create_dual_task_conditions(SPATIAL_TASK_SWITCHING_CONDITIONS, DIRECTED_FORGETTING_CONDITIONS)
-            cols = extend_metric_columns(base_columns, conditions)
-            return cols
-        elif 'flanker' in task_name and 'spatial_task_switching' in task_name or 'flanker' in task_name and 'spatialTS' in task_name:
-            conditions = create_dual_task_conditions(SPATIAL_TASK_SWITCHING_CONDITIONS, FLANKER_CONDITIONS)
-            cols = extend_metric_columns(base_columns, conditions)
-            return cols
-        elif 'go_nogo' in task_name and 'spatial_task_switching' in task_name or 'go_nogo' in task_name and 'spatialTS' in task_name:
-            conditions = create_dual_task_conditions(SPATIAL_TASK_SWITCHING_CONDITIONS, GO_NOGO_CONDITIONS)
-            cols = extend_go_nogo_metric_columns(base_columns, conditions)
-            return cols
-        elif 'shape_matching' in task_name and 'spatial_task_switching' in task_name or 'shape_matching' in task_name and 'spatialTS' in task_name:
-            conditions = create_dual_task_conditions(SPATIAL_TASK_SWITCHING_CONDITIONS, SHAPE_MATCHING_CONDITIONS)
-            cols = extend_metric_columns(base_columns, conditions)
-            return cols
-        elif 'cued_task_switching' in task_name and 'spatial_task_switching' in task_name or 'CuedTS' in task_name and 'spatialTS' in task_name:
-            cols = extend_metric_columns(base_columns, SPATIAL_WITH_CUED_CONDITIONS)
-            return cols
-        elif 'flanker' in task_name and 'cued_task_switching' in task_name or 'flanker' in task_name and 'CuedTS' in task_name:
-            cols = extend_metric_columns(base_columns, FLANKER_WITH_CUED_CONDITIONS)
-            return cols
-        elif 'go_nogo' in task_name and 'cued_task_switching' in task_name or 'go_nogo' in task_name and 'CuedTS' in task_name:
-            cols = extend_go_nogo_metric_columns(base_columns, GO_NOGO_WITH_CUED_CONDITIONS)
-            return cols
-        elif 'shape_matching' in task_name and 'cued_task_switching' in task_name or 'shape_matching' in task_name and 'CuedTS' in task_name:
-            # Filter out conditions with 'new' in them
-            filtered_conditions = [c for c in SHAPE_MATCHING_WITH_CUED_CONDITIONS if 'new' not in c]
-            cols = extend_metric_columns(base_columns, filtered_conditions)
-            return cols
-        elif 'directed_forgetting' in task_name and 'cued_task_switching' in task_name or 'directedForgetting' in task_name and 'CuedTS' in task_name:
-            cols = extend_metric_columns(base_columns, CUED_TASK_SWITCHING_WITH_DIRECTED_FORGETTING_CONDITIONS)
-            return cols
-        elif 'go_nogo' in task_name and 'n_back' in task_name or 'go_nogo' in task_name and 'NBack' in task_name:
-            return get_dual_n_back_columns(base_columns, sample_df, 'go_nogo_condition', gonogo=True)
-        elif 'flanker' in task_name and 'n_back' in task_name or 'flanker' in task_name and 'NBack' in task_name:
-            return get_dual_n_back_columns(base_columns, sample_df, 'flanker_condition')
-        elif 'shape_matching' in task_name and 'n_back' in task_name or 'shape_matching' in task_name and 'NBack' in task_name:
-            return get_dual_n_back_columns(base_columns, sample_df, 'shape_matching_condition')
-        elif 'directed_forgetting' in task_name and 'n_back' in task_name or 'directedForgetting' in task_name and 'NBack' in task_name:
-            return get_dual_n_back_columns(base_columns, sample_df, 'directed_forgetting_condition')
-        elif 'n_back' in task_name and 'cued_task_switching' in task_name or 'NBack' in task_name and 'CuedTS' in task_name:
-            cols = get_dual_n_back_columns(base_columns, sample_df, cuedts=True)
-            return cols
-        elif 'n_back' in task_name and 'spatial_task_switching' in task_name or 'NBack' in task_name and 'spatialTS' in task_name:
-            cols = get_dual_n_back_columns(base_columns, sample_df, 'task_switch')
-            return cols
-    else:
-        if 'spatial_task_switching' in task_name or 'spatialTS' in task_name:
-            cols = extend_metric_columns(base_columns, SPATIAL_TASK_SWITCHING_CONDITIONS)
-            return cols
-        elif 'cued_task_switching' in task_name or 'cuedTS' in task_name:
-            cols = extend_metric_columns(base_columns, CUED_TASK_SWITCHING_CONDITIONS)
-            return cols
-        elif 'directed_forgetting' in task_name or 'directedForgetting' in task_name:
-            return extend_metric_columns(base_columns, DIRECTED_FORGETTING_CONDITIONS)
-        elif 'flanker' in task_name:
-            return extend_metric_columns(base_columns, FLANKER_CONDITIONS)
-        elif 'n_back' in task_name:
-            # For n-back, we need to get the columns from the data
-            if sample_df is not None:
-                conditions = [
-                    f"{n_back_condition}_{delay}back"
-                    for n_back_condition in sample_df['n_back_condition'].unique()
-                    for delay in sample_df['delay'].unique()
-                ]
-                return extend_metric_columns(base_columns, conditions)
-            return base_columns  # Return base columns if no sample data available
-        elif 'stop_signal' in task_name:
-            columns = [
-                'subject_id',
-                'go_rt',
-                'stop_fail_rt',
-                'go_acc',
-                'stop_fail_acc',
-                'stop_success',
-                'go_omission_rate',
-                'go_commission_rate',
-                'avg_ssd',
-                'min_ssd',
-                'max_ssd',
-                'min_ssd_count',
-                'max_ssd_count',
-                'ssrt'
-            ]
-            return columns
-        elif 'go_nogo' in task_name:
-            return extend_go_nogo_metric_columns(base_columns, GO_NOGO_CONDITIONS)
-        elif 'shape_matching' in task_name:
-            return extend_metric_columns(base_columns, SHAPE_MATCHING_CONDITIONS)
-        else:
-            print(f"Unknown task: {task_name}")
-            return None
+        paired_conditions = get_stop_signal_paired_conditions(sample_df, spec)
+        return base_columns + create_stop_signal_dual_columns(
+            paired_conditions, include_nogo_commission=spec.go_nogo_columns, include_nogo_metrics=spec.go_nogo_columns
+        )
+    if spec.engine == 'n_back':
+        return get_dual_n_back_columns(base_columns, sample_df, spec.paired_col, gonogo=spec.flags.get('gonogo', False), cuedts=spec.flags.get('cuedts', False))
 
-def is_dual_task(task_name):
-    """
-    Check if the task is a dual task by counting distinct task components.
-    
-    A dual task contains 2 or more distinct task components. Task components are:
-    - stop_signal
-    - go_nogo
-    - n_back
-    - flanker
-    - cued_task_switching
-    - spatial_task_switching
-    - shape_matching
-    - directed_forgetting
-    
-    This works for both predefined names (e.g., "flanker_with_cued_task_switching") 
-    and inferred names (e.g., "cued_task_switching_with_flanker").
-    """
-    # Define task components (order matters - check longer names first to avoid partial matches)
-    task_components = [
-        'cued_task_switching',
-        'spatial_task_switching',
-        'directed_forgetting',
-        'shape_matching',
-        'stop_signal',
-        'go_nogo',
-        'n_back',
-        'flanker'
-    ]
-    
-    # Count how many distinct task components appear in the task name
-    count = 0
-    for component in task_components:
-        if component in task_name:
-            count += 1
-    
-    return count >= 2
+    if spec.engine == 'conditions':
+        condition_lists = list(spec.conditions.values())
+        conditions = create_dual_task_conditions(*condition_lists) if spec.is_dual else condition_lists[0]
+    else:
+        conditions = spec.condition_list
+    if spec.go_nogo_columns:
+        return extend_go_nogo_metric_columns(base_columns, conditions)
+    return extend_metric_columns(base_columns, conditions)
 
-def extract_task_name_out_of_scanner(filename):
+def extract_task_name_fmri(filename):
     """
     Extract task name from filename using regex pattern.
     
@@ -436,86 +248,144 @@ def extract_task_name_out_of_scanner(filename):
     Returns:
         str: Extracted task name or None if pattern doesn't match
     """
-    match = re.match(r"s\d{2,}_(.*)\.csv", filename)
+    match = re.match(r"sub-s\d{2,}_ses-(.*)_task-(.*)_run-(.*)_events\.tsv", filename)
     if match:
-        return match.group(1)
+        return match.group(2)
     return None
 
-def extract_task_name_fmri(filename):
+# preprocess_rt_tail_cutoff moved to utils.trimmed_behavior_utils
+
+# Subject ids ('s03') and sessions ('ses-2' or '2') whose numbers str.extract can read directly
+SUBJECT_ID_PATTERN = r'^s(\d+)$'
+SESSION_PATTERN = r'^(?:ses-)?(\d+)$'
+
+def _subject_id_number(x):
+    # Only strings starting with 's' are numbered; everything else sorts last
+    return int(x.replace('s', '')) if isinstance(x, str) and x.startswith('s') else float('inf')
+
+def _session_number(x):
+    # Handle formats like "ses-1", "ses-11", "1", "11", etc.
+    if pd.isna(x) or x is None:
+        return float('inf')
+    x_str = str(x).strip()
+    try:
+        return int(x_str.replace('ses-', '') if x_str.startswith('ses-') else x_str)
+    except ValueError:
+        return float('inf')
+
+@functools.lru_cache(maxsize=256)
+def _parse_order_keys(values, session=False):
     """
-    Extract task name from filename using regex pattern.
-    
+    Parse distinct subject ids or sessions into numeric sort keys.
+
     Args:
-        filename (str): Name of the file
-        
+        values (tuple): Distinct non-missing values
+        session (bool): Parse sessions instead of subject ids
+
     Returns:
-        str: Extracted task name or None if pattern doesn't match
+        np.ndarray: Float key for each value (inf for values that sort last)
     """
-    match = re.match(r"sub-s\d{2,}_ses-(.*)_task-(.*)_run-(.*)_events\.tsv", filename)
-    if match:
-        return match.group(2)
-    return None
+    values = pd.Series(values, dtype=object)
+    if session:
+        text = values.astype(str).str.strip()
+    else:
+        text = values.where(values.map(lambda v: isinstance(v, str)))
+    keys = pd.to_numeric(text.str.extract(SESSION_PATTERN if session else SUBJECT_ID_PATTERN, expand=False)).to_numpy(dtype=float)
+    # Spellings the patterns miss keep the original int() parsing
+    parse = _session_number if session else _subject_id_number
+    for i in np.flatnonzero(np.isnan(keys)):
+        keys[i] = parse(values.iloc[i])
+    keys.flags.writeable = False
+    return keys
 
-def filter_to_test_trials(df, task_name):
+def get_subject_order_keys(df):
     """
-    Filter the dataframe to only include test trials.
-    
+    Get numeric sort keys for the subject_id (and session) columns.
+
+    Values are factorized first, so each distinct id is parsed once; missing
+    and unnumbered values get an infinite key and sort last.
+
     Args:
-        df (pd.DataFrame): Input dataframe
-        task_name (str): Name of the task
-        
+        df (pd.DataFrame): Table with a subject_id column and optionally session
+
     Returns:
-        pd.DataFrame: Filtered dataframe
-    """
-    if task_name == 'cued_task_switching_with_flanker':
-        # For in-scanner flanker+cued: include both test_trial and test_cue rows
-        # test_cue contains the stay/switch information needed for condition matching
-        if 'trial_id' in df.columns:
-            filtered = df[df['trial_id'].isin(['test_trial', 'test_cue'])]
-            return filtered if len(filtered) > 0 else df
-        return df
-    
-    if 'trial_id' in df.columns:
-        filtered = df[df['trial_id'] == 'test_trial']
-        # If filter removes everything (in-scanner may not label), fall back to original
-        return filtered if len(filtered) > 0 else df
-    return df
+        list: Key array for subject_id, plus one for session if the column exists
+    """
+    keys = []
+    for column in ['subject_id', 'session']:
+        if column not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[column])
+        # Code -1 (missing) picks the trailing inf
+        parsed = np.append(_parse_order_keys(tuple(uniques), column == 'session'), np.inf)
+        key = parsed[codes]
+        # Keep int keys when every value is numbered, as the sort has always used
+        keys.append(key.astype(np.int64) if np.isfinite(key).all() else key)
+    return keys
 
-# preprocess_rt_tail_cutoff moved to utils.trimmed_behavior_utils
+def get_row_order_key(subject_id, session=None):
+    """
+    Get the (subject, session) sort key of a single row.
+
+    Args:
+        subject_id (str): Subject identifier
+        session (str, optional): Session identifier
+
+    Returns:
+        tuple: Keys comparable with the rows of a table sorted by sort_subject_ids
+    """
+    subject_key = _parse_order_keys((subject_id,))[0] if pd.notna(subject_id) else np.inf
+    session_key = _parse_order_keys((session,), True)[0] if session is not None and pd.notna(session) else np.inf
+    return subject_key, session_key
 
 def sort_subject_ids(df):
-    # Only process rows where subject_id is a string starting with 's'
-    df = df.copy()
-    df['subject_id_numeric'] = df['subject_id'].apply(
-        lambda x: int(x.replace('s', '')) if isinstance(x, str) and x.startswith('s') else float('inf')
-    )
-    
-    # If session column exists, extract numeric session value for sorting
-    if 'session' in df.columns:
-        def extract_session_numeric(x):
-            if pd.isna(x) or x is None:
-                return float('inf')
-            # Handle formats like "ses-1", "ses-11", "1", "11", etc.
-            x_str = str(x).strip()
-            if x_str.startswith('ses-'):
-                try:
-                    return int(x_str.replace('ses-', ''))
-                except ValueError:
-                    return float('inf')
-            else:
-                try:
-                    return int(x_str)
-                except ValueError:
-                    return float('inf')
-        
-        df['session_numeric'] = df['session'].apply(extract_session_numeric)
-        df = df.sort_values(by=['subject_id_numeric', 'session_numeric'], ascending=True)
-        df = df.drop(columns=['subject_id_numeric', 'session_numeric'])
+    """
+    Sort a table by numeric subject id, then numeric session if present.
+
+    Args:
+        df (pd.DataFrame): Table with a subject_id column
+
+    Returns:
+        pd.DataFrame: Sorted copy; rows keep their index labels
+    """
+    keys = get_subject_order_keys(df)
+    if len(keys) == 2:
+        order = np.lexsort((keys[1], keys[0]))
     else:
-        df = df.sort_values(by='subject_id_numeric', ascending=True)
-        df = df.drop(columns=['subject_id_numeric'])
-    
-    return df
+        order = np.argsort(keys[0], kind='stable')
+    return df.iloc[order]
+
+def insert_sorted_row(df, new_row):
+    """
+    Insert rows into a table already sorted by sort_subject_ids.
+
+    The insert position is found by binary search on the sort keys, after the
+    rows with equal keys. Tables that are not sorted are fully re-sorted.
+
+    Args:
+        df (pd.DataFrame): Sorted table
+        new_row (pd.DataFrame): One-row table with the same columns
+
+    Returns:
+        pd.DataFrame: Table with the row inserted, with a fresh RangeIndex
+    """
+    keys = get_subject_order_keys(df)
+    if len(keys) == 2:
+        subject_key, session_key = keys
+        ordered = np.all((subject_key[:-1] < subject_key[1:]) | ((subject_key[:-1] == subject_key[1:]) & (session_key[:-1] <= session_key[1:])))
+    else:
+        subject_key, session_key = keys[0], None
+        ordered = np.all(subject_key[:-1] <= subject_key[1:])
+    if not ordered or len(new_row) != 1:
+        return sort_subject_ids(pd.concat([df, new_row], ignore_index=True)).reset_index(drop=True)
+    row_subject, row_session = get_row_order_key(
+        new_row['subject_id'].iloc[0], new_row['session'].iloc[0] if session_key is not None else None
+    )
+    pos = np.searchsorted(subject_key, row_subject, side='right')
+    if session_key is not None:
+        lo = np.searchsorted(subject_key, row_subject, side='left')
+        pos = lo + np.searchsorted(session_key[lo:pos], row_session, side='right')
+    return pd.concat([df.iloc[:pos], new_row, df.iloc[pos:]], ignore_index=True)
 
 def update_qc_csv(output_path, task_name, subject_id, metrics, session=None):
     qc_file = output_path / f"{task_name}_qc.csv"
@@ -547,14 +417,185 @@ def update_qc_csv(output_path, task_name, subject_id, metrics, session=None):
                 elif pd.api.types.is_string_dtype(df[col]):
                     new_row[col] = new_row[col].astype(str)
         
-        df = pd.concat([df, new_row], ignore_index=True)
-        df = sort_subject_ids(df)
+        df = insert_sorted_row(df, new_row)
         # Remove columns with 'new' in their name before saving
         df = df.loc[:, ~df.columns.str.contains('new', case=False)]
         df.to_csv(qc_file, index=False)
     except FileNotFoundError:
         print(f"Warning: QC file {qc_file} not found")
 
+def build_qc_schemas(tasks, rows, include_session: bool = False):
+    """
+    Compute the final column layout of every task's QC table in one pass.
+
+    Starts from get_task_columns and appends the metric keys of every distinct
+    row layout (inserting session after subject_id if any row has one), the
+    same rule update_qc_csv applies per insert. Layouts are merged with the
+    most complete first, ties broken by key names, so the column order only
+    depends on which layouts occur and not on which subject comes first. This
+    way the data-dependent columns of the whole dataset (stop signal dual
+    conditions, n-back delays, cue x task cells) are known before any row is
+    written.
+
+    Args:
+        tasks (list): List of task names
+        rows (iterable): (task_name, metrics, session) for each row, in any order
+        include_session (bool): Whether tables start with a session column
+
+    Returns:
+        dict: Task name -> tuple of column names
+    """
+    layouts = {task: set() for task in tasks}
+    for task_name, metrics, session in rows:
+        if task_name in layouts:
+            layouts[task_name].add((session is not None, tuple(metrics)))
+    schemas = {}
+    for task, task_layouts in layouts.items():
+        task_columns = get_task_columns(task, include_session=include_session)
+        task_columns = list(task_columns) if task_columns is not None else []
+        has_session = any(session for session, _ in task_layouts)
+        if has_session and 'session' not in task_columns:
+            task_columns.insert(1, 'session')
+        known = set(task_columns)
+        metric_layouts = {keys for _, keys in task_layouts}
+        for keys in sorted(metric_layouts, key=lambda k: (-len(k), k)):
+            for key in keys:
+                if key not in known:
+                    task_columns.append(key)
+                    known.add(key)
+        schemas[task] = tuple(task_columns)
+    return schemas
+
+class QCTableBuilder:
+    """
+    Collect per-file QC rows in memory and build each task's QC table once.
+
+    Replaces repeated update_qc_csv calls (read, append one row, sort, rewrite)
+    with a single schema alignment and write per task. Rows are kept in
+    sort_subject_ids order as they are added (binary search on their sort
+    keys), so building a table never re-sorts it. Column order follows the
+    same rules as update_qc_csv: the initial task columns, then any new metric
+    keys in the order they are first seen. With schemas from build_qc_schemas
+    the layout is fixed up front and each row is stored by column position.
+    """
+
+    def __init__(self, tasks, include_session: bool = False, schemas=None):
+        """
+        Args:
+            tasks (list): List of task names
+            include_session (bool): Whether tables start with a session column
+            schemas (dict, optional): build_qc_schemas output covering the rows
+                that will be added
+        """
+        self.include_session = include_session
+        self._columns = {}
+        self._positions = {}
+        self._rows = {}
+        self._keys = {}
+        for task in tasks:
+            if schemas is not None and task in schemas:
+                columns = schemas[task]
+            else:
+                columns = get_task_columns(task, include_session=include_session)
+            self._columns[task] = list(columns) if columns is not None else []
+            self._positions[task] = {}
+            self._rows[task] = []
+            self._keys[task] = []
+
+    @property
+    def tasks(self):
+        return list(self._rows.keys())
+
+    def columns(self, task_name):
+        """Current column layout of a task table (before dropping 'new' columns)."""
+        return list(self._columns[task_name])
+
+    def _get_positions(self, task_name, layout):
+        """Column positions for a row layout, extending the task's columns if needed."""
+        positions = self._positions[task_name].get(layout)
+        if positions is None:
+            columns = self._columns[task_name]
+            if 'session' in layout and 'session' not in columns:
+                columns.insert(1, 'session')
+                # Positions cached before the insert are now off by one
+                self._positions[task_name].clear()
+            known = set(columns)
+            for key in layout:
+                if key not in known:
+                    columns.append(key)
+                    known.add(key)
+            index = {column: i for i, column in enumerate(columns)}
+            positions = [index[key] for key in layout]
+            self._positions[task_name][layout] = positions
+        return positions
+
+    def add_row(self, task_name, subject_id, metrics, session=None):
+        """
+        Add one subject/session row of metrics to a task table.
+
+        Args:
+            task_name (str): Name of the task
+            subject_id (str): Subject identifier
+            metrics (dict): Metrics for the row
+            session (str, optional): Session identifier (fMRI mode)
+        """
+        if task_name not in self._rows:
+            print(f"Warning: QC table for {task_name} not initialized")
+            return
+        if session is not None:
+            layout = ('subject_id', 'session', *metrics)
+            values = (subject_id, session, *metrics.values())
+        else:
+            layout = ('subject_id', *metrics)
+            values = (subject_id, *metrics.values())
+        # Registers any columns not in the layout yet, as update_qc_csv would
+        self._get_positions(task_name, layout)
+        # Insert after rows with equal keys, matching the stable (subject, session) sort
+        key = get_row_order_key(subject_id, session)
+        pos = bisect.bisect_right(self._keys[task_name], key)
+        self._keys[task_name].insert(pos, key)
+        self._rows[task_name].insert(pos, (layout, values))
+
+    def build(self, task_name):
+        """
+        Build the sorted QC table for a task.
+
+        Args:
+            task_name (str): Name of the task
+
+        Returns:
+            pd.DataFrame: QC table with one row per added subject/session
+        """
+        columns = self._columns[task_name]
+        rows = self._rows[task_name]
+        if rows:
+            table = np.full((len(rows), len(columns)), np.nan, dtype=object)
+            for i, (layout, values) in enumerate(rows):
+                table[i, self._get_positions(task_name, layout)] = values
+            df = pd.DataFrame(table, columns=columns)
+        else:
+            df = pd.DataFrame(columns=columns)
+        df = df.infer_objects()
+        if len(df) > 0:
+            # Remove columns with 'new' in their name (matches update_qc_csv)
+            df = df.loc[:, ~df.columns.str.contains('new', case=False)]
+        return df.reset_index(drop=True)
+
+    def write(self, task_name, output_path):
+        """
+        Build a task's QC table and write it to {task_name}_qc.csv.
+
+        Args:
+            task_name (str): Name of the task
+            output_path (Path): Folder to save the QC CSV in
+
+        Returns:
+            pd.DataFrame: The table that was written
+        """
+        df = self.build(task_name)
+        df.to_csv(output_path / f"{task_name}_qc.csv", index=False)
+        return df
+
 def calculate_acc(df, mask_acc):
     """
     Calculate acc for given mask.
@@ -567,7 +608,7 @@ def calculate_acc(df, mask_acc):
         float: acc (mean of correct_trial)
     """
     correct_col = 'correct_trial' if 'correct_trial' in df.columns else 'correct'
-    return df[mask_acc][correct_col].mean() if len(df[mask_acc]) > 0 else np.nan
+    return mean_by_code(mask_codes(mask_acc, df.index), as_float_array(df[correct_col]), 2)[1]
 
 def calculate_rt(df, mask_rt):
     """
@@ -580,7 +621,7 @@ def calculate_rt(df, mask_rt):
     Returns:
         float: Mean reaction time
     """
-    return df[mask_rt]['rt'].mean() if len(df[mask_rt]) > 0 else np.nan
+    return mean_by_code(mask_codes(mask_rt, df.index), as_float_array(df['rt']), 2)[1]
 
 def calculate_omission_rate(df, mask_omission, total_num_trials):
     """
@@ -594,7 +635,7 @@ def calculate_omission_rate(df, mask_omission, total_num_trials):
     Returns:
         float: Omission rate
     """
-    num_omissions = len(df[mask_omission])
+    num_omissions = count_by_code(mask_codes(mask_omission, df.index), 2)[1]
     return num_omissions / total_num_trials if total_num_trials > 0 else np.nan
 
 def calculate_commission_rate(df, mask_commission, total_num_trials):
@@ -609,9 +650,42 @@ def calculate_commission_rate(df, mask_commission, total_num_trials):
     Returns:
         float: Commission rate
     """
-    num_commissions = len(df[mask_commission])
+    num_commissions = count_by_code(mask_codes(mask_commission, df.index), 2)[1]
     return num_commissions / total_num_trials if total_num_trials > 0 else np.nan
 
+def normalize_condition_columns(df, columns, lowercase=True, strip=False):
+    """
+    Build string-normalized categorical views of condition columns.
+    
+    Each column is factorized once and only its distinct values are converted
+    (str(x), optionally lower-cased/stripped), so masks built from the result
+    compare integer codes instead of re-stringifying the column per condition.
+    Missing values normalize to 'nan'. Columns not in df are skipped, so using
+    them still raises KeyError.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        columns (list): Condition column names
+        lowercase (bool): Lower-case labels, as str(x).lower()
+        strip (bool): Strip surrounding whitespace from labels
+        
+    Returns:
+        pd.DataFrame: Categorical columns on df's index
+    """
+    normalized = {}
+    for column in columns:
+        if column not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=False)
+        labels = pd.Index(uniques, dtype=object).map(str)
+        if lowercase:
+            labels = labels.str.lower()
+        if strip:
+            labels = labels.str.strip()
+        label_codes, categories = pd.factorize(labels)
+        normalized[column] = pd.Categorical.from_codes(label_codes[codes], categories=categories)
+    return pd.DataFrame(normalized, index=df.index)
+
 def add_category_accuracies(df, column_name, label_to_metric_key, metrics, stopsignal=False, cuedts=False, gonogo=False):
     """
     Add acc metrics aggregated over all trials for specified category labels.
@@ -627,7 +701,7 @@ def add_category_accuracies(df, column_name, label_to_metric_key, metrics, stops
     """
     if column_name not in df.columns:
         return
-    series = df[column_name].apply(lambda x: str(x).lower())
+    series = normalize_condition_columns(df, [column_name])[column_name]
     for label, metric_key in label_to_metric_key.items():
         mask = series == label
         if stopsignal:
@@ -639,7 +713,26 @@ def add_category_accuracies(df, column_name, label_to_metric_key, metrics, stops
         else:
             metrics[metric_key] = calculate_acc(df, mask)
 
-def calculate_basic_metrics(df, mask_acc, cond_name, metrics_dict, cued_with_flanker_in_scanner=False):
+def align_next_trial_responses(df, correct_col='correct'):
+    """
+    Pair each row with the response columns of the row after it.
+    
+    In-scanner cued+flanker files log the cue and task condition on the test_cue
+    row and the response on the following test_trial row. The last row has no
+    successor and gets NaN; missing rt/key_press columns are all NaN.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        correct_col (str): Column holding trial correctness
+        
+    Returns:
+        pd.DataFrame: Float columns correct_col, 'rt' and 'key_press' on df's index
+    """
+    if correct_col not in df.columns:
+        raise KeyError(correct_col)
+    return df.reindex(columns=[correct_col, 'rt', 'key_press']).astype(float).shift(-1)
+
+def calculate_basic_metrics(df, mask_acc, cond_name, metrics_dict, cued_with_flanker_in_scanner=False, next_trial=None):
     """
     Calculate all basic metrics (acc, RT, omission rate, commission rate) for a condition.
     
@@ -648,6 +741,8 @@ def calculate_basic_metrics(df, mask_acc, cond_name, metrics_dict, cued_with_fla
         mask_acc (pd.Series): Boolean mask for accuracy calculation
         cond_name (str): Condition name for metric keys
         metrics_dict (dict): Dictionary to store metrics
+        cued_with_flanker_in_scanner (bool): Read responses from the next row
+        next_trial (pd.DataFrame | None): Output of align_next_trial_responses, built here if not given
         
     Returns:
         None: Updates metrics_dict in place
@@ -657,39 +752,21 @@ def calculate_basic_metrics(df, mask_acc, cond_name, metrics_dict, cued_with_fla
     
     if cued_with_flanker_in_scanner:
         # For cued+flanker: task_condition and cue_condition are on row N, but correct/key_press/rt are on row N+1
-        # We need to map each condition row index to the values from the next row position
-        idx_list = list(df.index)
-        correct_series = pd.Series(index=df.index, dtype=float)
-        rt_series = pd.Series(index=df.index, dtype=float)
-        key_press_series = pd.Series(index=df.index, dtype=float)
-        
-        # Map each index to the next row's values
-        for i, current_idx in enumerate(idx_list):
-            if i + 1 < len(idx_list):
-                next_idx = idx_list[i + 1]
-                correct_series.loc[current_idx] = df[correct_col].loc[next_idx]
-                if 'rt' in df.columns:
-                    rt_series.loc[current_idx] = df['rt'].loc[next_idx]
-                else:
-                    rt_series.loc[current_idx] = np.nan
-                if 'key_press' in df.columns:
-                    key_press_series.loc[current_idx] = df['key_press'].loc[next_idx]
-                else:
-                    key_press_series.loc[current_idx] = np.nan
-            else:
-                correct_series.loc[current_idx] = np.nan
-                rt_series.loc[current_idx] = np.nan
-                key_press_series.loc[current_idx] = np.nan
+        if next_trial is None:
+            next_trial = align_next_trial_responses(df, correct_col)
+        correct_series = next_trial[correct_col]
+        rt_series = next_trial['rt']
+        key_press_series = next_trial['key_press']
         
         # Create masks using the shifted correct values
         correct_mask = correct_series == 1
         mask_rt = mask_acc & correct_mask & (rt_series.notna()) & (rt_series > 0)
         
         # Calculate accuracy using shifted correct values
-        acc_value = correct_series[mask_acc].mean() if mask_acc.sum() > 0 else np.nan
+        acc_value = mean_by_code(mask_codes(mask_acc, df.index), as_float_array(correct_series), 2)[1]
         
         # Calculate RT using shifted RT values
-        rt_value = rt_series[mask_rt].mean() if mask_rt.sum() > 0 else np.nan
+        rt_value = mean_by_code(mask_codes(mask_rt, df.index), as_float_array(rt_series), 2)[1]
         
         # Calculate omission rate using shifted key_press values
         mask_omission = mask_acc & (key_press_series == -1)
@@ -724,7 +801,8 @@ def calculate_go_nogo_metrics(df, mask_acc, cond_name, metrics_dict, response_eq
     For go: calculate all metrics normally.
     
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Test trials; a TrialTable shares its
+            numeric key_press/correct_response and omission mask across conditions
         mask_acc (pd.Series): Boolean mask for acc calculation
         cond_name (str): Condition name for metric keys
         metrics_dict (dict): Dictionary to store metrics
@@ -732,18 +810,18 @@ def calculate_go_nogo_metrics(df, mask_acc, cond_name, metrics_dict, response_eq
     Returns:
         None: Updates metrics_dict in place
     """
+    trials = as_trial_table(df)
+    df = trials.test_trials
     # Check if this is a nogo condition
     is_nogo = cond_name.endswith('_nogo') or 'nogo' in cond_name or cond_name == 'nogo'
     
     if is_nogo:
         # For nogo: only calculate RT for commission errors (incorrect responses)
-        mask_rt = mask_acc & (df['key_press'] != -1)
+        mask_rt = mask_acc & ~trials.omission_mask
         # For in-scanner nogo, use response equality like go conditions
         if response_equality and {'correct_response','key_press'}.issubset(df.columns):
-            # Coerce both to numeric for comparison, handling NaN
-            kp = pd.to_numeric(df['key_press'], errors='coerce')
-            cr = pd.to_numeric(df['correct_response'], errors='coerce')
-            eq_series = (kp == cr).astype(int)
+            # Both coerced to numeric for comparison, handling NaN
+            eq_series = (trials.numeric('key_press') == trials.numeric('correct_response')).astype(int)
             metrics_dict[f'{cond_name}_acc'] = eq_series[mask_acc].mean() if len(df[mask_acc]) > 0 else np.nan
         else:
             metrics_dict[f'{cond_name}_acc'] = calculate_acc(df, mask_acc)
@@ -752,26 +830,73 @@ def calculate_go_nogo_metrics(df, mask_acc, cond_name, metrics_dict, response_eq
     else:
         # For go: calculate all metrics
         if response_equality and {'correct_response','key_press'}.issubset(df.columns):
-            # Coerce both to numeric for comparison, handling NaN
-            kp = pd.to_numeric(df['key_press'], errors='coerce')
-            cr = pd.to_numeric(df['correct_response'], errors='coerce')
-            eq_series = (kp == cr).astype(int)
+            # Both coerced to numeric for comparison, handling NaN
+            eq_series = (trials.numeric('key_press') == trials.numeric('correct_response')).astype(int)
             mask_rt = mask_acc & (eq_series == 1)
-            mask_omission = mask_acc & (df['key_press'] == -1)
+            mask_omission = mask_acc & trials.omission_mask
             # Commission: responded but incorrect (eq_series == 0 means incorrect)
-            mask_commission = mask_acc & (df['key_press'] != -1) & (eq_series == 0) & eq_series.notna()
+            mask_commission = mask_acc & ~trials.omission_mask & (eq_series == 0) & eq_series.notna()
             metrics_dict[f'{cond_name}_acc'] = eq_series[mask_acc].mean() if len(df[mask_acc]) > 0 else np.nan
         else:
             correct_col = 'correct_trial' if 'correct_trial' in df.columns else 'correct'
             mask_rt = mask_acc & (df[correct_col] == 1)
-            mask_omission = mask_acc & (df['key_press'] == -1)
-            mask_commission = mask_acc & (df['key_press'] != -1) & (df[correct_col] == 0)
+            mask_omission = mask_acc & trials.omission_mask
+            mask_commission = mask_acc & ~trials.omission_mask & (df[correct_col] == 0)
             metrics_dict[f'{cond_name}_acc'] = calculate_acc(df, mask_acc)
         total_num_trials = len(df[mask_acc])
         metrics_dict[f'{cond_name}_rt'] = calculate_rt(df, mask_rt)
         metrics_dict[f'{cond_name}_omission_rate'] = calculate_omission_rate(df, mask_omission, total_num_trials)
         metrics_dict[f'{cond_name}_commission_rate'] = calculate_commission_rate(df, mask_commission, total_num_trials)
 
+def aggregate_trial_counts(df, groups, n_groups, correct_col, gonogo=False):
+    """
+    Sum the per-trial counts behind the basic and go/nogo metrics for each group.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        groups (np.ndarray): Group code in [0, n_groups) for each row
+        n_groups (int): Number of groups
+        correct_col (str): Column holding trial correctness
+        gonogo (bool): Count commissions as calculate_go_nogo_metrics does (correct == 0)
+            instead of calculate_basic_metrics (correct != 1)
+        
+    Returns:
+        dict: Count/sum name -> float array of length n_groups
+    """
+    return trial_sums_by_code(
+        groups,
+        n_groups,
+        as_float_array(df[correct_col]),
+        as_float_array(df['rt']),
+        df['key_press'].to_numpy(),
+        gonogo,
+    )
+
+def add_cell_metrics(metrics_dict, cond_name, cell, gonogo=False):
+    """
+    Add one condition cell's metrics from its aggregated counts.
+    
+    Keys and values match calculate_basic_metrics (or calculate_go_nogo_metrics
+    with gonogo=True) applied to the cell's rows.
+    
+    Args:
+        metrics_dict (dict): Dictionary to store metrics
+        cond_name (str): Condition name for metric keys
+        cell (dict): Totals for the cell, keyed like aggregate_trial_counts
+        gonogo (bool): Whether this is a go_nogo task
+    """
+    def ratio(numerator, denominator):
+        return numerator / denominator if denominator > 0 else np.nan
+    
+    metrics_dict[f'{cond_name}_acc'] = ratio(cell['correct_sum'], cell['correct_count'])
+    if gonogo and (cond_name.endswith('_nogo') or 'nogo' in cond_name or cond_name == 'nogo'):
+        # For nogo: RT of responses only, no omission/commission rates
+        metrics_dict[f'{cond_name}_rt'] = ratio(cell['nogo_rt_sum'], cell['nogo_rt_count'])
+        return
+    metrics_dict[f'{cond_name}_rt'] = ratio(cell['rt_sum'], cell['rt_count'])
+    metrics_dict[f'{cond_name}_omission_rate'] = ratio(cell['omissions'], cell['n'])
+    metrics_dict[f'{cond_name}_commission_rate'] = ratio(cell['commissions'], cell['n'])
+
 def compute_cued_task_switching_metrics(
     df,
     condition_list,
@@ -784,12 +909,22 @@ def compute_cued_task_switching_metrics(
 ):
     """
     Compute metrics for cued task switching and its duals (flanker/go_nogo).
+    - df: test trials (DataFrame or TrialTable)
     - condition_list: list of condition strings (e.g., FLANKER_WITH_CUED_CONDITIONS, GO_NOGO_WITH_CUED_CONDITIONS, or CUED_TASK_SWITCHING_CONDITIONS)
     - condition_type: 'single', 'flanker', or 'go_nogo'
     - flanker_col: column name for flanker (if dual)
     - go_nogo_col: column name for go_nogo (if dual)
     """
+    trials = as_trial_table(df)
+    df = trials.test_trials
     metrics = {}
+    next_trial = None
+    # Normalize every condition column once; each mask below is then a code comparison
+    paired_cols = [col for col in (flanker_col, go_nogo_col, directed_forgetting_col) if col is not None]
+    normalized = normalize_condition_columns(df, ['task_condition', 'cue_condition'] + paired_cols)
+    if shape_matching_col in df.columns:
+        # Shape matching labels are compared case-sensitively
+        normalized[shape_matching_col] = normalize_condition_columns(df, [shape_matching_col], lowercase=False)[shape_matching_col]
     for cond in condition_list:
         try:
             if condition_type == 'single':
@@ -798,20 +933,24 @@ def compute_cued_task_switching_metrics(
                     continue
                 task = cond[1:cond.index('_c')]
                 cue = cond[cond.index('_c')+2:]
-                mask_acc = (df['task_condition'].apply(lambda x: str(x).lower()) == task) & \
-                           (df['cue_condition'].apply(lambda x: str(x).lower()) == cue)
+                mask_acc = (normalized['task_condition'] == task) & \
+                           (normalized['cue_condition'] == cue)
                 calculate_basic_metrics(df, mask_acc, cond, metrics)
             elif condition_type == 'flanker':
                 # cond format: {flanker}_t{task}_c{cue}
                 flanker, t_part = cond.split('_t')
                 task, cue = t_part.split('_c')
                 mask_acc = (
-                    df[flanker_col].str.contains(flanker, case=False, na=False) &
-                    (df['task_condition'].apply(lambda x: str(x).lower()) == task) &
-                    (df['cue_condition'].apply(lambda x: str(x).lower()) == cue)
+                    normalized[flanker_col].str.contains(flanker, case=False, na=False) &
+                    (normalized['task_condition'] == task) &
+                    (normalized['cue_condition'] == cue)
                 )
                 if in_scanner:
-                    calculate_basic_metrics(df, mask_acc, cond, metrics, cued_with_flanker_in_scanner=True)
+                    # Shared by every condition: the response sits on the row after the cue
+                    if next_trial is None:
+                        next_trial = align_next_trial_responses(df)
+                    calculate_basic_metrics(df, mask_acc, cond, metrics, cued_with_flanker_in_scanner=True,
+                                            next_trial=next_trial)
                 else:
                     calculate_basic_metrics(df, mask_acc, cond, metrics)
             elif condition_type == 'go_nogo':
@@ -819,19 +958,19 @@ def compute_cued_task_switching_metrics(
                 go_nogo, t_part = cond.split('_t')
                 task, cue = t_part.split('_c')
                 mask_acc = (
-                    (df[go_nogo_col].apply(lambda x: str(x).lower()) == go_nogo) &
-                    (df['task_condition'].apply(lambda x: str(x).lower()) == task) &
-                    (df['cue_condition'].apply(lambda x: str(x).lower()) == cue)
+                    (normalized[go_nogo_col] == go_nogo) &
+                    (normalized['task_condition'] == task) &
+                    (normalized['cue_condition'] == cue)
                 )
-                calculate_go_nogo_metrics(df, mask_acc, cond, metrics)
+                calculate_go_nogo_metrics(trials, mask_acc, cond, metrics)
             elif condition_type == 'shape_matching':
                 # cond format: {shape_matching}_t{task}_c{cue}
                 shape_matching, t_part = cond.split('_t')
                 task, cue = t_part.split('_c')
                 mask_acc = (
-                    (df[shape_matching_col].apply(lambda x: str(x)) == shape_matching) &
-                    (df['task_condition'].apply(lambda x: str(x).lower()) == task) &
-                    (df['cue_condition'].apply(lambda x: str(x).lower()) == cue)
+                    (normalized[shape_matching_col] == shape_matching) &
+                    (normalized['task_condition'] == task) &
+                    (normalized['cue_condition'] == cue)
                 )
                 calculate_basic_metrics(df, mask_acc, cond, metrics)
             elif condition_type == 'directed_forgetting':
@@ -839,9 +978,9 @@ def compute_cued_task_switching_metrics(
                 directed_forgetting, t_part = cond.split('_t')
                 task, cue = t_part.split('_c')
                 mask_acc = (
-                    (df[directed_forgetting_col].apply(lambda x: str(x).lower()) == directed_forgetting) &
-                    (df['task_condition'].apply(lambda x: str(x).lower()) == task) &
-                    (df['cue_condition'].apply(lambda x: str(x).lower()) == cue)
+                    (normalized[directed_forgetting_col] == directed_forgetting) &
+                    (normalized['task_condition'] == task) &
+                    (normalized['cue_condition'] == cue)
                 )
                 calculate_basic_metrics(df, mask_acc, cond, metrics)
         except Exception as e:
@@ -878,9 +1017,116 @@ def compute_cued_task_switching_metrics(
         )
     return metrics
 
+def get_n_back_paired_column(df, paired_task_col):
+    """
+    Get the column holding the paired condition of a dual n-back task.
+    
+    In-scanner n-back + spatial task switching files carry the paired condition
+    in task_switch_condition rather than task_switch.
+    """
+    if paired_task_col == 'task_switch' and 'task_switch_condition' in df.columns:
+        return 'task_switch_condition'
+    return paired_task_col
+
+def get_n_back_paired_conditions(df, paired_task_col):
+    """
+    Get the paired task conditions present in a dual n-back file.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        paired_task_col (str): Column name for the paired task
+        
+    Returns:
+        list: Non-missing paired conditions in order of appearance ('na' is
+        dropped for spatial task switching)
+    """
+    column = get_n_back_paired_column(df, paired_task_col)
+    spatialts = column in ('task_switch', 'task_switch_condition')
+    return [c for c in df[column].unique() if pd.notna(c) and not (spatialts and c == 'na')]
+
+def n_back_cell_name(n_back_condition, delay, paired_cond, shapematching=False):
+    """Name of a dual n-back cell, e.g. 'match_2.0back_congruent'."""
+    if shapematching:
+        return f"n_back_{n_back_condition}_{delay}back_shape_matching_{paired_cond.lower()}"
+    return f"{n_back_condition}_{delay}back_{paired_cond.lower()}"
+
+def get_n_back_cells(df, paired_task_col=None, paired_conditions=None, cuedts=False, gonogo=False, shapematching=False):
+    """
+    Lay out the condition cells of an n-back task.
+    
+    A cell is one (n_back_condition, delay) combination, further split by cue and
+    task condition for cued task switching or by paired condition for other
+    duals. compute_n_back_metrics reports cells in this order and
+    get_dual_n_back_columns names its columns from the same layout.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        paired_task_col (str): Column name for the paired task (if dual)
+        paired_conditions (list): Paired task conditions (if dual)
+        cuedts (bool): Split by cue_condition and task_condition
+        gonogo (bool): Paired task is go_nogo
+        shapematching (bool): Paired task is shape matching (cells get n_back_/shape_matching_ prefixes)
+        
+    Returns:
+        tuple: (keys, cells) where keys is a list of per-trial key Series and cells
+        a list of (cond_name, values) with one key value per key; a trial belongs
+        to a cell when all of its keys equal the cell's values
+    """
+    n_back_key = df['n_back_condition'].str.lower()
+    n_back_conditions = [c for c in n_back_key.unique() if pd.notna(c)]
+    delays = list(df['delay'].unique())
+    if cuedts:
+        cue_conditions = [c for c in df['cue_condition'].unique() if pd.notna(c) and str(c).lower() != 'na']
+        task_conditions = [t for t in df['task_condition'].unique() if pd.notna(t) and str(t).lower() != 'na']
+        keys = [n_back_key, df['delay'], df['cue_condition'], df['task_condition']]
+        cells = [
+            (f"{n_back_condition}_{delay}back_t{taskc}_c{cue}", (n_back_condition, delay, cue, taskc))
+            for n_back_condition in n_back_conditions
+            for delay in delays if pd.notna(delay)
+            for cue in cue_conditions
+            for taskc in task_conditions
+            if not (cue == "stay" and taskc == "switch")
+        ]
+    elif gonogo:
+        keys = [n_back_key, df['delay'], df[paired_task_col].str.lower()]
+        cells = [
+            (f"{n_back_condition}_{delay}back_{paired_condition}", (n_back_condition, delay, paired_condition.lower()))
+            for n_back_condition in n_back_conditions
+            for delay in delays
+            for paired_condition in (paired_conditions or [])
+        ]
+    elif paired_task_col is None:
+        keys = [n_back_key, df['delay']]
+        cells = [
+            (f"{n_back_condition}_{delay}back", (n_back_condition, delay))
+            for n_back_condition in n_back_conditions
+            for delay in delays if pd.notna(delay)
+        ]
+    else:
+        paired_key = df[get_n_back_paired_column(df, paired_task_col)].astype(str).str.lower()
+        keys = [n_back_key, df['delay'], paired_key]
+        cells = [
+            (n_back_cell_name(n_back_condition, delay, paired_cond, shapematching), (n_back_condition, delay, paired_cond.lower()))
+            for n_back_condition in n_back_conditions
+            for delay in delays if pd.notna(delay)
+            for paired_cond in (paired_conditions or [])
+        ]
+    return keys, cells
+
+def n_back_overall_acc_keys():
+    """Keys of the match/mismatch accuracies collapsed over paired conditions, as (key, n_back_condition, delay)."""
+    return [
+        (f'overall_{kind}_{load}.0back_acc', kind, f'{load}.0')
+        for load in [1, 2]
+        for kind in ['match', 'mismatch']
+    ]
+
 def compute_n_back_metrics(df, condition_list, paired_task_col=None, paired_conditions=None, cuedts=False, gonogo=False, shapematching=False, spatialts=False):
     """
     Compute metrics for n-back tasks (single, dual, or n-back with cuedts).
+    
+    Every cell from get_n_back_cells is computed from one aggregation: trials are
+    grouped on the cell keys once and each cell reads its group's totals.
     - df: DataFrame
     - condition_list: list of n-back conditions (e.g., ['0', '2']) or list of tuples for duals
     - paired_task_col: column name for the paired task (if dual)
@@ -892,27 +1138,32 @@ def compute_n_back_metrics(df, condition_list, paired_task_col=None, paired_cond
     Returns: dict of metrics
     """
     metrics = {}
+    keys, cells = get_n_back_cells(df, paired_task_col, paired_conditions, cuedts=cuedts, gonogo=gonogo, shapematching=shapematching)
+    if cells:
+        key_codes = []
+        key_values = []
+        for key in keys:
+            codes, uniques = pd.factorize(key, use_na_sentinel=False)
+            key_codes.append(codes)
+            key_values.append(pd.Index(uniques))
+        shape = tuple(len(values) for values in key_values)
+        groups = np.ravel_multi_index(key_codes, shape) if len(df) > 0 else np.zeros(0, dtype=np.intp)
+        # calculate_basic_metrics always reads correct_trial; the go_nogo metrics fall back to correct
+        correct_col = 'correct' if gonogo and 'correct_trial' not in df.columns else 'correct_trial'
+        totals = aggregate_trial_counts(df, groups, int(np.prod(shape)), correct_col, gonogo)
+        for cond_name, values in cells:
+            position = [
+                -1 if pd.isna(value) else index.get_indexer([value])[0]
+                for value, index in zip(values, key_values)
+            ]
+            if min(position) < 0:
+                # No trials (missing keys never match, as with == masks)
+                cell = {key: 0 for key in totals}
+            else:
+                flat = np.ravel_multi_index(position, shape)
+                cell = {key: column[flat] for key, column in totals.items()}
+            add_cell_metrics(metrics, cond_name, cell, gonogo)
     if cuedts:
-        cue_conditions = [c for c in df['cue_condition'].unique() if pd.notna(c) and str(c).lower() != 'na']
-        task_conditions = [t for t in df['task_condition'].unique() if pd.notna(t) and str(t).lower() != 'na']
-        for n_back_condition in df['n_back_condition'].str.lower().unique():
-            if pd.isna(n_back_condition):
-                continue
-            for delay in df['delay'].unique():
-                if pd.isna(delay):
-                    continue
-                for cue in cue_conditions:
-                    for taskc in task_conditions:
-                        if cue == "stay" and taskc == "switch":
-                            continue
-                        col_prefix = f"{n_back_condition}_{delay}back_t{taskc}_c{cue}"
-                        mask_acc = (
-                            (df['n_back_condition'].str.lower() == n_back_condition) &
-                            (df['delay'] == delay) &
-                            (df['cue_condition'] == cue) &
-                            (df['task_condition'] == taskc)
-                        )
-                        calculate_basic_metrics(df, mask_acc, col_prefix, metrics)
         add_category_accuracies(
                 df,
                 'curr_task',
@@ -920,112 +1171,25 @@ def compute_n_back_metrics(df, condition_list, paired_task_col=None, paired_cond
                 metrics
             )
         return metrics
-    elif gonogo:
-        for n_back_condition in df['n_back_condition'].str.lower().unique():
-            if pd.isna(n_back_condition):
-                continue
-            for delay in df['delay'].unique():
-                if paired_conditions is not None:
-                    for paired_condition in paired_conditions:
-                        col_prefix = f"{n_back_condition}_{delay}back_{paired_condition}"
-                        mask_acc = (df['n_back_condition'].str.lower() == n_back_condition) & (df['delay'] == delay) & (df[paired_task_col].str.lower() == paired_condition.lower())
-                        calculate_go_nogo_metrics(df, mask_acc, col_prefix, metrics)
+    if gonogo or paired_task_col is None:
         return metrics
-    if paired_task_col is None:
-        # Single n-back: iterate over n_back_condition and delay
-        for n_back_condition in df['n_back_condition'].str.lower().unique():
-            if pd.isna(n_back_condition):
-                continue
-            for delay in df['delay'].unique():
-                if pd.isna(delay):
-                    continue
-                condition = f"{n_back_condition}_{delay}back"
-                mask_acc = (df['n_back_condition'].str.lower() == n_back_condition) & (df['delay'] == delay)
-                calculate_basic_metrics(df, mask_acc, condition, metrics)
-    else:
-        # Dual n-back: iterate over n_back_condition, delay, and paired task conditions
-        for n_back_condition in df['n_back_condition'].str.lower().unique():
-            if pd.isna(n_back_condition):
-                continue
-            for delay in df['delay'].unique():
-                if pd.isna(delay):
-                    continue
-                if paired_conditions is not None:
-                    for paired_cond in paired_conditions:
-                        if shapematching:
-                            condition = f"n_back_{n_back_condition}_{delay}back_shape_matching_{paired_cond.lower()}"
-                        else:
-                            condition = f"{n_back_condition}_{delay}back_{paired_cond.lower()}"
-                        # For in-scanner nback+spatialTS, use task_switch_condition when present
-                        effective_col = paired_task_col
-                        if paired_task_col == 'task_switch' and 'task_switch_condition' in df.columns:
-                            effective_col = 'task_switch_condition'
-                        mask_acc = (df['n_back_condition'].str.lower() == n_back_condition) & (df['delay'] == delay) & (df[effective_col].astype(str).str.lower() == paired_cond.lower())
-                        calculate_basic_metrics(df, mask_acc, condition, metrics)
-        if spatialts:
-            add_category_accuracies(
-                df,
-                'predictable_dimension',
-                {'1-back': '1_back_acc', '2-back': '2_back_acc'},
-                metrics
-            )
-        
-        # Calculate overall match/mismatch metrics for in-scanner dual tasks (averaged across all paired task conditions)
-        if paired_task_col is not None and paired_conditions is not None and len(paired_conditions) > 0:
-            # For each load (1-back, 2-back), calculate overall match and mismatch accuracies
-            for load in [1, 2]:
-                load_str = f"{load}.0back"
-                match_acc_values = []
-                mismatch_acc_values = []
-                
-                # Collect all match and mismatch accuracies for this load across all paired conditions
-                for paired_cond in paired_conditions:
-                    # Try different naming patterns based on how condition was constructed
-                    paired_cond_lower = paired_cond.lower()
-                    
-                    # Pattern 1: match_1.0back_congruent_acc (with underscore)
-                    match_key1 = f"match_{load_str}_{paired_cond_lower}_acc"
-                    mismatch_key1 = f"mismatch_{load_str}_{paired_cond_lower}_acc"
-                    
-                    # Pattern 2: match_1.0backcongruent_acc (without underscore)
-                    match_key2 = f"match_{load_str}{paired_cond_lower}_acc"
-                    mismatch_key2 = f"mismatch_{load_str}{paired_cond_lower}_acc"
-                    
-                    # Pattern 3: For shapematching, might have n_back prefix
-                    if shapematching:
-                        match_key3 = f"n_back_match_{load_str}_shape_matching_{paired_cond_lower}_acc"
-                        mismatch_key3 = f"n_back_mismatch_{load_str}_shape_matching_{paired_cond_lower}_acc"
-                    else:
-                        match_key3 = None
-                        mismatch_key3 = None
-                    
-                    # Try each pattern
-                    match_key = None
-                    mismatch_key = None
-                    for key in [match_key1, match_key2, match_key3]:
-                        if key and key in metrics and pd.notna(metrics[key]):
-                            match_key = key
-                            break
-                    for key in [mismatch_key1, mismatch_key2, mismatch_key3]:
-                        if key and key in metrics and pd.notna(metrics[key]):
-                            mismatch_key = key
-                            break
-                    
-                    if match_key:
-                        match_acc_values.append(metrics[match_key])
-                    if mismatch_key:
-                        mismatch_acc_values.append(metrics[mismatch_key])
-                
-                # Calculate overall metrics
-                if match_acc_values:
-                    metrics[f'overall_match_{load_str}_acc'] = np.mean(match_acc_values)
-                else:
-                    metrics[f'overall_match_{load_str}_acc'] = np.nan
-                
-                if mismatch_acc_values:
-                    metrics[f'overall_mismatch_{load_str}_acc'] = np.mean(mismatch_acc_values)
-                else:
-                    metrics[f'overall_mismatch_{load_str}_acc'] = np.nan
+    if spatialts:
+        add_category_accuracies(
+            df,
+            'predictable_dimension',
+            {'1-back': '1_back_acc', '2-back': '2_back_acc'},
+            metrics
+        )
+    
+    # Overall match/mismatch accuracy per load for in-scanner dual tasks (averaged across paired conditions)
+    if paired_conditions is not None and len(paired_conditions) > 0:
+        for key, n_back_condition, delay in n_back_overall_acc_keys():
+            values = [
+                metrics.get(f"{n_back_cell_name(n_back_condition, delay, paired_cond, shapematching)}_acc")
+                for paired_cond in paired_conditions
+            ]
+            values = [value for value in values if pd.notna(value)]
+            metrics[key] = np.mean(values) if values else np.nan
     
     return metrics
 
@@ -1047,9 +1211,10 @@ def compute_fmri_cued_spatial_task_switching_metrics(df, condition_list):
         print("Warning: 'task_switch' column not found for fMRI cued+spatial task")
         return metrics
     
+    task_switch = normalize_condition_columns(df, ['task_switch'], lowercase=False, strip=True)['task_switch']
     for cond in condition_list:
         # Match rows where task_switch column exactly equals the condition
-        mask_acc = df['task_switch'].astype(str).str.strip() == cond
+        mask_acc = task_switch == cond
         calculate_basic_metrics(df, mask_acc, cond, metrics)
     
     return metrics
@@ -1067,6 +1232,7 @@ def compute_out_of_scanner_cued_spatial_task_switching_metrics(df, condition_lis
         dict: Metrics for cued + spatial task switching
     """
     metrics = {}
+    normalized = normalize_condition_columns(df, ['cue_condition', 'task_condition', 'task_switch'], lowercase=False)
     for cond in condition_list:
         # Parse condition like 'cuedtstaycstay_spatialtstaycstay'
         try:
@@ -1106,9 +1272,9 @@ def compute_out_of_scanner_cued_spatial_task_switching_metrics(df, condition_lis
             
             # Create mask for both cued and spatial parts
             mask_acc = (
-                (df['cue_condition'] == cued_cue) & 
-                (df['task_condition'] == cued_task) & 
-                (df['task_switch'] == f't{spatial_task}_c{spatial_cue}')
+                (normalized['cue_condition'] == cued_cue) & 
+                (normalized['task_condition'] == cued_task) & 
+                (normalized['task_switch'] == f't{spatial_task}_c{spatial_cue}')
             )
             calculate_basic_metrics(df, mask_acc, cond, metrics)
         except Exception as e:
@@ -1128,7 +1294,8 @@ def add_overall_accuracy(metrics, df=None, task_name=None):
     
     Args:
         metrics (dict): Metrics dictionary
-        df (pd.DataFrame, optional): DataFrame containing task data (already filtered to test trials)
+        df (pd.DataFrame | TrialTable, optional): Task data; a TrialTable's cached
+            test trials are used as they are
         task_name (str, optional): Name of the task
         
     Returns:
@@ -1141,10 +1308,7 @@ def add_overall_accuracy(metrics, df=None, task_name=None):
     # If dataframe is provided, calculate overall accuracy using calculate_acc on all test trials
     if df is not None:
         # Filter to test trials if not already done
-        if task_name:
-            df_filtered = filter_to_test_trials(df, task_name)
-        else:
-            df_filtered = df
+        df_filtered = as_trial_table(df, task_name or None).test_trials
         
         # Create mask for all test trials
         if len(df_filtered) > 0:
@@ -1158,310 +1322,224 @@ def add_overall_accuracy(metrics, df=None, task_name=None):
     
     return metrics
 
+def get_in_scanner_column(df, spec, column):
+    """Use the spec's in-scanner replacement for column when the file has it."""
+    in_scanner_col = spec.in_scanner_columns.get(column)
+    return in_scanner_col if in_scanner_col in df.columns else column
+
+def add_stop_signal_nogo_metrics(df, metrics):
+    """
+    Add the nogo summary metrics of stop signal with go/nogo.
+
+    Args:
+        df (pd.DataFrame | TrialTable): Test trials
+        metrics (dict): Metrics dictionary, updated in place
+
+    Returns:
+        dict: metrics with nogo_commission_rate, nogo_go_acc and nogo_stop_success_rate
+    """
+    trials = as_trial_table(df)
+    df = trials.test_trials
+    # Calculate nogo commission rate separately
+    nogo_mask = (df['go_nogo_condition'] == 'nogo')
+    nogo_commission_mask = nogo_mask & ~trials.omission_mask & (df['correct_trial'] == 0)
+    num_nogo_commissions = len(df[nogo_commission_mask])
+    total_nogo_trials = len(df[nogo_mask])
+    metrics['nogo_commission_rate'] = num_nogo_commissions / total_nogo_trials if total_nogo_trials > 0 else np.nan
+
+    # Calculate nogo go acc (acc on go trials when nogo condition is present)
+    nogo_go_mask = nogo_mask & trials.go_mask
+    if len(df[nogo_go_mask]) > 0:
+        nogo_go_correct = (df[nogo_go_mask]['key_press'] == df[nogo_go_mask]['correct_response']).sum()
+        metrics['nogo_go_acc'] = nogo_go_correct / len(df[nogo_go_mask])
+    else:
+        metrics['nogo_go_acc'] = np.nan
+
+    # Calculate nogo stop success rate (across all nogo stop trials)
+    nogo_stop_mask = nogo_mask & trials.stop_mask
+    if len(df[nogo_stop_mask]) > 0:
+        nogo_stop_success = (df[nogo_stop_mask]['key_press'] == -1).astype(int)
+        metrics['nogo_stop_success_rate'] = nogo_stop_success.mean()
+    else:
+        metrics['nogo_stop_success_rate'] = np.nan
+    return metrics
+
+def _conditions_engine_metrics(trials, spec, config):
+    condition_columns = {
+        component: get_in_scanner_column(trials.test_trials, spec, column)
+        for component, column in spec.condition_columns.items()
+    }
+    return calculate_metrics(trials, spec.conditions, condition_columns, spec.is_dual, **spec.flags)
+
+def _cued_task_switching_engine_metrics(trials, spec, config):
+    if spec.condition_type == 'single':
+        return compute_cued_task_switching_metrics(trials, spec.condition_list, 'single')
+    # The paired column argument is named after the condition type (flanker_col, go_nogo_col, ...)
+    paired_kwargs = {f'{spec.condition_type}_col': spec.paired_col}
+    if config.is_fmri and spec.fmri_condition_list is not None:
+        metrics = compute_cued_task_switching_metrics(trials, spec.fmri_condition_list, spec.condition_type, in_scanner=True, **paired_kwargs)
+    else:
+        metrics = compute_cued_task_switching_metrics(trials, spec.condition_list, spec.condition_type, **paired_kwargs)
+    if spec.drop_new:
+        # Also filter the returned metrics dictionary to remove any columns with 'new' (safety check)
+        metrics = {k: v for k, v in metrics.items() if 'new' not in k}
+    return metrics
+
+def _cued_spatial_task_switching_engine_metrics(trials, spec, config):
+    df = trials.test_trials
+    if config.is_fmri:
+        return compute_fmri_cued_spatial_task_switching_metrics(df, spec.condition_list)
+    return compute_out_of_scanner_cued_spatial_task_switching_metrics(df, spec.condition_list)
+
+def _n_back_engine_metrics(trials, spec, config):
+    df = trials.test_trials
+    if not spec.is_dual:
+        return compute_n_back_metrics(df, None)
+    if spec.flags.get('cuedts'):
+        return compute_n_back_metrics(df, None, paired_task_col='task_switch', paired_conditions=None, cuedts=True)
+    paired_col = get_n_back_paired_column(df, spec.paired_col)
+    paired_conditions = get_n_back_paired_conditions(df, paired_col)
+    return compute_n_back_metrics(df, None, paired_task_col=paired_col, paired_conditions=paired_conditions, **spec.flags)
+
+def _stop_signal_engine_metrics(trials, spec, config):
+    ssrt_methods = getattr(config, 'ssrt_methods', ('integration',))
+    if not spec.is_dual:
+        return compute_stop_signal_metrics(trials, dual_task=False, ssrt_methods=ssrt_methods)
+    metrics = compute_stop_signal_metrics(
+        trials,
+        dual_task=True,
+        paired_task_col=spec.paired_col,
+        paired_conditions=get_stop_signal_paired_conditions(trials.test_trials, spec),
+        stim_col=spec.stim_col,
+        stim_cols=list(spec.stim_cols),
+        ssrt_methods=ssrt_methods,
+        **spec.flags,
+    )
+    if spec.go_nogo_columns:
+        add_stop_signal_nogo_metrics(trials, metrics)
+    return metrics
+
+# Metric engine for each TaskSpec.engine; each takes the file's TrialTable, spec and config
+TASK_METRIC_ENGINES = {
+    'conditions': _conditions_engine_metrics,
+    'cued_task_switching': _cued_task_switching_engine_metrics,
+    'cued_spatial_task_switching': _cued_spatial_task_switching_engine_metrics,
+    'n_back': _n_back_engine_metrics,
+    'stop_signal': _stop_signal_engine_metrics,
+}
+
 def get_task_metrics(df, task_name, config):
     """
     Main function to get metrics for any task.
-    
+
+    The task name is resolved to its TaskSpec once (memoized), and the
+    spec's engine computes the metrics from the file's TrialTable, so the
+    test-trial view and masks are built once and shared with
+    add_overall_accuracy (and with compute_violations when the caller
+    passes the same table).
+
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Task data
         task_name (str): Name of the task
-        
+        config: Pipeline config (is_fmri picks the in-scanner variants)
+
     Returns:
-        dict: Dictionary containing task-specific metrics
+        dict: Dictionary containing task-specific metrics, or None for an
+        unknown dual task
     """
-    # First filter to test trials
-    df = filter_to_test_trials(df, task_name)
-    if is_dual_task(task_name):
-        # For dual tasks, we need both sets of conditions
-        if ('directed_forgetting' in task_name and 'flanker' in task_name) or ('directedForgetting' in task_name and 'flanker' in task_name):
-            conditions = {
-                'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS,
-                'flanker': FLANKER_CONDITIONS
-            }
-            condition_columns = {
-                'directed_forgetting': 'directed_forgetting_condition',
-                'flanker': 'flanker_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('directed_forgetting' in task_name and 'go_nogo' in task_name) or ('directedForgetting' in task_name and 'go_nogo' in task_name):
-            conditions = {
-                'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS,
-                'go_nogo': GO_NOGO_CONDITIONS
-            }
-            condition_columns = {
-                'directed_forgetting': 'directed_forgetting_condition',
-                'go_nogo': 'go_nogo_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('flanker' in task_name and 'go_nogo' in task_name) or ('flanker' in task_name and 'go_nogo' in task_name):
-            conditions = {
-                'flanker': FLANKER_CONDITIONS,
-                'go_nogo': GO_NOGO_CONDITIONS
-            }
-            condition_columns = {
-                'flanker': 'flanker_condition',
-                'go_nogo': 'go_nogo_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('directed_forgetting' in task_name and 'shape_matching' in task_name) or ('directedForgetting' in task_name and 'shape_matching' in task_name):
-            conditions = {
-                'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS,
-                'shape_matching': SHAPE_MATCHING_CONDITIONS_WITH_DIRECTED_FORGETTING
-            }
-            condition_columns = {
-                'directed_forgetting': 'directed_forgetting_condition',
-                'shape_matching': 'shape_matching_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('go_nogo' in task_name and 'shape_matching' in task_name) or ('go_nogo' in task_name and 'shape_matching' in task_name):
-            conditions = {
-                'go_nogo': GO_NOGO_CONDITIONS,
-                'shape_matching': SHAPE_MATCHING_CONDITIONS
-            }
-            condition_columns = {
-                'go_nogo': 'go_nogo_condition',
-                'shape_matching': 'shape_matching_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('flanker' in task_name and 'shape_matching' in task_name) or ('flanker' in task_name and 'shape_matching' in task_name):
-            conditions = {
-                'flanker': FLANKER_CONDITIONS,
-                'shape_matching': SHAPE_MATCHING_CONDITIONS
-            }
-            condition_columns = {
-                'flanker': 'flanker_condition',
-                'shape_matching': 'shape_matching_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('spatial_task_switching' in task_name and 'directed_forgetting' in task_name) or ('spatialTS' in task_name and 'directedForgetting' in task_name):
-            conditions = {
-                'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS,
-                'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS
-            }
-            condition_columns = {
-                'spatial_task_switching': 'task_switch',
-                'directed_forgetting': 'directed_forgetting_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name), spatialts=True, directedforgetting=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('spatial_task_switching' in task_name and 'flanker' in task_name) or ('spatialTS' in task_name and 'flanker' in task_name):
-            conditions = {
-                'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS,
-                'flanker': FLANKER_CONDITIONS
-            }
-            condition_columns = {
-                'spatial_task_switching': 'task_switch',
-                'flanker': 'flanker_condition'
-            }
-            return calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name), spatialts=True)
-        
-        elif ('spatial_task_switching' in task_name and 'go_nogo' in task_name) or ('spatialTS' in task_name and 'go_nogo' in task_name):
-            conditions = {
-                'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS,
-                'go_nogo': GO_NOGO_CONDITIONS
-            }
-            condition_columns = {
-                'spatial_task_switching': 'task_switch',
-                'go_nogo': 'go_nogo_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name), spatialts=True, gonogo=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        
-        elif ('spatial_task_switching' in task_name and 'shape_matching' in task_name) or ('spatialTS' in task_name and 'shape_matching' in task_name):
-            conditions = {
-                'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS,
-                'shape_matching': SHAPE_MATCHING_CONDITIONS
-            }
-            condition_columns = {
-                'spatial_task_switching': 'task_switch',
-                'shape_matching': 'shape_matching_condition'
-            }
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name), spatialts=True, shapematching=True)
-            return add_overall_accuracy(metrics, df, task_name)
+    trials = as_trial_table(df, task_name)
+    spec = get_task_spec(task_name)
+    if spec is None:
+        if is_dual_task(task_name):
+            return None
+        raise ValueError(f"Unknown task: {task_name}")
+    metrics = TASK_METRIC_ENGINES[spec.engine](trials, spec, config)
+    if not spec.overall_acc:
+        return metrics
+    return add_overall_accuracy(metrics, trials, task_name)
+
+def condition_value_mask(values, condition, match):
+    """
+    Match condition values the way calculate_metrics masks trials.
+    
+    Args:
+        values (pd.Series): Condition values, typically the distinct values of a column
+        condition (str): Condition name
+        match (str): 'equals' (exact), 'equals_lower' (lower-cased string equality,
+            used for go_nogo) or 'contains' (case-insensitive substring, so e.g.
+            'congruent' also matches 'H_congruent' and 'incongruent')
         
-        elif ('cued_task_switching' in task_name and 'spatial_task_switching' in task_name) or ('CuedTS' in task_name and 'spatialTS' in task_name):
-            # Determine mode based on column structure
-            if not config.is_fmri:
-                metrics = compute_out_of_scanner_cued_spatial_task_switching_metrics(df, SPATIAL_WITH_CUED_CONDITIONS)
-            else:
-                metrics = compute_fmri_cued_spatial_task_switching_metrics(df, SPATIAL_WITH_CUED_CONDITIONS)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('flanker' in task_name and 'cued_task_switching' in task_name) or ('flanker' in task_name and 'CuedTS' in task_name):
-            if config.is_fmri:
-                metrics = compute_cued_task_switching_metrics(df, FLANKER_WITH_CUED_CONDITIONS_FMRI, 'flanker', flanker_col='flanker_condition', in_scanner=True)
-            else:
-                metrics = compute_cued_task_switching_metrics(df, FLANKER_WITH_CUED_CONDITIONS, 'flanker', flanker_col='flanker_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('go_nogo' in task_name and 'cued_task_switching' in task_name) or ('go_nogo' in task_name and 'CuedTS' in task_name):
-            metrics = compute_cued_task_switching_metrics(df, GO_NOGO_WITH_CUED_CONDITIONS, 'go_nogo', go_nogo_col='go_nogo_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('shape_matching' in task_name and 'cued_task_switching' in task_name) or ('shape_matching' in task_name and 'CuedTS' in task_name):
-            # Filter out conditions with 'new' in them
-            filtered_conditions = [c for c in SHAPE_MATCHING_WITH_CUED_CONDITIONS if 'new' not in c]
-            metrics = compute_cued_task_switching_metrics(df, filtered_conditions, 'shape_matching', shape_matching_col='shape_matching_condition')
-            # Also filter the returned metrics dictionary to remove any columns with 'new' (safety check)
-            metrics = {k: v for k, v in metrics.items() if 'new' not in k}
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('directed_forgetting' in task_name and 'cued_task_switching' in task_name) or ('directedForgetting' in task_name and 'CuedTS' in task_name):
-            metrics = compute_cued_task_switching_metrics(df, CUED_TASK_SWITCHING_WITH_DIRECTED_FORGETTING_CONDITIONS, 'directed_forgetting', directed_forgetting_col='directed_forgetting_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'go_nogo' in task_name) or ('NBack' in task_name and 'go_nogo' in task_name):
-            # Example: dual n-back with go_nogo
-            paired_conditions = [c for c in df['go_nogo_condition'].unique() if pd.notna(c)]
-            metrics = compute_n_back_metrics(df, None, paired_task_col='go_nogo_condition', paired_conditions=paired_conditions, gonogo=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'flanker' in task_name) or ('NBack' in task_name and 'flanker' in task_name):
-            paired_conditions = [c for c in df['flanker_condition'].unique() if pd.notna(c)]
-            metrics = compute_n_back_metrics(df, None, paired_task_col='flanker_condition', paired_conditions=paired_conditions)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'shape_matching' in task_name) or ('NBack' in task_name and 'shape_matching' in task_name):
-            paired_conditions = [c for c in df['shape_matching_condition'].unique() if pd.notna(c)]
-            metrics = compute_n_back_metrics(df, None, paired_task_col='shape_matching_condition', paired_conditions=paired_conditions, shapematching=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'directed_forgetting' in task_name) or ('NBack' in task_name and 'directed_forgetting' in task_name):
-            paired_conditions = [c for c in df['directed_forgetting_condition'].unique() if pd.notna(c)]
-            metrics = compute_n_back_metrics(df, None, paired_task_col='directed_forgetting_condition', paired_conditions=paired_conditions)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'cued_task_switching' in task_name) or ('NBack' in task_name and 'CuedTS' in task_name):
-            metrics = compute_n_back_metrics(df, None, paired_task_col='task_switch', paired_conditions=None, cuedts=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('n_back' in task_name and 'spatial_task_switching' in task_name) or ('NBack' in task_name and 'spatialTS' in task_name):
-            spatial_col = 'task_switch_condition' if 'task_switch_condition' in df.columns else 'task_switch'
-            paired_conditions = [c for c in df[spatial_col].unique() if pd.notna(c) and c != 'na']
-            metrics = compute_n_back_metrics(df, None, paired_task_col=spatial_col, paired_conditions=paired_conditions, spatialts=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'flanker' in task_name) or ('stopSignal' in task_name and 'flanker' in task_name):
-            paired_conditions = [c for c in df['flanker_condition'].unique() if pd.notna(c)]
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col='flanker_condition', paired_conditions=paired_conditions, stim_col='center_letter')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'go_nogo' in task_name) or ('stopSignal' in task_name and 'go_nogo' in task_name):
-            # Only process 'go' condition, not 'nogo'
-            paired_conditions = ['go']  # Only process go condition
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col='go_nogo_condition', paired_conditions=paired_conditions, stim_col='stim')
-            
-            # Calculate nogo commission rate separately
-            nogo_mask = (df['go_nogo_condition'] == 'nogo')
-            nogo_commission_mask = nogo_mask & (df['key_press'] != -1) & (df['correct_trial'] == 0)
-            num_nogo_commissions = len(df[nogo_commission_mask])
-            total_nogo_trials = len(df[nogo_mask])
-            metrics['nogo_commission_rate'] = num_nogo_commissions / total_nogo_trials if total_nogo_trials > 0 else np.nan
-            
-            # Calculate nogo go acc (acc on go trials when nogo condition is present)
-            nogo_go_mask = (df['go_nogo_condition'] == 'nogo') & (df['SS_trial_type'] == 'go')
-            if len(df[nogo_go_mask]) > 0:
-                nogo_go_correct = (df[nogo_go_mask]['key_press'] == df[nogo_go_mask]['correct_response']).sum()
-                metrics['nogo_go_acc'] = nogo_go_correct / len(df[nogo_go_mask])
-            else:
-                metrics['nogo_go_acc'] = np.nan
-            
-            # Calculate nogo stop success rate (across all nogo stop trials)
-            nogo_stop_mask = (df['go_nogo_condition'] == 'nogo') & (df['SS_trial_type'] == 'stop')
-            if len(df[nogo_stop_mask]) > 0:
-                nogo_stop_success = (df[nogo_stop_mask]['key_press'] == -1).astype(int)
-                metrics['nogo_stop_success_rate'] = nogo_stop_success.mean()
-            else:
-                metrics['nogo_stop_success_rate'] = np.nan
-            
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'shape_matching' in task_name) or ('stopSignal' in task_name and 'shape_matching' in task_name):
-            paired_conditions = [c for c in df['shape_matching_condition'].unique() if pd.notna(c)]
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col='shape_matching_condition', paired_conditions=paired_conditions, stim_col='shape_matching_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'directed_forgetting' in task_name) or ('stopSignal' in task_name and 'directedForgetting' in task_name):
-            paired_conditions = [c for c in df['directed_forgetting_condition'].unique() if pd.notna(c)]
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col='directed_forgetting_condition', paired_conditions=paired_conditions, stim_col='directed_forgetting_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'spatial_task_switching' in task_name) or ('stopSignal' in task_name and 'spatialTS' in task_name):
-            paired_conditions = [c for c in df['task_switch'].unique() if pd.notna(c) and c != 'na']
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col='task_switch', paired_conditions=paired_conditions, stim_cols=['number', 'predictable_dimension'], spatialts=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'n_back' in task_name) or ('stopSignal' in task_name and 'NBack' in task_name):
-            paired_conditions = []
-            for n_back_condition in df['n_back_condition'].unique():
-                if pd.notna(n_back_condition):
-                    paired_conditions.append(f"{n_back_condition}_collapsed")
-                    for delay in df['delay'].unique():
-                        if pd.notna(delay):
-                            paired_conditions.append(f"{n_back_condition}_{delay}back")
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col=None, paired_conditions=paired_conditions, stim_col='n_back_condition')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif ('stop_signal' in task_name and 'cued_task_switching' in task_name) or ('stopSignal' in task_name and 'CuedTS' in task_name):
-            # Create combined conditions for cued task switching (e.g., "tstay_cstay", "tstay_cswitch")
-            paired_conditions = []
-            for cue_condition in df['cue_condition'].unique():
-                if pd.notna(cue_condition) and str(cue_condition).lower() != 'na':
-                    for task_condition in df['task_condition'].unique():
-                        if pd.notna(task_condition) and str(task_condition).lower() != 'na':
-                            # Skip the combination where cue is stay and task is switch
-                            if cue_condition == "stay" and task_condition == "switch":
-                                continue
-                            paired_conditions.append(f"t{task_condition}_c{cue_condition}")
-            metrics = compute_stop_signal_metrics(df, dual_task=True, paired_task_col=None, paired_conditions=paired_conditions, stim_cols=['stim_number', 'task'], cuedts=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        # Add more dual n-back pairings as needed
+    Returns:
+        np.ndarray: Boolean mask over values
+    """
+    if match == 'equals':
+        mask = values == condition
+    elif match == 'equals_lower':
+        mask = values.astype(str).str.lower() == condition.lower()
     else:
-        # Special handling for n-back task
-        if 'n_back' in task_name:
-            metrics = compute_n_back_metrics(df, None)
-            return add_overall_accuracy(metrics, df, task_name)
-
-        elif 'cued_task_switching' in task_name:
-            metrics = compute_cued_task_switching_metrics(df, CUED_TASK_SWITCHING_CONDITIONS, 'single')
-            return add_overall_accuracy(metrics, df, task_name)
-        elif 'spatial_task_switching' in task_name or 'spatialTS' in task_name:
-            conditions = {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS}
-            # Prefer in-scanner column when present
-            spatial_col = 'task_switch_condition' if 'task_switch_condition' in df.columns else 'task_switch'
-            condition_columns = {'spatial_task_switching': spatial_col}
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name), spatialts=True)
-            return add_overall_accuracy(metrics, df, task_name)
-        # Special handling for stop signal task
-        elif 'stop_signal' in task_name:
-            metrics = compute_stop_signal_metrics(df, dual_task=False)
-            return add_overall_accuracy(metrics, df, task_name)
-        # For other single tasks, we only need one set of conditions
-        elif 'directed_forgetting' in task_name or 'directedForgetting' in task_name:
-            conditions = {'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS}
-            condition_columns = {'directed_forgetting': 'directed_forgetting_condition'}
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        elif 'flanker' in task_name:
-            conditions = {'flanker': FLANKER_CONDITIONS}
-            condition_columns = {'flanker': 'flanker_condition'}
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        elif 'go_nogo' in task_name:
-            conditions = {'go_nogo': GO_NOGO_CONDITIONS}
-            condition_columns = {'go_nogo': 'go_nogo_condition'}
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        elif 'shape_matching' in task_name:
-            conditions = {'shape_matching': SHAPE_MATCHING_CONDITIONS}
-            condition_columns = {'shape_matching': 'shape_matching_condition'}
-            metrics = calculate_metrics(df, conditions, condition_columns, is_dual_task(task_name))
-            return add_overall_accuracy(metrics, df, task_name)
-        else:
-            raise ValueError(f"Unknown task: {task_name}")
+        mask = values.str.contains(condition, case=False, na=False)
+    return mask.to_numpy(dtype=bool)
+
+def calculate_grouped_dual_metrics(df, conditions, condition_columns):
+    """
+    Calculate acc, RT, omission and commission rates for every dual-task cell in one aggregation.
+    
+    Both condition columns are factorized once and trial counts and sums are
+    aggregated per pair of distinct values. Each condition is matched against
+    the distinct values only (go_nogo by lower-cased equality, the other task
+    by case-insensitive substring, as in the row masks), and every cell total
+    is a sum over its matching pairs. Results equal calculate_basic_metrics /
+    calculate_go_nogo_metrics applied cell by cell.
+    
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        conditions (dict): Two task names and their conditions
+        condition_columns (dict): Task names and their condition column names
+        
+    Returns:
+        dict | None: Metrics in calculate_metrics key order, or None if the
+        trial columns are missing or not numeric
+    """
+    task1, task2 = list(conditions.keys())
+    gonogo = 'go_nogo' in task1 or 'go_nogo' in task2
+    # calculate_basic_metrics always reads correct_trial; the go_nogo metrics fall back to correct
+    correct_col = 'correct_trial' if (not gonogo or 'correct_trial' in df.columns) else 'correct'
+    if not {correct_col, 'rt', 'key_press'}.issubset(df.columns):
+        return None
+    if not (pd.api.types.is_numeric_dtype(df[correct_col]) and pd.api.types.is_numeric_dtype(df['rt'])):
+        return None
+    
+    axes = []
+    for task in (task1, task2):
+        column = df[condition_columns[task]]
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        values = pd.Series(uniques, dtype=column.dtype)
+        match = 'equals_lower' if 'go_nogo' in task else 'contains'
+        matches = np.array([condition_value_mask(values, cond, match) for cond in conditions[task]], dtype=float)
+        axes.append((codes, matches.reshape(len(conditions[task]), len(values))))
+    (codes1, matches1), (codes2, matches2) = axes
+    n_values2 = matches2.shape[1]
+    groups = codes1 * n_values2 + codes2
+    n_groups = matches1.shape[1] * n_values2
+    
+    # Cell totals for every (cond1, cond2) pair: matches1 @ pair totals @ matches2.T
+    cells = {
+        key: matches1 @ totals.reshape(-1, n_values2) @ matches2.T
+        for key, totals in aggregate_trial_counts(df, groups, n_groups, correct_col, gonogo).items()
+    }
+    
+    metrics = {}
+    for i, cond1 in enumerate(conditions[task1]):
+        for j, cond2 in enumerate(conditions[task2]):
+            add_cell_metrics(metrics, f'{cond1}_{cond2}', {key: totals[i, j] for key, totals in cells.items()}, gonogo)
+    return metrics
 
 def calculate_metrics(df, conditions, condition_columns, is_dual_task, spatialts=False, shapematching=False, directedforgetting=False, gonogo=False):
     """
     Calculate RT and acc metrics for any task.
     
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Test trials
         conditions (dict): Dictionary of task names and their conditions
         condition_columns (dict): Dictionary of task names and their condition column names
         is_dual_task (bool): Whether this is a dual task
@@ -1472,30 +1550,38 @@ def calculate_metrics(df, conditions, condition_columns, is_dual_task, spatialts
     Returns:
         dict: Dictionary containing task-specific metrics
     """
+    trials = as_trial_table(df)
+    df = trials.test_trials
     metrics = {}
     
     if is_dual_task:
-        # For dual tasks, iterate through all combinations of conditions
-        task1, task2 = list(conditions.keys())
-        for cond1 in conditions[task1]:
-            for cond2 in conditions[task2]:
-                if 'go_nogo' in task1:
-                    mask1 = df[condition_columns[task1]].astype(str).str.lower() == cond1.lower()
-                    mask2 = df[condition_columns[task2]].str.contains(cond2, case=False, na=False)
-                    mask_acc = mask1 & mask2
-                elif 'go_nogo' in task2:
-                    mask1 = df[condition_columns[task1]].str.contains(cond1, case=False, na=False)
-                    mask2 = df[condition_columns[task2]].astype(str).str.lower() == cond2.lower()
-                    mask_acc = mask1 & mask2
-                else:
-                    mask_acc = df[condition_columns[task1]].str.contains(cond1, case=False, na=False) & \
-                        df[condition_columns[task2]].str.contains(cond2, case=False, na=False)
+        # One grouped aggregation over both condition columns; the row-mask loop
+        # below is kept for files without the numeric trial columns it needs
+        grouped = calculate_grouped_dual_metrics(df, conditions, condition_columns)
+        if grouped is not None:
+            metrics.update(grouped)
+        else:
+            # For dual tasks, iterate through all combinations of conditions
+            task1, task2 = list(conditions.keys())
+            for cond1 in conditions[task1]:
+                for cond2 in conditions[task2]:
+                    if 'go_nogo' in task1:
+                        mask1 = df[condition_columns[task1]].astype(str).str.lower() == cond1.lower()
+                        mask2 = df[condition_columns[task2]].str.contains(cond2, case=False, na=False)
+                        mask_acc = mask1 & mask2
+                    elif 'go_nogo' in task2:
+                        mask1 = df[condition_columns[task1]].str.contains(cond1, case=False, na=False)
+                        mask2 = df[condition_columns[task2]].astype(str).str.lower() == cond2.lower()
+                        mask_acc = mask1 & mask2
+                    else:
+                        mask_acc = df[condition_columns[task1]].str.contains(cond1, case=False, na=False) & \
+                            df[condition_columns[task2]].str.contains(cond2, case=False, na=False)
 
-                # Check if this is a go_nogo task
-                if 'go_nogo' in task1 or 'go_nogo' in task2:
-                    calculate_go_nogo_metrics(df, mask_acc, f'{cond1}_{cond2}', metrics)
-                else:
-                    calculate_basic_metrics(df, mask_acc, f'{cond1}_{cond2}', metrics)
+                    # Check if this is a go_nogo task
+                    if 'go_nogo' in task1 or 'go_nogo' in task2:
+                        calculate_go_nogo_metrics(trials, mask_acc, f'{cond1}_{cond2}', metrics)
+                    else:
+                        calculate_basic_metrics(df, mask_acc, f'{cond1}_{cond2}', metrics)
         if spatialts and shapematching:
             add_category_accuracies(
                 df,
@@ -1534,7 +1620,7 @@ def calculate_metrics(df, conditions, condition_columns, is_dual_task, spatialts
             if 'go_nogo' in task:
                 # For single go_nogo: use response equality only in fMRI mode
                 is_fmri = os.environ.get('QC_DATA_MODE', 'out_of_scanner').lower() == 'fmri'
-                calculate_go_nogo_metrics(df, mask_acc, cond, metrics, response_equality=is_fmri)
+                calculate_go_nogo_metrics(trials, mask_acc, cond, metrics, response_equality=is_fmri)
             else:
                 calculate_basic_metrics(df, mask_acc, cond, metrics)
         if spatialts:
@@ -1547,6 +1633,56 @@ def calculate_metrics(df, conditions, condition_columns, is_dual_task, spatialts
 
     return metrics
 
+def compute_summary_stats(df):
+    """
+    Summarize every metric column of an in-memory QC table.
+
+    All numeric columns are reduced together (mean, population std, max, min,
+    median, non-missing count and interquartile range), skipping missing
+    values. Non-numeric columns (e.g. session) get NaN.
+
+    Args:
+        df (pd.DataFrame): QC table without summary rows (first column is subject_id)
+
+    Returns:
+        pd.DataFrame: One row per statistic in SUMMARY_STATS, one column per
+        metric column of df
+    """
+    stats_cols = df.columns[1:]  # Assuming first column is subject_id
+    numeric_cols = [col for col in stats_cols if pd.api.types.is_numeric_dtype(df[col])]
+    values = df[numeric_cols].astype(float)
+    quartiles = values.quantile([0.25, 0.75])
+    summary = pd.DataFrame({
+        'mean': values.mean(),
+        'std': values.std(ddof=0),
+        'max': values.max(),
+        'min': values.min(),
+        'median': values.median(),
+        'count': values.count().astype(float),
+        'iqr': quartiles.loc[0.75] - quartiles.loc[0.25],
+    }, index=pd.Index(numeric_cols, dtype=object))
+    return summary.T.reindex(index=SUMMARY_STATS, columns=stats_cols)
+
+def append_summary_rows(df, summary=None):
+    """
+    Append mean, std, max and min rows to an in-memory QC table.
+
+    Args:
+        df (pd.DataFrame): QC table (first column is subject_id)
+        summary (pd.DataFrame, optional): compute_summary_stats output for df;
+            computed here if not given
+
+    Returns:
+        pd.DataFrame: Table with the summary rows appended (unchanged if empty)
+    """
+    if df.empty or len(df.columns) < 2:
+        return df
+    if summary is None:
+        summary = compute_summary_stats(df)
+    rows = summary.loc[SUMMARY_ROW_STATS].reindex(columns=df.columns[1:])
+    rows.insert(0, df.columns[0], SUMMARY_ROW_STATS)
+    return pd.concat([df.reset_index(drop=True), rows.reset_index(drop=True)], ignore_index=True)
+
 def append_summary_rows_to_csv(csv_path):
     try:
         df = pd.read_csv(csv_path)
@@ -1554,21 +1690,7 @@ def append_summary_rows_to_csv(csv_path):
         return
     if df.empty or len(df.columns) < 2:
         return
-
-    stats_cols = df.columns[1:]  # Assuming first column is subject_id
-    summary = {}
-    for stat, func in zip(['mean', 'std', 'max', 'min'], [np.mean, np.std, np.max, np.min]):
-        row = []
-        for col in df.columns:
-            if col in stats_cols:
-                val = func(df[col]) if pd.api.types.is_numeric_dtype(df[col]) else np.nan
-                row.append(val)
-            else:
-                row.append(stat)
-        summary[stat] = row
-
-    for stat, values in summary.items():
-        df.loc[len(df)] = values
+    df = append_summary_rows(df)
     df.to_csv(csv_path, index=False)
 
 def normalize_flanker_conditions(df):
@@ -1593,65 +1715,147 @@ def normalize_flanker_conditions(df):
         df['flanker_condition'] = df['flanker_condition'].replace(flanker_mapping)
     return df
 
+def correct_column_names(df):
+    """
+    Rename 'tswitch_new_cswitch' columns to 'tswitch_cswitch'.
+
+    Args:
+        df (pd.DataFrame): QC table
+
+    Returns:
+        pd.DataFrame: Table with corrected column names
+    """
+    renames = {col: col.replace('tswitch_new_cswitch', 'tswitch_cswitch') for col in df.columns if 'tswitch_new_cswitch' in col}
+    return df.rename(columns=renames) if renames else df
+
 def correct_columns(csv_path):
     df = pd.read_csv(csv_path)
-    columns_renamed = False
-    for col in df.columns:
-        if 'tswitch_new_cswitch' in col:
-            new_col = col.replace('tswitch_new_cswitch', 'tswitch_cswitch')
-            df.rename(columns={col: new_col}, inplace=True)
-            columns_renamed = True
-    
-    if columns_renamed:
-        df.to_csv(csv_path, index=False)
+    corrected = correct_column_names(df)
+    if corrected is not df:
+        corrected.to_csv(csv_path, index=False)
+
+def factorize_stimulus_responses(df, stim_cols):
+    """
+    Factorize stimuli and correct responses once per file for stop-failure accuracy.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        stim_cols (list): Stimulus column(s); a stimulus is the combination of their values
+
+    Returns:
+        tuple: (stim_codes, resp_codes, resp_values) where the codes are intp arrays
+        with -1 for a missing stimulus (any column missing) or response, and
+        resp_values holds the response for each response code
+    """
+    col_codes = []
+    for col in stim_cols:
+        codes, uniques = pd.factorize(df[col])
+        col_codes.append((codes, max(len(uniques), 1)))
+    missing = np.logical_or.reduce([codes < 0 for codes, _ in col_codes])
+    combined = np.ravel_multi_index(
+        [np.where(missing, 0, codes) for codes, _ in col_codes],
+        [size for _, size in col_codes],
+    )
+    stim_codes, _ = pd.factorize(np.where(missing, -1, combined), use_na_sentinel=False)
+    # Keep -1 for missing stimuli after re-coding the combinations densely
+    stim_codes = np.where(missing, -1, stim_codes).astype(np.intp)
+    resp_codes, resp_values = pd.factorize(df['correct_response'])
+    return stim_codes, resp_codes.astype(np.intp), np.asarray(resp_values, dtype=object)
+
+def get_stimulus_response_modes(stim_codes, resp_codes, go_mask):
+    """
+    Most frequent correct response for each stimulus on the selected go trials.
+
+    Ties go to the response seen first among the selected trials.
+
+    Args:
+        stim_codes (np.ndarray): Stimulus codes from factorize_stimulus_responses
+        resp_codes (np.ndarray): Response codes from factorize_stimulus_responses
+        go_mask (np.ndarray): Boolean mask of go trials to learn the mapping from
+
+    Returns:
+        np.ndarray: Response code for each stimulus code, -1 where the stimulus
+        has no go trial with a response
+    """
+    n_stims = int(stim_codes.max()) + 1 if len(stim_codes) else 0
+    n_resps = int(resp_codes.max()) + 1 if len(resp_codes) else 0
+    modes = np.full(n_stims, -1, dtype=np.intp)
+    selected = go_mask & (stim_codes >= 0) & (resp_codes >= 0)
+    if not selected.any():
+        return modes
+    keys = stim_codes[selected] * n_resps + resp_codes[selected]
+    pairs, first_seen, counts = np.unique(keys, return_index=True, return_counts=True)
+    pair_stims = pairs // n_resps
+    # Per stimulus: highest count first, then earliest appearance
+    order = np.lexsort((first_seen, -counts, pair_stims))
+    is_first = np.r_[True, pair_stims[order][1:] != pair_stims[order][:-1]]
+    best = order[is_first]
+    modes[pair_stims[best]] = pairs[best] % n_resps
+    return modes
+
+def calculate_stop_fail_acc(df, stim_responses, go_mask, stop_fail_mask):
+    """
+    Stop-failure accuracy against the stimulus-response mapping learned from go trials.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        stim_responses (tuple): Output of factorize_stimulus_responses for df
+        go_mask (pd.Series): Go trials the mapping is learned from
+        stop_fail_mask (pd.Series): Stop trials with a response
+
+    Returns:
+        float: Share of stop failures whose key press matches the mapped response
+        (a stimulus without a mapping counts as incorrect), NaN without stop failures
+    """
+    stim_codes, resp_codes, resp_values = stim_responses
+    stop_fail = stop_fail_mask.to_numpy(dtype=bool, na_value=False)
+    if not stop_fail.any():
+        return np.nan
+    modes = get_stimulus_response_modes(stim_codes, resp_codes, go_mask.to_numpy(dtype=bool, na_value=False))
+    fail_stims = stim_codes[stop_fail]
+    expected_codes = np.where(fail_stims >= 0, modes[np.maximum(fail_stims, 0)] if len(modes) else -1, -1)
+    has_expected = expected_codes >= 0
+    is_correct = np.zeros(len(expected_codes), dtype=bool)
+    key_press = df['key_press'].to_numpy(dtype=object)[stop_fail]
+    is_correct[has_expected] = key_press[has_expected] == resp_values[expected_codes[has_expected]]
+    return is_correct.mean()
 
 def calculate_single_stop_signal_metrics(df):
     """
     Calculate metrics for single stop signal task.
     
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Test trials
         
     Returns:
         dict: Metrics for single stop signal task
     """
+    trials = as_trial_table(df)
+    df = trials.test_trials
     metrics = {}
     
-    go_mask = (df['SS_trial_type'] == 'go')
-    stop_mask = (df['SS_trial_type'] == 'stop')
+    go_mask = trials.go_mask
+    stop_mask = trials.stop_mask
     stop_fail_mask = stop_mask & (df['correct_trial'] == 0)
-    stop_succ_mask = stop_mask & (df['correct_trial'] == 1)
+    stop_succ_mask = stop_mask & trials.correct_mask
 
     # RTs
-    metrics['go_rt'] = df.loc[go_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].mean()
-    metrics['stop_fail_rt'] = df.loc[stop_fail_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].mean()
+    metrics['go_rt'] = df.loc[go_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].astype(float).mean()
+    metrics['stop_fail_rt'] = df.loc[stop_fail_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].astype(float).mean()
 
     # Accuracies
     metrics['go_acc'] = df.loc[go_mask, 'correct_trial'].mean()
     
-    # Stop failure acc based on stimulus-response mapping from go trials
-    go_trials = df[go_mask]
-    stim_to_resp = (
-        go_trials.groupby('stim')['correct_response']
-        .agg(lambda x: x.value_counts().idxmax())
-        .to_dict()
-    )
-
     # Go omission rate
-    go_mask = (df['SS_trial_type'] == 'go')
-    mask_omission = go_mask & (df['key_press'] == -1)
-    mask_commission = go_mask & (df['key_press'] != -1) & (df['correct_trial'] == 0)
+    mask_omission = go_mask & trials.omission_mask
+    mask_commission = go_mask & ~trials.omission_mask & (df['correct_trial'] == 0)
     metrics['go_omission_rate'] = calculate_omission_rate(df, mask_omission, len(df[go_mask]))
     metrics['go_commission_rate'] = calculate_commission_rate(df, mask_commission, len(df[go_mask]))
 
-    stop_fail_with_resp = df[stop_fail_mask & (df['key_press'] != -1)]
-    if not stop_fail_with_resp.empty:
-        stop_fail_with_resp = stop_fail_with_resp.copy()
-        stop_fail_with_resp['expected_response'] = stop_fail_with_resp['stim'].map(stim_to_resp)
-        stop_fail_with_resp['is_correct'] = stop_fail_with_resp['key_press'] == stop_fail_with_resp['expected_response']
-        metrics['stop_fail_acc'] = stop_fail_with_resp['is_correct'].mean()
-    else:
-        metrics['stop_fail_acc'] = np.nan
+    # Stop failure acc based on stimulus-response mapping from go trials
+    metrics['stop_fail_acc'] = calculate_stop_fail_acc(
+        df, factorize_stimulus_responses(df, ['stim']), go_mask, stop_fail_mask & ~trials.omission_mask
+    )
 
     metrics['stop_success'] = len(df[stop_succ_mask])/len(df[stop_mask])
     
@@ -1662,13 +1866,13 @@ def calculate_stop_signal_ssd_stats(df):
     Calculate SSD statistics for stop signal task.
     
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Test trials
         
     Returns:
         dict: SSD statistics
     """
-    stop_mask = (df['SS_trial_type'] == 'stop')
-    ssd_vals = df.loc[stop_mask, 'SS_delay'].dropna()
+    trials = as_trial_table(df)
+    ssd_vals = trials.test_trials.loc[trials.stop_mask, 'SS_delay'].dropna().astype(float)
     
     metrics = {}
     metrics['avg_ssd'] = ssd_vals.mean()
@@ -1679,88 +1883,61 @@ def calculate_stop_signal_ssd_stats(df):
     
     return metrics
 
-def calculate_dual_stop_signal_condition_metrics(df, paired_cond, paired_mask, stim_col=None, stim_cols=None, cuedts=False, spatialts=False):
+def calculate_dual_stop_signal_condition_metrics(df, paired_cond, paired_mask, stim_col=None, stim_cols=None, cuedts=False, spatialts=False, stim_responses=None, ssrt=None):
     """
     Calculate stop signal metrics for a single condition in dual task.
     
     Args:
-        df (pd.DataFrame): DataFrame containing task data
+        df (pd.DataFrame | TrialTable): Test trials
         paired_cond (str): Paired task condition name
         paired_mask (pd.Series): Boolean mask for the condition
         stim_col (str): Single stimulus column for mapping
         stim_cols (list): Multiple stimulus columns for mapping
+        stim_responses (tuple, optional): factorize_stimulus_responses output shared
+            across conditions; built from stim_col/stim_cols if not given
+        ssrt (float, optional): The condition's SSRT from compute_batched_SSRT;
+            computed with compute_SSRT if not given
         
     Returns:
         dict: Metrics for the condition
     """
+    trials = as_trial_table(df)
+    df = trials.test_trials
     metrics = {}
     
-    go_mask = (df['SS_trial_type'] == 'go') & paired_mask
-    stop_mask = (df['SS_trial_type'] == 'stop') & paired_mask
-    stop_fail_mask = stop_mask & (df['key_press'] != -1)
-    stop_succ_mask = stop_mask & (df['key_press'] == -1)
+    go_mask = trials.go_mask & paired_mask
+    stop_mask = trials.stop_mask & paired_mask
+    stop_fail_mask = stop_mask & ~trials.omission_mask
+    stop_succ_mask = stop_mask & trials.omission_mask
 
     # RTs
-    metrics[f'{paired_cond}_go_rt'] = df.loc[go_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].mean()
-    metrics[f'{paired_cond}_stop_fail_rt'] = df.loc[stop_fail_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].mean()
+    metrics[f'{paired_cond}_go_rt'] = df.loc[go_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].astype(float).mean()
+    metrics[f'{paired_cond}_stop_fail_rt'] = df.loc[stop_fail_mask & (df['rt'].notna()) & (df['rt'] > 0), 'rt'].astype(float).mean()
 
     # Accuracies
     go_trials = df[go_mask]
     correct_go_trials = (go_trials['key_press'] == go_trials['correct_response']).sum()
     metrics[f'{paired_cond}_go_acc'] = correct_go_trials / len(go_trials)
     # Go omission rate
-    mask_omission = go_mask & (df['key_press'] == -1)
-    mask_commission = go_mask & (df['key_press'] != -1) & (df['key_press'] != df['correct_response'])
+    mask_omission = go_mask & trials.omission_mask
+    mask_commission = go_mask & ~trials.omission_mask & (df['key_press'] != df['correct_response'])
     metrics[f'{paired_cond}_go_omission_rate'] = calculate_omission_rate(df, mask_omission, len(go_trials))
     metrics[f'{paired_cond}_go_commission_rate'] = calculate_commission_rate(df, mask_commission, len(go_trials))
     
     # Stop failure acc based on stimulus-response mapping from go trials
-    if stim_col is not None:
-        if not go_trials.empty:
-            stim_to_resp = (
-                go_trials.groupby(stim_col)['correct_response']
-                .agg(lambda x: x.value_counts().idxmax())
-                .to_dict()
-            )
-
-            stop_fail_with_resp = df[stop_fail_mask & (df['key_press'] != -1)]
-            if not stop_fail_with_resp.empty:
-                stop_fail_with_resp = stop_fail_with_resp.copy()
-                stop_fail_with_resp['expected_response'] = stop_fail_with_resp[stim_col].map(stim_to_resp)
-                stop_fail_with_resp['is_correct'] = stop_fail_with_resp['key_press'] == stop_fail_with_resp['expected_response']
-                metrics[f'{paired_cond}_stop_fail_acc'] = stop_fail_with_resp['is_correct'].mean()
-            else:
-                metrics[f'{paired_cond}_stop_fail_acc'] = np.nan
-        else:
-            metrics[f'{paired_cond}_stop_fail_acc'] = np.nan
-    elif stim_cols is not None:
-        if not go_trials.empty:
-            # Group by multiple stimulus columns
-            stim_to_resp = (
-                go_trials.groupby(stim_cols)['correct_response']
-                .agg(lambda x: x.value_counts().idxmax())
-                .to_dict()
-            )
-
-            stop_fail_with_resp = df[stop_fail_mask & (df['key_press'] != -1)]
-            if not stop_fail_with_resp.empty:
-                stop_fail_with_resp = stop_fail_with_resp.copy()
-                # Create a tuple key from multiple stimulus columns
-                stop_fail_with_resp['stim_key'] = stop_fail_with_resp[stim_cols].apply(tuple, axis=1)
-                stop_fail_with_resp['expected_response'] = stop_fail_with_resp['stim_key'].map(stim_to_resp)
-                stop_fail_with_resp['is_correct'] = stop_fail_with_resp['key_press'] == stop_fail_with_resp['expected_response']
-                metrics[f'{paired_cond}_stop_fail_acc'] = stop_fail_with_resp['is_correct'].mean()
-            else:
-                metrics[f'{paired_cond}_stop_fail_acc'] = np.nan
-        else:
-            metrics[f'{paired_cond}_stop_fail_acc'] = np.nan
+    if stim_responses is None and (stim_col is not None or stim_cols):
+        stim_responses = factorize_stimulus_responses(df, [stim_col] if stim_col is not None else stim_cols)
+    if stim_responses is not None and not go_trials.empty:
+        metrics[f'{paired_cond}_stop_fail_acc'] = calculate_stop_fail_acc(df, stim_responses, go_mask, stop_fail_mask)
     else:
         metrics[f'{paired_cond}_stop_fail_acc'] = np.nan
 
     metrics[f'{paired_cond}_stop_success'] = len(df[stop_succ_mask])/len(df[stop_mask]) if len(df[stop_mask]) > 0 else np.nan
     
     # Calculate SSRT for this condition
-    metrics[f'{paired_cond}_ssrt'] = compute_SSRT(df, condition_mask=paired_mask, stim_cols=stim_cols)
+    if ssrt is None:
+        ssrt = compute_SSRT(df, condition_mask=paired_mask, stim_cols=stim_cols)
+    metrics[f'{paired_cond}_ssrt'] = ssrt
 
     if cuedts:
         add_category_accuracies(
@@ -1819,27 +1996,43 @@ def parse_dual_task_condition(paired_cond, paired_task_col):
         else:
             return None, None
 
-def compute_stop_signal_metrics(df, dual_task = False, paired_task_col=None, paired_conditions=None, stim_col=None, stim_cols=[], cuedts=False, spatialts=False):
+# Metric key for each SSRT estimator (prefixed with the condition in dual tasks)
+SSRT_METRIC_NAMES = {
+    'integration': 'ssrt',
+    'mean': 'ssrt_mean',
+    'integration_per_ssd': 'ssrt_integration_per_ssd',
+}
+
+def compute_stop_signal_metrics(df, dual_task = False, paired_task_col=None, paired_conditions=None, stim_col=None, stim_cols=[], cuedts=False, spatialts=False, ssrt_methods=('integration',)):
     """
     Compute stop signal metrics for single stop signal tasks or dual tasks with stop signal.
-    - df: DataFrame
+    - df: test trials (DataFrame or TrialTable); the go/stop/omission masks
+      are built once and shared by every helper below
     - dual_task: if True, handle dual task
     - paired_task_col: column name for the paired task (if dual)
     - paired_conditions: list of paired task conditions (if dual)
     - stim_col: single stimulus column for mapping
     - stim_cols: multiple stimulus columns for mapping
+    - ssrt_methods: SSRT estimators to report (keys from SSRT_METRIC_NAMES); all
+      come from the same pass over go and stop trials
     Returns: dict of metrics
     """
+    # The integration SSRT is always reported; other estimators come after it
+    ssrt_methods = ('integration',) + tuple(m for m in ssrt_methods if m != 'integration')
+    trials = as_trial_table(df)
+    df = trials.test_trials
     if not dual_task:
         # Single stop signal task
-        metrics = calculate_single_stop_signal_metrics(df)
+        metrics = calculate_single_stop_signal_metrics(trials)
         
         # Add SSD stats
-        ssd_stats = calculate_stop_signal_ssd_stats(df)
+        ssd_stats = calculate_stop_signal_ssd_stats(trials)
         metrics.update(ssd_stats)
         
         # Add SSRT
-        metrics['ssrt'] = compute_SSRT(df)
+        _, overall_ssrt = compute_batched_SSRT_estimates(trials, [], methods=ssrt_methods)
+        for method, ssrt in overall_ssrt.items():
+            metrics[SSRT_METRIC_NAMES[method]] = ssrt
         
         return metrics
     else:
@@ -1847,23 +2040,32 @@ def compute_stop_signal_metrics(df, dual_task = False, paired_task_col=None, pai
         metrics = {}
         
         if paired_conditions is not None:
+            # Stimuli and responses are factorized once; each condition only re-counts its go trials
+            stim_keys = [stim_col] if stim_col is not None else stim_cols
+            stim_responses = factorize_stimulus_responses(df, stim_keys) if stim_keys else None
+            paired_masks = {}
             for paired_cond in paired_conditions:
                 # Parse condition and create mask
                 mask_func, args = parse_dual_task_condition(paired_cond, paired_task_col)
                 if mask_func is None:
                     print(f'  WARNING: Could not parse condition "{paired_cond}"')
                     continue
-                    
-                paired_mask = mask_func(df)
-                
+                paired_masks[paired_cond] = mask_func(df)
+            # One SSRT call selects every condition's order statistics
+            condition_ssrt, _ = compute_batched_SSRT_estimates(trials, list(paired_masks.values()), methods=ssrt_methods)
+            for i, (paired_cond, paired_mask) in enumerate(paired_masks.items()):
                 # Calculate metrics for this condition
                 condition_metrics = calculate_dual_stop_signal_condition_metrics(
-                    df, paired_cond, paired_mask, stim_col, stim_cols, cuedts, spatialts
+                    trials, paired_cond, paired_mask, stim_col, stim_cols, cuedts, spatialts, stim_responses,
+                    condition_ssrt['integration'][i],
                 )
+                for method, ssrt in condition_ssrt.items():
+                    if method != 'integration':
+                        condition_metrics[f'{paired_cond}_{SSRT_METRIC_NAMES[method]}'] = ssrt[i]
                 metrics.update(condition_metrics)
         
         # Add SSD stats (calculated across all stop trials)
-        ssd_stats = calculate_stop_signal_ssd_stats(df)
+        ssd_stats = calculate_stop_signal_ssd_stats(trials)
         metrics.update(ssd_stats)
         # Note: SSRT is now calculated per condition in calculate_dual_stop_signal_condition_metrics
         
@@ -1944,7 +2146,7 @@ def get_stop_trials_info(df, condition_mask=None, stim_cols=None):
     
     stop_failure = stop_df[stop_df['rt'] > 0]
     p_respond = len(stop_failure) / len(stop_df)
-    avg_SSD = stop_df['SS_delay'].mean()
+    avg_SSD = stop_df['SS_delay'].astype(float).mean()
     
     return p_respond, avg_SSD
 
@@ -1977,21 +2179,68 @@ def compute_SSRT(df, condition_mask=None, max_go_rt=2000, stim_cols=[]):
     
     Args:
         df (pd.DataFrame): DataFrame containing task data
+        condition_mask (pd.Series, optional): Restrict to trials of one condition
         max_go_rt (float): Maximum RT to use for missing values
         
     Returns:
         float: SSRT value
     """
-    # Get go trial RTs
-    sorted_go_rt = get_go_trials_rt(df, max_go_rt, condition_mask)
+    condition_masks = [] if condition_mask is None else [condition_mask]
+    ssrt, overall_ssrt = compute_batched_SSRT(df, condition_masks, max_go_rt)
+    return overall_ssrt if condition_mask is None else ssrt[0]
+
+def compute_batched_SSRT(df, condition_masks, max_go_rt=2000):
+    """
+    Compute SSRT for several conditions and across all trials in one call.
     
-    # Get stop trial information
-    p_respond, avg_SSD = get_stop_trials_info(df, condition_mask, stim_cols)
+    Args:
+        df (pd.DataFrame): DataFrame containing task data
+        condition_masks (list): Boolean masks, one per condition
+        max_go_rt (float): Maximum RT to use for missing values
+        
+    Returns:
+        tuple: (np.ndarray of SSRT per condition, overall SSRT)
+    """
+    ssrt, overall_ssrt = compute_batched_SSRT_estimates(df, condition_masks, max_go_rt)
+    return ssrt['integration'], overall_ssrt['integration']
+
+def compute_batched_SSRT_estimates(df, condition_masks, max_go_rt=2000, methods=('integration',)):
+    """
+    Compute SSRT estimators for several conditions and across all trials in one call.
     
-    # Get nth RT
-    nth_rt = get_nth_rt(sorted_go_rt, p_respond)
-    # Calculate SSRT
-    if avg_SSD is not None and not np.isnan(avg_SSD) and not np.isnan(nth_rt):
-        return nth_rt - avg_SSD
-    else:
-        return np.nan
\ No newline at end of file
+    Conditions may overlap (e.g. n-back collapsed and per-delay conditions):
+    each condition's rows get their own code, and every condition's order
+    statistics come from one partitioned or sorted go RT array.
+    
+    Args:
+        df (pd.DataFrame | TrialTable): Test trials
+        condition_masks (list): Boolean masks, one per condition
+        max_go_rt (float): Maximum RT to use for missing values
+        methods (tuple): SSRT estimators (see SSRT_METHODS)
+        
+    Returns:
+        tuple: (dict of method -> np.ndarray of SSRT per condition,
+        dict of method -> overall SSRT)
+    """
+    trials = as_trial_table(df)
+    df = trials.test_trials
+    n_conditions = len(condition_masks)
+    rows = [np.flatnonzero(mask_codes(mask, df.index)) for mask in condition_masks]
+    # The last code holds every row for the overall SSRT
+    rows.append(np.arange(len(df)))
+    row_index = np.concatenate(rows)
+    codes = np.repeat(np.arange(n_conditions + 1), [len(r) for r in rows])
+    estimates = ssrt_estimates_by_code(
+        codes,
+        n_conditions + 1,
+        trials.go_mask.to_numpy(dtype=bool, na_value=False)[row_index],
+        trials.stop_mask.to_numpy(dtype=bool, na_value=False)[row_index],
+        as_float_array(df['rt'])[row_index],
+        as_float_array(df['SS_delay'])[row_index],
+        max_go_rt,
+        methods,
+    )
+    return (
+        {method: ssrt[:n_conditions] for method, ssrt in estimates.items()},
+        {method: ssrt[n_conditions] for method, ssrt in estimates.items()},
+    )
@@ -0,0 +1,167 @@
+"""
+Per-task read schemas for behavioral CSVs.
+
+jsPsych exports are wide, but the metric code (get_task_metrics), the RT tail
+cutoff (preprocess_rt_tail_cutoff) and violations (compute_violations) only
+touch a handful of columns per task. The schema for a task is the union of the
+columns every component of its name needs, so only those are parsed, with
+fixed dtypes for condition and timing columns. compact_trial_table can then
+shrink the parsed frame further without changing any metric.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Columns used by trimming, overall accuracy and the shared metric helpers
+COMMON_READ_COLUMNS = ['trial_id', 'rt', 'key_press', 'correct_trial', 'correct', 'correct_response']
+
+# Extra columns read for each task component (single tasks and both halves of dual tasks)
+COMPONENT_READ_COLUMNS = {
+    'flanker': ['flanker_condition', 'center_letter'],
+    'go_nogo': ['go_nogo_condition', 'stim', 'task'],
+    'n_back': ['n_back_condition', 'delay', 'curr_task'],
+    'stop_signal': ['SS_trial_type', 'SS_delay', 'stop_signal_condition', 'stim'],
+    'shape_matching': ['shape_matching_condition', 'task'],
+    'directed_forgetting': ['directed_forgetting_condition', 'cued_dimension'],
+    'cued_task_switching': ['cue_condition', 'task_condition', 'task', 'stim_number', 'cued_dimension'],
+    'spatial_task_switching': ['task_switch', 'task_switch_condition', 'number', 'predictable_dimension'],
+}
+
+# Spellings of each component in task names, after lower-casing and dropping underscores
+COMPONENT_ALIASES = {
+    'flanker': ['flanker'],
+    'go_nogo': ['gonogo'],
+    'n_back': ['nback'],
+    'stop_signal': ['stopsignal'],
+    'shape_matching': ['shapematching'],
+    'directed_forgetting': ['directedforgetting'],
+    'cued_task_switching': ['cuedtaskswitching', 'cuedts'],
+    'spatial_task_switching': ['spatialtaskswitching', 'spatialts'],
+}
+
+# Condition labels are compared as strings; timing columns are always float
+READ_DTYPES = {
+    'trial_id': str,
+    'SS_trial_type': str,
+    'flanker_condition': str,
+    'go_nogo_condition': str,
+    'n_back_condition': str,
+    'shape_matching_condition': str,
+    'directed_forgetting_condition': str,
+    'stop_signal_condition': str,
+    'cue_condition': str,
+    'task_condition': str,
+    'task_switch': str,
+    'task_switch_condition': str,
+    'rt': 'float64',
+    'SS_delay': 'float64',
+}
+
+# Columns compact_trial_table turns into categoricals, integer flags and float32 timings
+CATEGORICAL_COLUMNS = [col for col, dtype in READ_DTYPES.items() if dtype is str]
+INTEGER_FLAG_COLUMNS = ['correct_trial', 'key_press']
+FLOAT32_COLUMNS = ['rt', 'SS_delay']
+
+
+def get_task_components(task_name):
+    """
+    Get the task components named in a task name.
+
+    Args:
+        task_name (str): Task name, e.g. 'stop_signal_with_flanker' or 'CuedTS_spatialTS'
+
+    Returns:
+        list: Component keys of COMPONENT_READ_COLUMNS, in dictionary order
+    """
+    normalized = task_name.lower().replace('_', '')
+    return [
+        component for component, aliases in COMPONENT_ALIASES.items()
+        if any(alias in normalized for alias in aliases)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_task_read_columns(task_name):
+    """
+    Get the columns to parse for a task.
+
+    Args:
+        task_name (str): Task name
+
+    Returns:
+        frozenset | None: Column names, or None to read every column when no
+        known component appears in the task name
+    """
+    components = get_task_components(task_name)
+    if not components:
+        return None
+    columns = set(COMMON_READ_COLUMNS)
+    for component in components:
+        columns.update(COMPONENT_READ_COLUMNS[component])
+    return frozenset(columns)
+
+
+def read_task_csv(source, task_name):
+    """
+    Read a behavioral CSV with the task's read schema.
+
+    Columns outside the schema are skipped and missing schema columns are
+    ignored. If a float column holds text the read is retried with it left
+    to inference; preprocess_rt_tail_cutoff coerces rt to numeric afterwards.
+
+    Args:
+        source (str | Path | file-like): CSV path or buffer
+        task_name (str): Task name used to pick the schema
+
+    Returns:
+        pd.DataFrame: Trial data restricted to the schema columns
+    """
+    columns = get_task_read_columns(task_name)
+    usecols = None if columns is None else columns.__contains__
+    try:
+        return pd.read_csv(source, usecols=usecols, dtype=READ_DTYPES)
+    except ValueError:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        string_dtypes = {col: dtype for col, dtype in READ_DTYPES.items() if dtype is str}
+        return pd.read_csv(source, usecols=usecols, dtype=string_dtypes)
+
+
+def compact_trial_table(df):
+    """
+    Shrink a trial table without changing any value the metric code reads.
+
+    Condition and trial_id columns become categoricals, correct_trial and
+    key_press become the smallest integer dtype that holds them (int8 for the
+    usual 0/1 and -1/key codes), and rt and SS_delay become float32. A column
+    is only converted when the conversion is exact: flags with missing values
+    and timings that float32 cannot represent (e.g. sub-millisecond RTs) keep
+    their dtype.
+
+    Args:
+        df (pd.DataFrame): Trial data from read_task_csv
+
+    Returns:
+        pd.DataFrame: New frame with compacted columns; df is left unchanged
+    """
+    columns = {}
+    for col in df.columns.intersection(CATEGORICAL_COLUMNS):
+        if df[col].dtype == object:
+            columns[col] = df[col].astype('category')
+    for col in df.columns.intersection(INTEGER_FLAG_COLUMNS):
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) and values.notna().all() and (values == values.round()).all():
+            columns[col] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+    for col in df.columns.intersection(FLOAT32_COLUMNS):
+        values = df[col]
+        if values.dtype == np.float64:
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.to_numpy(dtype=np.float64), values.to_numpy(), equal_nan=True):
+                columns[col] = narrowed
+    return df.assign(**columns) if columns else df
+
+
+def frame_memory(df):
+    """Bytes held by a DataFrame, including the contents of object columns."""
+    return int(df.memory_usage(index=True, deep=True).sum())
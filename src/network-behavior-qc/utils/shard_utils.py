@@ -0,0 +1,140 @@
+"""
+Utilities for splitting per-file QC across cluster nodes and merging the results.
+
+Each shard processes the subjects whose stable hash falls into its partition
+and writes its per-file results to a JSON file in a shared shard directory.
+The merge step loads every shard, orders results by input path and hands them
+to the usual downstream stages (summary rows, exclusions, flags, violations).
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from utils.cache_utils import json_default
+from utils.pipeline_utils import QCResult
+
+
+def parse_shard_spec(spec):
+    """
+    Parse an 'i/N' shard specification.
+
+    Shard indices are zero-based so they line up with SLURM_ARRAY_TASK_ID
+    for an array declared as --array=0-(N-1).
+
+    Args:
+        spec (str): Shard specification such as '2/8'
+
+    Returns:
+        tuple: (index, count)
+
+    Raises:
+        ValueError: If the specification is malformed or out of range
+    """
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like 'i/N', got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {spec!r}")
+    return index, count
+
+
+def subject_shard(subject_id, count):
+    """
+    Assign a subject to a shard using a hash that is stable across processes and machines.
+
+    Args:
+        subject_id (str): Subject folder name, e.g. 's03'
+        count (int): Number of shards
+
+    Returns:
+        int: Shard index in [0, count)
+    """
+    digest = hashlib.sha256(subject_id.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def shard_file(shard_dir, index, count):
+    """Path of the results file for one shard."""
+    return Path(shard_dir) / f"shard-{index:04d}-of-{count:04d}.json"
+
+
+def write_shard(shard_dir, index, count, header, tasks, units, results):
+    """
+    Atomically write one shard's per-file results.
+
+    Args:
+        shard_dir (Path): Directory shared by all shards
+        index (int): Shard index
+        count (int): Number of shards
+        header (dict): Settings header (see incremental_utils.state_header)
+        tasks (list): Tasks discovered from the full manifest
+        units (list): QCUnit list processed by this shard
+        results (list): QCResult for each unit, in the same order
+
+    Returns:
+        Path: Path of the written shard file
+    """
+    path = shard_file(shard_dir, index, count)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        'header': header,
+        'shard': [index, count],
+        'tasks': list(tasks),
+        'results': [{'path': unit.path, 'result': result.to_dict()} for unit, result in zip(units, results)],
+    }
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, default=json_default)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_shards(shard_dir, header):
+    """
+    Load and combine every shard in a directory.
+
+    Results are ordered by input path, the input manifest's order, so the
+    merged outputs match a single run and do not depend on which node
+    finished first.
+
+    Args:
+        shard_dir (Path): Directory written to by write_shard
+        header (dict): Expected settings header; every shard must match it
+
+    Returns:
+        tuple: (tasks, results) with tasks in first-seen order across shards
+        and results as a list of QCResult sorted by path
+
+    Raises:
+        ValueError: If shards are missing, disagree on the shard count, or
+        were produced with different settings
+    """
+    paths = sorted(Path(shard_dir).glob('shard-*-of-*.json'))
+    if not paths:
+        raise ValueError(f"No shard files found in {shard_dir}")
+    tasks = []
+    entries = []
+    seen = set()
+    counts = set()
+    for path in paths:
+        with open(path, 'r') as f:
+            shard = json.load(f)
+        if shard['header'] != header:
+            raise ValueError(f"{path.name} was produced with different settings or engine version")
+        index, count = shard['shard']
+        seen.add(index)
+        counts.add(count)
+        for task in shard['tasks']:
+            if task not in tasks:
+                tasks.append(task)
+        entries.extend(shard['results'])
+    if len(counts) != 1:
+        raise ValueError(f"Shard files disagree on the number of shards: {sorted(counts)}")
+    count = counts.pop()
+    missing = sorted(set(range(count)) - seen)
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count} in {shard_dir}")
+    entries.sort(key=lambda entry: entry['path'])
+    return tasks, [QCResult.from_dict(entry['result']) for entry in entries]
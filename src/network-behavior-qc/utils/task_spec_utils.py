@@ -0,0 +1,438 @@
+"""
+Declarative registry of task specs.
+
+Each supported task (single or dual) is described once: its components, the
+metric engine that computes it, condition lists and columns, stimulus columns
+and engine flags. get_task_metrics and get_task_columns both dispatch on the
+spec resolved from a task name, and the read schema comes from the same
+components, so adding a task means adding one entry here.
+
+Task names found in input filenames are resolved here as well: resolve_task
+and resolve_task_filename turn a name or filename into its canonical task
+name, components, dual flag and BIDS name, once per distinct name.
+"""
+import functools
+import re
+from dataclasses import dataclass, field
+
+from utils.globals import (
+    CUED_TASK_SWITCHING_CONDITIONS,
+    CUED_TASK_SWITCHING_WITH_DIRECTED_FORGETTING_CONDITIONS,
+    DIRECTED_FORGETTING_CONDITIONS,
+    FLANKER_CONDITIONS,
+    FLANKER_WITH_CUED_CONDITIONS,
+    FLANKER_WITH_CUED_CONDITIONS_FMRI,
+    GO_NOGO_CONDITIONS,
+    GO_NOGO_WITH_CUED_CONDITIONS,
+    SHAPE_MATCHING_CONDITIONS,
+    SHAPE_MATCHING_CONDITIONS_WITH_DIRECTED_FORGETTING,
+    SHAPE_MATCHING_WITH_CUED_CONDITIONS,
+    SPATIAL_TASK_SWITCHING_CONDITIONS,
+    SPATIAL_WITH_CUED_CONDITIONS,
+)
+from utils.schema_utils import get_task_read_columns
+from utils.trimmed_behavior_utils import get_bids_task_name
+
+# Spellings of each component accepted in task names (canonical first)
+COMPONENT_SPELLINGS = {
+    'cued_task_switching': ('cued_task_switching', 'CuedTS', 'cuedTS'),
+    'spatial_task_switching': ('spatial_task_switching', 'spatialTS'),
+    'directed_forgetting': ('directed_forgetting', 'directedForgetting'),
+    'shape_matching': ('shape_matching',),
+    'stop_signal': ('stop_signal', 'stopSignal'),
+    'go_nogo': ('go_nogo',),
+    'n_back': ('n_back', 'NBack'),
+    'flanker': ('flanker',),
+}
+
+# Spellings of each component accepted in lowercased fMRI filenames, in the
+# order a dual task's components are listed when the name is built
+FILENAME_SPELLINGS = {
+    'stop_signal': ('stop_signal', 'stopsignal', 'stop-signal'),
+    'go_nogo': ('go_nogo', 'gonogo', 'go-nogo'),
+    'shape_matching': ('shape_matching', 'shapematching', 'shape-matching'),
+    'directed_forgetting': ('directed_forgetting', 'directedforgetting', 'directed-forgetting'),
+    'spatial_task_switching': ('spatial_task_switching', 'spatialtaskswitching', 'spatial-task-switching'),
+    'flanker': ('flanker',),
+    'cued_task_switching': ('cued_task_switching', 'cuedtaskswitching', 'cued-task-switching'),
+    'n_back': ('n_back', 'nback', 'n-back'),
+}
+
+# Out-of-scanner task names written differently from the task they belong to
+TASK_NAME_ALIASES = {
+    'stop_signal_with_go_no_go': 'stop_signal_with_go_nogo',
+}
+
+_FILENAME_PATTERNS = tuple(
+    (component, re.compile('|'.join(re.escape(spelling) for spelling in spellings)))
+    for component, spellings in FILENAME_SPELLINGS.items()
+)
+_NAME_PATTERNS = tuple(
+    (component, re.compile('|'.join(re.escape(spelling) for spelling in spellings)))
+    for component, spellings in COMPONENT_SPELLINGS.items()
+)
+OUT_OF_SCANNER_FILENAME_PATTERN = re.compile(r"s\d{2,}_(.*)\.csv")
+# Leading subject id of an fMRI filename; it holds no component spelling, so it
+# is dropped before inference and files of all subjects share one cache entry
+_SUBJECT_PREFIX_PATTERN = re.compile(r"s\d+_")
+
+# Columns read by the shared stop signal kernels for the stop signal metrics
+STOP_SIGNAL_COLUMNS = [
+    'subject_id',
+    'go_rt',
+    'stop_fail_rt',
+    'go_acc',
+    'stop_fail_acc',
+    'stop_success',
+    'go_omission_rate',
+    'go_commission_rate',
+    'avg_ssd',
+    'min_ssd',
+    'max_ssd',
+    'min_ssd_count',
+    'max_ssd_count',
+    'ssrt',
+]
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    """How one task's metrics and QC columns are computed."""
+    task_id: str
+    components: tuple
+    # 'conditions', 'cued_task_switching', 'cued_spatial_task_switching', 'n_back' or 'stop_signal'
+    engine: str
+    # conditions engine: component -> condition list and component -> condition column, in metric order
+    conditions: dict = field(default_factory=dict)
+    condition_columns: dict = field(default_factory=dict)
+    # cued task switching engines: condition list (out of scanner / in scanner) and condition type
+    condition_list: list | None = None
+    fmri_condition_list: list | None = None
+    condition_type: str | None = None
+    # Column holding the paired task's condition (cued, n-back and stop signal duals)
+    paired_col: str | None = None
+    # Fixed paired conditions instead of the values found in the data
+    paired_conditions: list | None = None
+    stim_col: str | None = None
+    stim_cols: list = field(default_factory=list)
+    # Keyword flags passed to the engine (spatialts, shapematching, gonogo, cuedts, ...)
+    flags: dict = field(default_factory=dict)
+    # Columns replaced by an in-scanner column when the file has it
+    in_scanner_columns: dict = field(default_factory=dict)
+    # Whether get_task_metrics adds overall_acc (add_overall_accuracy still skips go_nogo/stop signal)
+    overall_acc: bool = True
+    # Drop metrics whose key contains 'new'
+    drop_new: bool = False
+
+    @property
+    def is_dual(self):
+        return len(self.components) > 1
+
+    @property
+    def go_nogo_columns(self):
+        """Whether QC columns use the go/nogo metric set (no omission/commission for nogo)."""
+        return 'go_nogo' in self.components
+
+    @property
+    def read_columns(self):
+        """Columns to parse from the task's CSVs (see schema_utils)."""
+        return get_task_read_columns(self.task_id)
+
+
+def _conditions_spec(task_id, conditions, condition_columns, **kwargs):
+    return TaskSpec(task_id, tuple(conditions), 'conditions', conditions=conditions,
+                    condition_columns=condition_columns, **kwargs)
+
+
+# Dual tasks in resolution order: the first spec whose components all appear in the name wins
+DUAL_TASK_SPECS = [
+    _conditions_spec(
+        'directed_forgetting_with_flanker',
+        {'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS, 'flanker': FLANKER_CONDITIONS},
+        {'directed_forgetting': 'directed_forgetting_condition', 'flanker': 'flanker_condition'},
+    ),
+    _conditions_spec(
+        'go_nogo_with_directed_forgetting',
+        {'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS, 'go_nogo': GO_NOGO_CONDITIONS},
+        {'directed_forgetting': 'directed_forgetting_condition', 'go_nogo': 'go_nogo_condition'},
+    ),
+    _conditions_spec(
+        'go_nogo_with_flanker',
+        {'flanker': FLANKER_CONDITIONS, 'go_nogo': GO_NOGO_CONDITIONS},
+        {'flanker': 'flanker_condition', 'go_nogo': 'go_nogo_condition'},
+    ),
+    _conditions_spec(
+        'directed_forgetting_with_shape_matching',
+        {'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS,
+         'shape_matching': SHAPE_MATCHING_CONDITIONS_WITH_DIRECTED_FORGETTING},
+        {'directed_forgetting': 'directed_forgetting_condition', 'shape_matching': 'shape_matching_condition'},
+    ),
+    _conditions_spec(
+        'go_nogo_with_shape_matching',
+        {'go_nogo': GO_NOGO_CONDITIONS, 'shape_matching': SHAPE_MATCHING_CONDITIONS},
+        {'go_nogo': 'go_nogo_condition', 'shape_matching': 'shape_matching_condition'},
+    ),
+    _conditions_spec(
+        'flanker_with_shape_matching',
+        {'flanker': FLANKER_CONDITIONS, 'shape_matching': SHAPE_MATCHING_CONDITIONS},
+        {'flanker': 'flanker_condition', 'shape_matching': 'shape_matching_condition'},
+    ),
+    _conditions_spec(
+        'spatial_task_switching_with_directed_forgetting',
+        {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS, 'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS},
+        {'spatial_task_switching': 'task_switch', 'directed_forgetting': 'directed_forgetting_condition'},
+        flags={'spatialts': True, 'directedforgetting': True},
+    ),
+    _conditions_spec(
+        'flanker_with_spatial_task_switching',
+        {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS, 'flanker': FLANKER_CONDITIONS},
+        {'spatial_task_switching': 'task_switch', 'flanker': 'flanker_condition'},
+        flags={'spatialts': True},
+        overall_acc=False,
+    ),
+    _conditions_spec(
+        'go_nogo_with_spatial_task_switching',
+        {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS, 'go_nogo': GO_NOGO_CONDITIONS},
+        {'spatial_task_switching': 'task_switch', 'go_nogo': 'go_nogo_condition'},
+        flags={'spatialts': True, 'gonogo': True},
+    ),
+    _conditions_spec(
+        'shape_matching_with_spatial_task_switching',
+        {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS, 'shape_matching': SHAPE_MATCHING_CONDITIONS},
+        {'spatial_task_switching': 'task_switch', 'shape_matching': 'shape_matching_condition'},
+        flags={'spatialts': True, 'shapematching': True},
+    ),
+    TaskSpec(
+        'spatial_task_switching_with_cued_task_switching', ('cued_task_switching', 'spatial_task_switching'),
+        'cued_spatial_task_switching', condition_list=SPATIAL_WITH_CUED_CONDITIONS,
+    ),
+    TaskSpec(
+        'flanker_with_cued_task_switching', ('flanker', 'cued_task_switching'), 'cued_task_switching',
+        condition_list=FLANKER_WITH_CUED_CONDITIONS, fmri_condition_list=FLANKER_WITH_CUED_CONDITIONS_FMRI,
+        condition_type='flanker', paired_col='flanker_condition',
+    ),
+    TaskSpec(
+        'go_nogo_with_cued_task_switching', ('go_nogo', 'cued_task_switching'), 'cued_task_switching',
+        condition_list=GO_NOGO_WITH_CUED_CONDITIONS, condition_type='go_nogo', paired_col='go_nogo_condition',
+    ),
+    TaskSpec(
+        'shape_matching_with_cued_task_switching', ('shape_matching', 'cued_task_switching'), 'cued_task_switching',
+        # Conditions with 'new' in them are not reported
+        condition_list=[c for c in SHAPE_MATCHING_WITH_CUED_CONDITIONS if 'new' not in c],
+        condition_type='shape_matching', paired_col='shape_matching_condition', drop_new=True,
+    ),
+    TaskSpec(
+        'cued_task_switching_with_directed_forgetting', ('directed_forgetting', 'cued_task_switching'),
+        'cued_task_switching', condition_list=CUED_TASK_SWITCHING_WITH_DIRECTED_FORGETTING_CONDITIONS,
+        condition_type='directed_forgetting', paired_col='directed_forgetting_condition',
+    ),
+    TaskSpec('go_nogo_with_n_back', ('n_back', 'go_nogo'), 'n_back', paired_col='go_nogo_condition',
+             flags={'gonogo': True}),
+    TaskSpec('n_back_with_flanker', ('n_back', 'flanker'), 'n_back', paired_col='flanker_condition'),
+    TaskSpec('n_back_with_shape_matching', ('n_back', 'shape_matching'), 'n_back', paired_col='shape_matching_condition',
+             flags={'shapematching': True}),
+    TaskSpec('n_back_with_directed_forgetting', ('n_back', 'directed_forgetting'), 'n_back',
+             paired_col='directed_forgetting_condition'),
+    TaskSpec('n_back_with_cued_task_switching', ('n_back', 'cued_task_switching'), 'n_back', flags={'cuedts': True}),
+    TaskSpec('n_back_with_spatial_task_switching', ('n_back', 'spatial_task_switching'), 'n_back',
+             paired_col='task_switch', flags={'spatialts': True},
+             in_scanner_columns={'task_switch': 'task_switch_condition'}),
+    TaskSpec('stop_signal_with_flanker', ('stop_signal', 'flanker'), 'stop_signal', paired_col='flanker_condition',
+             stim_col='center_letter'),
+    TaskSpec('stop_signal_with_go_nogo', ('stop_signal', 'go_nogo'), 'stop_signal', paired_col='go_nogo_condition',
+             # Only the go condition is split by stop trials; nogo gets its own summary metrics
+             paired_conditions=['go'], stim_col='stim'),
+    TaskSpec('stop_signal_with_shape_matching', ('stop_signal', 'shape_matching'), 'stop_signal',
+             paired_col='shape_matching_condition', stim_col='shape_matching_condition'),
+    TaskSpec('stop_signal_with_directed_forgetting', ('stop_signal', 'directed_forgetting'), 'stop_signal',
+             paired_col='directed_forgetting_condition', stim_col='directed_forgetting_condition'),
+    TaskSpec('stop_signal_with_spatial_task_switching', ('stop_signal', 'spatial_task_switching'), 'stop_signal',
+             paired_col='task_switch', stim_cols=['number', 'predictable_dimension'], flags={'spatialts': True}),
+    TaskSpec('stop_signal_with_n_back', ('stop_signal', 'n_back'), 'stop_signal', stim_col='n_back_condition'),
+    TaskSpec('stop_signal_with_cued_task_switching', ('stop_signal', 'cued_task_switching'), 'stop_signal',
+             stim_cols=['stim_number', 'task'], flags={'cuedts': True}),
+]
+
+# Single tasks in resolution order
+SINGLE_TASK_SPECS = [
+    TaskSpec('n_back_single_task_network', ('n_back',), 'n_back'),
+    TaskSpec('cued_task_switching_single_task_network', ('cued_task_switching',), 'cued_task_switching',
+             condition_list=CUED_TASK_SWITCHING_CONDITIONS, condition_type='single'),
+    _conditions_spec(
+        'spatial_task_switching_single_task_network',
+        {'spatial_task_switching': SPATIAL_TASK_SWITCHING_CONDITIONS},
+        {'spatial_task_switching': 'task_switch'},
+        flags={'spatialts': True},
+        in_scanner_columns={'task_switch': 'task_switch_condition'},
+    ),
+    TaskSpec('stop_signal_single_task_network', ('stop_signal',), 'stop_signal'),
+    _conditions_spec('directed_forgetting_single_task_network',
+                     {'directed_forgetting': DIRECTED_FORGETTING_CONDITIONS},
+                     {'directed_forgetting': 'directed_forgetting_condition'}),
+    _conditions_spec('flanker_single_task_network', {'flanker': FLANKER_CONDITIONS}, {'flanker': 'flanker_condition'}),
+    _conditions_spec('go_nogo_single_task_network', {'go_nogo': GO_NOGO_CONDITIONS}, {'go_nogo': 'go_nogo_condition'}),
+    _conditions_spec('shape_matching_single_task_network', {'shape_matching': SHAPE_MATCHING_CONDITIONS},
+                     {'shape_matching': 'shape_matching_condition'}),
+]
+
+
+@dataclass(frozen=True)
+class ResolvedTask:
+    """What a task name resolves to."""
+    task_name: str
+    # Component keys of COMPONENT_SPELLINGS whose spellings appear in the name, in registry order
+    components: tuple
+    # 2 or more distinct components spelled canonically
+    is_dual: bool
+    # BIDS task label (see get_bids_task_name), None if no component matches
+    bids_name: str | None
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_task(task_name):
+    """
+    Resolve a task name to its components, dual flag and BIDS name.
+
+    Known aliases (TASK_NAME_ALIASES) are replaced by their canonical name
+    first. Results are memoized per name.
+
+    Args:
+        task_name (str): Task name, e.g. 'stop_signal_with_go_no_go'
+
+    Returns:
+        ResolvedTask: The resolved task
+    """
+    task_name = TASK_NAME_ALIASES.get(task_name, task_name)
+    components = tuple(component for component, pattern in _NAME_PATTERNS if pattern.search(task_name))
+    return ResolvedTask(
+        task_name=task_name,
+        components=components,
+        is_dual=sum(1 for component in COMPONENT_SPELLINGS if component in task_name) >= 2,
+        bids_name=get_bids_task_name(task_name),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _infer_task_name(name):
+    parts = [component for component, pattern in _FILENAME_PATTERNS if pattern.search(name)]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return f"{parts[0]}_single_task_network"
+    # Dual task: stable canonical order with 'with'
+    # Prefer stop_signal first if present, else lexicographic for consistency
+    if 'stop_signal' in parts:
+        parts.remove('stop_signal')
+        return f"stop_signal_with_{parts[0]}"
+    first, second = sorted(parts)[:2]
+    return f"{first}_with_{second}"
+
+
+def infer_task_name_from_filename(fname: str) -> str | None:
+    """
+    Infer a task name from the component spellings in an fMRI filename.
+
+    One component gives '<component>_single_task_network'; two or more give
+    'stop_signal_with_<other>' when stop signal is one of them, otherwise
+    '<first>_with_<second>' in lexicographic order.
+
+    Args:
+        fname (str): File name
+
+    Returns:
+        str | None: Task name, or None if no component spelling appears
+    """
+    name = fname.lower()
+    match = _SUBJECT_PREFIX_PATTERN.match(name)
+    if match:
+        name = name[match.end():]
+    return _infer_task_name(name)
+
+
+def extract_task_name_out_of_scanner(filename):
+    """
+    Extract task name from filename using regex pattern.
+
+    Args:
+        filename (str): Name of the file
+
+    Returns:
+        str: Extracted task name or None if pattern doesn't match
+    """
+    match = OUT_OF_SCANNER_FILENAME_PATTERN.match(filename)
+    if match:
+        return match.group(1)
+    return None
+
+
+def resolve_task_filename(filename, is_fmri):
+    """
+    Resolve the task of an input file from its name.
+
+    fMRI filenames are inferred from their component spellings (see
+    infer_task_name_from_filename); out-of-scanner filenames carry the task
+    name in the 's<id>_<task>.csv' pattern, with aliases resolved.
+
+    Args:
+        filename (str): File name
+        is_fmri (bool): Whether the file is an in-scanner session file
+
+    Returns:
+        ResolvedTask | None: The resolved task, or None if no task name is found
+    """
+    if is_fmri:
+        task_name = infer_task_name_from_filename(filename)
+    else:
+        task_name = extract_task_name_out_of_scanner(filename)
+    if task_name is None:
+        return None
+    return resolve_task(task_name)
+
+
+def is_dual_task(task_name):
+    """
+    Check if the task is a dual task by counting distinct task components.
+
+    A dual task contains 2 or more distinct task components (canonical spellings
+    only). This works for both predefined names (e.g., "flanker_with_cued_task_switching")
+    and inferred names (e.g., "cued_task_switching_with_flanker").
+    """
+    return resolve_task(task_name).is_dual
+
+
+def get_name_components(task_name):
+    """
+    Get the components whose spellings appear in a task name.
+
+    Args:
+        task_name (str): Task name
+
+    Returns:
+        set: Component keys of COMPONENT_SPELLINGS
+    """
+    return set(resolve_task(task_name).components)
+
+
+@functools.lru_cache(maxsize=None)
+def get_task_spec(task_name):
+    """
+    Resolve a task name to its spec.
+
+    Dual tasks (see is_dual_task) take the first DUAL_TASK_SPECS entry whose
+    components all appear in the name; single tasks the first matching
+    SINGLE_TASK_SPECS entry. Results are memoized, so dispatch costs one
+    dictionary lookup per file.
+
+    Args:
+        task_name (str): Task name, e.g. 'flanker_with_cued_task_switching'
+
+    Returns:
+        TaskSpec | None: The spec, or None if no registered task matches
+    """
+    resolved = resolve_task(task_name)
+    components = set(resolved.components)
+    specs = DUAL_TASK_SPECS if resolved.is_dual else SINGLE_TASK_SPECS
+    for spec in specs:
+        if components.issuperset(spec.components):
+            return spec
+    return None
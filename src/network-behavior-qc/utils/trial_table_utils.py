@@ -0,0 +1,112 @@
+"""
+Per-file trial table shared by the metric engines and violations.
+
+A TrialTable is built once per file. The test-trial view, numeric coercions
+and the go/stop/omission/correct masks are computed on first use and cached,
+so get_task_metrics, add_overall_accuracy, compute_violations and the stop
+signal and go/nogo helpers all read the same objects instead of filtering
+and re-masking the file again. Cached views and masks are shared: callers
+combine them into new masks and never modify them in place.
+"""
+import functools
+
+import pandas as pd
+
+
+def filter_to_test_trials(df, task_name):
+    """
+    Filter the dataframe to only include test trials.
+
+    Args:
+        df (pd.DataFrame): Input dataframe
+        task_name (str): Name of the task
+
+    Returns:
+        pd.DataFrame: Filtered dataframe
+    """
+    if task_name == 'cued_task_switching_with_flanker':
+        # For in-scanner flanker+cued: include both test_trial and test_cue rows
+        # test_cue contains the stay/switch information needed for condition matching
+        if 'trial_id' in df.columns:
+            filtered = df[df['trial_id'].isin(['test_trial', 'test_cue'])]
+            return filtered if len(filtered) > 0 else df
+        return df
+
+    if 'trial_id' in df.columns:
+        filtered = df[df['trial_id'] == 'test_trial']
+        # If filter removes everything (in-scanner may not label), fall back to original
+        return filtered if len(filtered) > 0 else df
+    return df
+
+
+class TrialTable:
+    """One file's trials with lazily cached test-trial view, numeric columns and masks."""
+
+    def __init__(self, df, task_name=None, filtered=False):
+        """
+        Args:
+            df (pd.DataFrame): The file's trials
+            task_name (str, optional): Task name, picks the test-trial filter
+            filtered (bool): df already holds only test trials
+        """
+        self.df = df
+        self.task_name = task_name
+        self._filtered = filtered
+        self._numeric = {}
+        self._masks = {}
+
+    @functools.cached_property
+    def test_trials(self):
+        """Test trials (see filter_to_test_trials)."""
+        if self._filtered:
+            return self.df
+        return filter_to_test_trials(self.df, self.task_name)
+
+    def numeric(self, column):
+        """Test-trial column coerced with pd.to_numeric (unparseable values become NaN)."""
+        if column not in self._numeric:
+            self._numeric[column] = pd.to_numeric(self.test_trials[column], errors='coerce')
+        return self._numeric[column]
+
+    def _mask(self, name, column, value):
+        if name not in self._masks:
+            self._masks[name] = self.test_trials[column] == value
+        return self._masks[name]
+
+    @property
+    def go_mask(self):
+        """Test trials with SS_trial_type 'go'."""
+        return self._mask('go', 'SS_trial_type', 'go')
+
+    @property
+    def stop_mask(self):
+        """Test trials with SS_trial_type 'stop'."""
+        return self._mask('stop', 'SS_trial_type', 'stop')
+
+    @property
+    def omission_mask(self):
+        """Test trials without a response (key_press -1)."""
+        return self._mask('omission', 'key_press', -1)
+
+    @property
+    def correct_mask(self):
+        """Test trials with correct_trial 1."""
+        return self._mask('correct', 'correct_trial', 1)
+
+
+def as_trial_table(df, task_name=None):
+    """
+    Get a TrialTable for engine input.
+
+    Args:
+        df (pd.DataFrame | TrialTable): A TrialTable is returned as is; a
+            DataFrame is wrapped, filtered to test trials when task_name is
+            given and taken as test trials already otherwise
+        task_name (str, optional): Task name for the test-trial filter
+
+    Returns:
+        TrialTable: The table
+    """
+    if isinstance(df, TrialTable):
+        return df
+    return TrialTable(df, task_name, filtered=task_name is None)
@@ -3,7 +3,9 @@ import os
 from pathlib import Path
 import re
 import numpy as np
-from utils.qc_utils import filter_to_test_trials, sort_subject_ids
+from utils.qc_utils import sort_subject_ids
+from utils.trial_table_utils import as_trial_table
+from utils.output_utils import write_table
 import matplotlib.pyplot as plt
 import seaborn as sns
 
@@ -22,7 +24,8 @@ def get_ssd(next_valid_trial):
 def compute_violations(subject_id, df, task_name):
     violations_row = []
 
-    df = filter_to_test_trials(df, task_name)
+    # A TrialTable shared with get_task_metrics reuses its test-trial view
+    df = as_trial_table(df, task_name).test_trials
 
     for i in range(len(df) - 1): 
         current_trial = df.iloc[i]
@@ -33,9 +36,10 @@ def compute_violations(subject_id, df, task_name):
 
             if next_valid_trial is not None and next_valid_trial['stop_signal_condition'] == 'stop':
                 if check_violation_conditions(current_trial, next_valid_trial):
-                    go_rt = current_trial['rt']
-                    stop_rt = next_valid_trial['rt']
-                    ssd = get_ssd(next_valid_trial)
+                    # float() keeps float64 results when timings are stored as float32
+                    go_rt = float(current_trial['rt'])
+                    stop_rt = float(next_valid_trial['rt'])
+                    ssd = float(get_ssd(next_valid_trial))
                     difference = find_difference(stop_rt, go_rt)
                     if not np.isnan(ssd):
                         violations_row.append({'subject_id': subject_id, 'task_name': task_name, 'ssd': ssd, 'difference': difference, 'violation': go_rt < stop_rt})
@@ -51,27 +55,27 @@ def aggregate_violations(violations_df):
     aggregated_violations_df = sort_subject_ids(aggregated_violations_df)
     return aggregated_violations_df
 
-def create_violations_matrices(aggregated_violations_df, violations_output_path):
+def create_violations_matrices(aggregated_violations_df, violations_output_path, formats=('csv',)):
     for task in aggregated_violations_df['task_name'].unique():
         task_df = aggregated_violations_df[aggregated_violations_df['task_name'] == task]
         
         # 1. Proportion of violations matrix
         prop_matrix = task_df.pivot(index='subject_id', columns='ssd', values='proportion_violation')
-        create_matrix_with_mean(prop_matrix, violations_output_path, f'{task}_proportion_violations_matrix.csv')
+        create_matrix_with_mean(prop_matrix, violations_output_path, f'{task}_proportion_violations_matrix.csv', formats)
         
         # 2. Number of pairs of violations per SSD matrix
         count_matrix = task_df.pivot(index='subject_id', columns='ssd', values='count_pairs')
-        create_matrix_with_mean(count_matrix, violations_output_path, f'{task}_count_violations_matrix.csv')
+        create_matrix_with_mean(count_matrix, violations_output_path, f'{task}_count_violations_matrix.csv', formats)
         
         # 3. Average stop failure RT - go RT for violations matrix
         diff_matrix = task_df.pivot(index='subject_id', columns='ssd', values='difference_mean')
-        create_matrix_with_mean(diff_matrix, violations_output_path, f'{task}_rt_difference_violations_matrix.csv')
+        create_matrix_with_mean(diff_matrix, violations_output_path, f'{task}_rt_difference_violations_matrix.csv', formats)
 
-def create_matrix_with_mean(matrix, output_path, filename):
+def create_matrix_with_mean(matrix, output_path, filename, formats=('csv',)):
     matrix.loc['mean'] = matrix.mean(axis=0)
     matrix.loc[:, 'mean'] = matrix.mean(axis=1)
     matrix.loc['mean', 'mean'] = np.nan
-    matrix.to_csv(output_path / filename)
+    write_table(matrix, output_path / filename, formats, index=True)
 
 def plot_violations(aggregated_violations_df, violations_output_path):
     # Get unique subjects and tasks
@@ -0,0 +1,80 @@
+"""
+Utilities for watching the input tree and reporting which tasks need re-running.
+"""
+import time
+
+from utils.manifest_utils import build_input_manifest, select_processing_rows
+
+
+def manifest_signature(manifest):
+    """
+    Fingerprint every processable file in a manifest.
+
+    Args:
+        manifest (pd.DataFrame): Manifest from build_input_manifest
+
+    Returns:
+        dict: Mapping of path to (size, mtime, task_name)
+    """
+    rows = select_processing_rows(manifest)
+    return dict(zip(rows['path'], zip(rows['size'], rows['mtime'], rows['task_name'])))
+
+
+def affected_tasks(previous, current):
+    """
+    Get the tasks whose files were added, changed or removed between two signatures.
+
+    Args:
+        previous (dict): Signature from manifest_signature
+        current (dict): Signature from manifest_signature
+
+    Returns:
+        set: Task names
+    """
+    tasks = set()
+    for path in previous.keys() | current.keys():
+        before = previous.get(path)
+        after = current.get(path)
+        if before != after:
+            tasks.update(entry[2] for entry in (before, after) if entry is not None)
+    return tasks
+
+
+def poll_input_changes(input_root, is_fmri, interval, max_polls=None, sleep=time.sleep):
+    """
+    Poll the input tree and yield a manifest each time it settles after a change.
+
+    The first yield is the full manifest with affected tasks set to None (every
+    task is written). After that, a change is only reported once the tree looks
+    the same on two consecutive polls, so files still being copied in are not
+    picked up half-written. Only the last applied and last seen signatures are
+    kept, so memory stays bounded however long the process runs.
+
+    Args:
+        input_root (Path): Root of the behavioral data tree
+        is_fmri (bool): Whether to scan the in-scanner session layout
+        interval (float): Seconds to wait between polls
+        max_polls (int | None): Stop after this many polls (None runs forever)
+        sleep (callable): Sleep function, replaceable in tests
+
+    Yields:
+        tuple: (manifest, affected_tasks) where affected_tasks is None on the
+        first yield and a set of task names afterwards
+    """
+    manifest = build_input_manifest(input_root, is_fmri)
+    applied = manifest_signature(manifest)
+    last_seen = applied
+    yield manifest, None
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        sleep(interval)
+        polls += 1
+        manifest = build_input_manifest(input_root, is_fmri)
+        current = manifest_signature(manifest)
+        settled = current == last_seen
+        last_seen = current
+        if not settled or current == applied:
+            continue
+        tasks = affected_tasks(applied, current)
+        applied = current
+        yield manifest, tasks